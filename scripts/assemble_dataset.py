@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+assemble_dataset.py
+Builds a body-shape dataset variant as an index into the source CSVs — no rows are copied
+
+A variant is picked per class:
+ - val/test: drawn only from REAL rows (--val/--test fractions of each class),
+   so evaluation never sees synthetic data
+ - train:    --per-class (or --class-counts) rows per class, aiming for
+             --real-ratio real rows; synthetic rows fill the rest (and fill
+             in completely for classes with no real data left)
+
+Sources are streamed in chunks reading only filename/body_shape. Synthetic
+rows are picked by giving every row a seeded random key and keeping the k
+smallest keys per class, so memory stays O(k + chunk) however large the
+synthetic CSV is. Synthetic rows whose filename is also a real filename are
+skipped (real data has priority, as in combine_real_and_synthetic.py).
+
+Output (datasets/variants/<name>/):
+ - index.npy      structured array (source u1, row i8, split u1, label u1),
+                  sorted by split/source/row; row = 0-based data row in the CSV
+ - manifest.json  sources (path, size, mtime), classes, splits, parameters, counts
+
+Reading a variant streams the sources and keeps the indexed rows:
+    from assemble_dataset import load_variant
+    train = load_variant("datasets/variants/balanced_50", "train")
+
+Examples:
+    python scripts/assemble_dataset.py --name balanced_50 --per-class 300 --real-ratio 0.5
+    python scripts/assemble_dataset.py --name pear_heavy --class-counts "Pear=800,Apple=200" --real-ratio 0.2
+    python scripts/assemble_dataset.py --name balanced_50 --export train --out labels/train_balanced_50.csv
+"""
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from generate_synthetic_body_data import SHAPES
+
+ROOT = Path(__file__).resolve().parent.parent
+REAL_CSV = ROOT / "labels" / "body_shapes_final.csv"
+SYNTHETIC_CSV = ROOT / "labels" / "body_shapes_synthetic_balanced_1100.csv"
+VARIANT_DIR = ROOT / "datasets" / "variants"
+
+SEED = 42
+PER_CLASS = 220
+REAL_RATIO = 0.5
+VAL_FRAC = 0.15
+TEST_FRAC = 0.15
+CHUNK_ROWS = 250_000
+
+SPLITS = ("train", "val", "test")
+INDEX_DTYPE = np.dtype([("source", "u1"), ("row", "i8"), ("split", "u1"), ("label", "u1")])
+
+
+def parse_class_counts(spec):
+    """"Pear=800,Apple=200" -> {"Pear": 800, "Apple": 200}."""
+    counts = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, n = item.rpartition("=")
+        if name not in SHAPES:
+            raise ValueError(f"unknown class {name!r} (expected one of {SHAPES})")
+        counts[name] = int(n)
+    return counts
+
+
+def source_stat(path):
+    st = Path(path).stat()
+    return {"path": str(path), "size": st.st_size, "mtime": st.st_mtime}
+
+
+def split_real(real_csv, val_frac, test_frac, rng):
+    """Per class: (train rows, val rows, test rows) of the real CSV, plus the set of real filenames."""
+    df = pd.read_csv(real_csv, usecols=["filename", "body_shape"])
+    out = {}
+    for shape in SHAPES:
+        rows = rng.permutation(np.flatnonzero((df["body_shape"] == shape).to_numpy()))
+        n_test = int(round(len(rows) * test_frac))
+        n_val = int(round(len(rows) * val_frac))
+        out[shape] = (rows[n_test + n_val:], rows[n_test:n_test + n_val], rows[:n_test])
+    return out, set(df["filename"].astype(str))
+
+
+def sample_synthetic(syn_csv, need, exclude, rng, chunk_rows=CHUNK_ROWS):
+    """
+    Stream syn_csv and pick need[shape] rows per class uniformly at random.
+
+    Each row gets a key from one sequential stream of uniforms (so the pick
+    does not depend on chunk_rows); the k smallest keys per class win.
+    Returns ({shape: sorted rows}, {shape: rows available}).
+    """
+    best = {s: (np.empty(0), np.empty(0, dtype=np.int64)) for s in SHAPES}
+    avail = dict.fromkeys(SHAPES, 0)
+    start = 0
+    for chunk in pd.read_csv(syn_csv, usecols=["filename", "body_shape"], chunksize=chunk_rows):
+        keys = rng.random(len(chunk))
+        rows = np.arange(start, start + len(chunk), dtype=np.int64)
+        start += len(chunk)
+        ok = ~chunk["filename"].astype(str).isin(exclude).to_numpy()
+        labels = chunk["body_shape"].to_numpy()
+        for shape in SHAPES:
+            sel = ok & (labels == shape)
+            avail[shape] += int(sel.sum())
+            k = need.get(shape, 0)
+            if k == 0 or not sel.any():
+                continue
+            kk = np.concatenate([best[shape][0], keys[sel]])
+            rr = np.concatenate([best[shape][1], rows[sel]])
+            if len(kk) > k:
+                keep = np.argpartition(kk, k - 1)[:k]
+                kk, rr = kk[keep], rr[keep]
+            best[shape] = (kk, rr)
+    return {s: np.sort(best[s][1]) for s in SHAPES}, avail
+
+
+def assemble(class_counts, real_ratio=REAL_RATIO, val_frac=VAL_FRAC, test_frac=TEST_FRAC, seed=SEED,
+             real_csv=REAL_CSV, synthetic_csv=SYNTHETIC_CSV, chunk_rows=CHUNK_ROWS):
+    """Pick the variant's rows. Returns (index structured array, per-class count table)."""
+    rng = np.random.default_rng(seed)
+    real, real_names = split_real(real_csv, val_frac, test_frac, rng)
+
+    real_take, need = {}, {}
+    for shape, target in class_counts.items():
+        pool = real[shape][0]
+        n_real = min(len(pool), int(round(target * real_ratio)))
+        real_take[shape] = np.sort(pool[:n_real])   # pool is already shuffled
+        need[shape] = target - n_real
+    syn, syn_avail = sample_synthetic(synthetic_csv, need, real_names, rng, chunk_rows)
+
+    parts, table = [], []
+    for label, shape in enumerate(SHAPES):
+        if shape not in class_counts:
+            continue
+        train_real, val, test = real_take[shape], real[shape][1], real[shape][2]
+        picks = [(0, train_real, 0), (1, syn[shape], 0), (0, np.sort(val), 1), (0, np.sort(test), 2)]
+        for source, rows, split in picks:
+            block = np.zeros(len(rows), dtype=INDEX_DTYPE)
+            block["source"], block["row"], block["split"], block["label"] = source, rows, split, label
+            parts.append(block)
+        table.append({
+            "body_shape": shape, "target": class_counts[shape],
+            "train_real": len(train_real), "train_synthetic": len(syn[shape]),
+            "val": len(val), "test": len(test),
+            "short": max(0, need[shape] - syn_avail[shape]),
+        })
+    index = np.concatenate(parts) if parts else np.zeros(0, dtype=INDEX_DTYPE)
+    index = index[np.lexsort((index["row"], index["source"], index["split"]))]
+    return index, table
+
+
+def write_variant(out_dir, index, table, sources, params):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "index.npy", index)
+    manifest = {
+        "sources": [source_stat(p) for p in sources],
+        "classes": SHAPES,
+        "splits": list(SPLITS),
+        "params": params,
+        "counts": table,
+        "rows": int(len(index)),
+    }
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+def load_variant(variant_dir, split="train", chunk_rows=CHUNK_ROWS, check=True):
+    """Materialize one split of a variant as a DataFrame (rows in index order), streaming the sources."""
+    variant_dir = Path(variant_dir)
+    manifest = json.loads((variant_dir / "manifest.json").read_text(encoding="utf-8"))
+    index = np.load(variant_dir / "index.npy")
+    index = index[index["split"] == SPLITS.index(split)]
+
+    frames = []
+    for source, meta in enumerate(manifest["sources"]):
+        if check and source_stat(meta["path"])["size"] != meta["size"]:
+            raise ValueError(f"{meta['path']} changed since the variant was built; rebuild it")
+        rows = index["row"][index["source"] == source]
+        if len(rows) == 0:
+            continue
+        start = 0
+        for chunk in pd.read_csv(meta["path"], chunksize=chunk_rows):
+            lo, hi = np.searchsorted(rows, [start, start + len(chunk)])
+            if hi > lo:
+                picked = chunk.iloc[rows[lo:hi] - start].copy()
+                picked.insert(0, "source", "real" if source == 0 else "synthetic")
+                frames.append(picked)
+            start += len(chunk)
+            if hi == len(rows):
+                break
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Assemble a stratified real/synthetic dataset variant (index only).")
+    ap.add_argument("--name", required=True, help=f"variant name → {VARIANT_DIR.relative_to(ROOT)}/<name>/")
+    ap.add_argument("--per-class", type=int, default=PER_CLASS, help="train rows per class")
+    ap.add_argument("--class-counts", default=None, help='per-class train counts, e.g. "Pear=800,Apple=200"')
+    ap.add_argument("--real-ratio", type=float, default=REAL_RATIO, help="target share of real rows in train")
+    ap.add_argument("--val", type=float, default=VAL_FRAC, help="share of each class's real rows held out for val")
+    ap.add_argument("--test", type=float, default=TEST_FRAC, help="share of each class's real rows held out for test")
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--real", type=Path, default=REAL_CSV)
+    ap.add_argument("--synthetic", type=Path, default=SYNTHETIC_CSV)
+    ap.add_argument("--export", choices=SPLITS, default=None, help="write one split of an existing variant as CSV")
+    ap.add_argument("--out", type=Path, default=None, help="CSV path for --export")
+    args = ap.parse_args()
+
+    out_dir = VARIANT_DIR / args.name
+    if args.export:
+        out = args.out or out_dir / f"{args.export}.csv"
+        df = load_variant(out_dir, args.export)
+        df.to_csv(out, index=False)
+        print(f"Exported {len(df)} {args.export} rows → {out}")
+        return
+
+    if not 0 <= args.val + args.test < 1:
+        ap.error("--val + --test must be in [0, 1)")
+    counts = parse_class_counts(args.class_counts) if args.class_counts else dict.fromkeys(SHAPES, args.per_class)
+    params = {"class_counts": counts, "real_ratio": args.real_ratio, "val": args.val, "test": args.test,
+              "seed": args.seed}
+
+    index, table = assemble(counts, args.real_ratio, args.val, args.test, args.seed, args.real, args.synthetic)
+    write_variant(out_dir, index, table, [args.real, args.synthetic], params)
+
+    print(pd.DataFrame(table).to_string(index=False))
+    for row in table:
+        if row["short"]:
+            print(f"WARNING: {row['body_shape']} is {row['short']} rows short of its target (not enough synthetic rows)")
+    print(f"\nSaved variant ({len(index)} index rows, {(out_dir / 'index.npy').stat().st_size} bytes) → {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,31 @@
 """
 auto_label_body_shape.py — GOLD STANDARD CLASSIFIER
 Uses torso-height normalized landmarks → real ratios
+
+Works on any landmark CSV in the body_landmarks_torso_normalized.csv layout,
+e.g. the synthetic skeletons from generate_synthetic_skeletons.py:
+    python scripts/auto_label_body_shape.py --landmarks processed/landmarks-synthetic/body_landmarks_synthetic.csv \
+        --out labels/body_shapes_synthetic_skeletons.csv
+
+Per-row lines are printed with --verbose only; --metrics/--profile as in instrumentation.py.
 """
+import argparse
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from collections import Counter
 
+from instrumentation import Telemetry, add_arguments
+from landmark_store import LH, LS, RH, RS, frame_to_tensor
+
 ROOT = Path(__file__).resolve().parent.parent
 CSV = ROOT / "processed" / "landmarks" / "body_landmarks_torso_normalized.csv"
 OUT_DIR = ROOT / "labels"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 OUT_FILE = OUT_DIR / "body_shapes_final.csv"
 
-def dist(p1, p2):
-    return np.hypot(p1[0] - p2[0], p1[1] - p2[1])
-
-def get_pt(row, idx):
-    return (row[f'x_{idx}'], row[f'y_{idx}'])
+# waist sampled at 40%, 50%, 60% down the torso
+WAIST_FRACTIONS = (0.4, 0.5, 0.6)
 
 def classify(SHR, WHR, bust_hip_diff=0.05):
     if abs(SHR - 1.0) <= 0.10 and WHR <= 0.78:
@@ -34,57 +41,87 @@ def classify(SHR, WHR, bust_hip_diff=0.05):
         return "Apple"  # formerly "Oval"
     return "Rectangle"
 
-df = pd.read_csv(CSV)
-print(f"Processing {len(df)} torso-normalized images...")
+def body_ratios(lm):
+    """
+    Shoulder/hip/waist widths and SHR/WHR for (N, 33, >=2) landmarks, all rows at once.
 
-results = []
-for _, row in df.iterrows():
-    try:
-        ls = get_pt(row, 11); rs = get_pt(row, 12)
-        lh = get_pt(row, 23); rh = get_pt(row, 24)
+    Returns a dict of (N,) arrays: shoulder_width, hip_width, waist_width, SHR, WHR.
+    """
+    lm = np.asarray(lm, dtype=np.float64)
+    ls, rs = lm[:, LS, :2], lm[:, RS, :2]
+    lh, rh = lm[:, LH, :2], lm[:, RH, :2]
 
-        shoulder_w = dist(ls, rs)
-        hip_w = dist(lh, rh)
+    shoulder_w = np.hypot(*(ls - rs).T)
+    hip_w = np.hypot(*(lh - rh).T)
 
-        # Waist: average width at 40%, 50%, 60% down torso
-        waist_ws = []
-        for t in [0.4, 0.5, 0.6]:
-            wx_l = (1-t)*ls[0] + t*lh[0]
-            wx_r = (1-t)*rs[0] + t*rh[0]
-            wy_l = (1-t)*ls[1] + t*lh[1]
-            wy_r = (1-t)*rs[1] + t*rh[1]
-            waist_ws.append(dist((wx_l, wy_l), (wx_r, wy_r)))
-        waist_w = np.mean(waist_ws)
+    # Waist: average width at 40%, 50%, 60% down torso
+    t = np.asarray(WAIST_FRACTIONS)[None, :, None]
+    waist_l = (1 - t) * ls[:, None, :] + t * lh[:, None, :]
+    waist_r = (1 - t) * rs[:, None, :] + t * rh[:, None, :]
+    d = waist_l - waist_r
+    waist_w = np.hypot(d[..., 0], d[..., 1]).mean(axis=1)
 
+    with np.errstate(divide="ignore", invalid="ignore"):
         SHR = shoulder_w / hip_w
         WHR = waist_w / hip_w
+    return {"shoulder_width": shoulder_w, "hip_width": hip_w, "waist_width": waist_w, "SHR": SHR, "WHR": WHR}
 
-        shape = classify(SHR, WHR)
+def label_frame(df):
+    """Classify every row of a flat landmark DataFrame; rows with unusable ratios are dropped."""
+    r = body_ratios(frame_to_tensor(df))
+    ok = np.isfinite(r["SHR"]) & np.isfinite(r["WHR"])
 
+    results = []
+    for i in np.flatnonzero(ok):
+        SHR, WHR = r["SHR"][i], r["WHR"][i]
+        shape = classify(SHR, WHR)
         results.append({
-            "filename": row["filename"],
+            "filename": df["filename"].iloc[i],
             "body_shape": shape,
-            "shoulder_width": round(shoulder_w, 4),
-            "hip_width": round(hip_w, 4),
-            "waist_width": round(waist_w, 4),
+            "shoulder_width": round(r["shoulder_width"][i], 4),
+            "hip_width": round(r["hip_width"][i], 4),
+            "waist_width": round(r["waist_width"][i], 4),
             "SHR": round(SHR, 4),
             "WHR": round(WHR, 4),
             "shape_reason": f"SHR={SHR:.3f}, WHR={WHR:.3f}"
         })
-        print(f"{row['filename']:50} → {shape:18} SHR={SHR:.3f} WHR={WHR:.3f}")
-    except:
-        continue
-
-pd.DataFrame(results).to_csv(OUT_FILE, index=False)
-
-counts = Counter(r["body_shape"] for r in results)
-total = len(results)
-print("\n" + "="*80)
-print("FINAL BODY SHAPE DISTRIBUTION (TORSO-HEIGHT NORMALIZED)")
-print("="*80)
-for name in ["Hourglass", "Rectangle", "Pear", "Inverted Triangle", "Apple"]:
-    c = counts.get(name, 0)
-    p = c/total*100 if total else 0
-    bar = "█" * int(p//2)
-    print(f"{name:18} → {c:4} ({p:5.1f}%) {bar}")
-print(f"\nSaved {total} clean labels → {OUT_FILE}")
\ No newline at end of file
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Label body shapes from torso-normalized landmarks.")
+    ap.add_argument("--landmarks", type=Path, default=CSV)
+    ap.add_argument("--out", type=Path, default=OUT_FILE)
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    with Telemetry.from_args(args, "body_labels") as tel:
+        with tel.time("read"):
+            df = pd.read_csv(args.landmarks)
+        print(f"Processing {len(df)} torso-normalized images...")
+        tel.total = len(df)
+
+        with tel.time("classify"):
+            results = label_frame(df)
+        tel.advance(len(results))
+        tel.count("dropped", len(df) - len(results))
+        for r in results:
+            tel.log(f"{r['filename']:50} → {r['body_shape']:18} SHR={r['SHR']:.3f} WHR={r['WHR']:.3f}")
+
+        with tel.time("write"):
+            args.out.parent.mkdir(parents=True, exist_ok=True)
+            pd.DataFrame(results).to_csv(args.out, index=False)
+
+    counts = Counter(r["body_shape"] for r in results)
+    total = len(results)
+    print("\n" + "="*80)
+    print("FINAL BODY SHAPE DISTRIBUTION (TORSO-HEIGHT NORMALIZED)")
+    print("="*80)
+    for name in ["Hourglass", "Rectangle", "Pear", "Inverted Triangle", "Apple"]:
+        c = counts.get(name, 0)
+        p = c/total*100 if total else 0
+        bar = "█" * int(p//2)
+        print(f"{name:18} → {c:4} ({p:5.1f}%) {bar}")
+    print(f"\nSaved {total} clean labels → {args.out}")
+
+if __name__ == "__main__":
+    main()
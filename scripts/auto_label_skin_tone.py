@@ -2,86 +2,326 @@
 """
 auto_label_skin_tone.py
 
-Auto-suggest skin tone labels using k-means clustering on mean LAB color of processed/skin-patches/
+Auto-suggest skin tone labels using k-means clustering on LAB color of processed/skin-patches/
+
+Features are computed in batches (see skin_features.py): patches are stacked
+into one array, converted to LAB in one call and summarized over skin pixels
+only (--stat median|trimmed|mean, --no-skin-mask for the old whole-patch mean).
+The feature settings are stored in skin-tone-clusters.json so --predict uses
+the same ones.
+
+Modes:
+ - default:      full KMeans with K clusters on the whole set
+ - --minibatch:  MiniBatchKMeans fitted with partial_fit over chunks (large corpora)
+ - --k-range:    sweep a range of K in parallel processes, report inertia/silhouette
+                 and keep the best K (highest silhouette)
+ - --predict:    no refit; assign patches not yet in the CSV to the centroids stored
+                 in skin-tone-clusters.json and append them (existing labels stay put)
 
 Outputs:
  - labels/skin-tone-auto_suggest.csv
  - labels/skin-tone-clusters.json  (centroids + mapping)
+
+Examples:
+    python scripts/auto_label_skin_tone.py
+    python scripts/auto_label_skin_tone.py --minibatch --k-range 3 8 --workers 4
+    python scripts/auto_label_skin_tone.py --predict
+    python scripts/extract_skin_patches.py --emit-paths | python scripts/auto_label_skin_tone.py --predict --stdin
 """
-import cv2
+import argparse
 import numpy as np
 import pandas as pd
 import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+from skin_features import STATS, lab_features, load_patch_batch
 
 ROOT = Path(__file__).resolve().parent.parent
 SKIN_DIR = ROOT / "processed" / "skin-patches"
 OUT_DIR = ROOT / "labels"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_CSV = OUT_DIR / "skin-tone-auto_suggest.csv"
 OUT_JSON = OUT_DIR / "skin-tone-clusters.json"
 
 # number of clusters (adjustable)
 K = 5
 
+# mini-batch settings (used with --minibatch)
+BATCH_SIZE = 4096
+MINIBATCH_EPOCHS = 5
+
+# silhouette is O(N^2); score on a random subsample for large sets
+SILHOUETTE_SAMPLE = 10000
+
+RANDOM_STATE = 42
+
 # human-readable labels ordered from darkest -> lightest
 DEFAULT_LABELS_BY_BRIGHTNESS = ["dark", "brown", "wheatish", "fair", "very_fair"]
 
-# gather mean LAB colors
-rows = []
-for p in sorted(SKIN_DIR.glob("*")):
-    if p.suffix.lower() not in [".jpg", ".jpeg", ".png"]:
-        continue
-    img = cv2.imread(str(p))
-    if img is None:
-        print(f"[WARN] cannot read {p.name}")
-        continue
-    # ensure 3 channels
-    if len(img.shape) == 2:
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    # convert to LAB
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    mean = lab.reshape(-1, 3).mean(axis=0)  # L,a,b
-    rows.append({"filename": p.name, "L": float(mean[0]), "a": float(mean[1]), "b": float(mean[2])})
-
-if len(rows) == 0:
-    raise SystemExit("[ERR] No skin patch images found in processed/skin-patches/")
-
-df = pd.DataFrame(rows)
-
-# clustering on L,a,b
-X = df[["L", "a", "b"]].values
-kmeans = KMeans(n_clusters=K, random_state=42, n_init=10).fit(X)
-df["cluster_id"] = kmeans.labels_
-
-# compute cluster centroids and sort by L (brightness)
-centroids = kmeans.cluster_centers_
-centroid_df = pd.DataFrame(centroids, columns=["L","a","b"])
-centroid_df["cluster_id"] = centroid_df.index
-centroid_df = centroid_df.sort_values("L").reset_index(drop=True)
-
-# map sorted cluster order to labels_by_brightness
-if len(DEFAULT_LABELS_BY_BRIGHTNESS) >= K:
-    labels_map = {int(row["cluster_id"]): DEFAULT_LABELS_BY_BRIGHTNESS[i] for i, row in centroid_df.iterrows()}
-else:
-    # fallback: generate generic names
-    labels_map = {int(row["cluster_id"]): f"cluster_{i}" for i, row in centroid_df.iterrows()}
-
-# now assign suggested labels according to mapping
-df["suggested_label"] = df["cluster_id"].map(labels_map)
-
-# write CSV and cluster JSON for inspection
-df.to_csv(OUT_CSV, index=False)
-
-meta = {
-    "k": K,
-    "labels_map": labels_map,
-    "centroids_sorted_by_L": centroid_df.to_dict(orient="records")
-}
-with open(OUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(meta, f, indent=2)
-
-print(f"[OK] Wrote auto suggestions: {OUT_CSV}")
-print(f"[OK] Wrote cluster metadata: {OUT_JSON}")
-print("Review suggested labels and edit CSV before using for training.")
+# patch features: statistic over skin-masked LAB pixels, patches decoded per batch
+FEATURE_STAT = "median"
+FEATURE_BATCH = 256
+
+# predict mode: patches per nearest-centroid batch / CSV append
+PREDICT_BATCH = 1024
+
+CSV_COLUMNS = ["filename", "L", "a", "b", "cluster_id", "suggested_label"]
+
+
+def iter_patch_paths():
+    """Patch image paths in SKIN_DIR, sorted by name."""
+    for p in sorted(SKIN_DIR.glob("*")):
+        if p.suffix.lower() in [".jpg", ".jpeg", ".png"]:
+            yield p
+
+
+def collect_lab_features(paths=None, stat=FEATURE_STAT, use_skin_mask=True, batch_size=FEATURE_BATCH):
+    """Return a DataFrame of filename + L,a,b for the given patches (default: all of SKIN_DIR)."""
+    paths = list(iter_patch_paths() if paths is None else map(Path, paths))
+    names, feats = [], []
+    for start in range(0, len(paths), batch_size):
+        batch, kept = load_patch_batch(paths[start:start + batch_size])
+        feats.append(lab_features(batch, stat=stat, use_skin_mask=use_skin_mask))
+        names.extend(p.name for p in kept)
+    X = np.concatenate(feats) if feats else np.empty((0, 3))
+    return pd.DataFrame({"filename": names, "L": X[:, 0], "a": X[:, 1], "b": X[:, 2]})
+
+
+def fit_clusters(X, k, minibatch=False, batch_size=BATCH_SIZE, random_state=RANDOM_STATE):
+    """Fit k clusters on X. Returns (centroids, labels)."""
+    if not minibatch:
+        kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=10).fit(X)
+        return kmeans.cluster_centers_, kmeans.labels_
+
+    # partial_fit over shuffled chunks: only one chunk is touched per step,
+    # so this also works when X is streamed from disk
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=batch_size, n_init=3)
+    rng = np.random.default_rng(random_state)
+    chunk = max(batch_size, k)
+    for _ in range(MINIBATCH_EPOCHS):
+        order = rng.permutation(len(X))
+        for start in range(0, len(X), chunk):
+            idx = order[start:start + chunk]
+            if len(idx) < k:
+                continue
+            kmeans.partial_fit(X[idx])
+    return kmeans.cluster_centers_, kmeans.predict(X)
+
+
+def inertia(X, centroids, labels):
+    """Sum of squared distances of samples to their assigned centroid."""
+    return float(((X - centroids[labels]) ** 2).sum())
+
+
+def score_k(X, k, minibatch=False, batch_size=BATCH_SIZE, sample_size=SILHOUETTE_SAMPLE):
+    """Fit one K and return its inertia/silhouette. Runs inside a worker process."""
+    centroids, labels = fit_clusters(X, k, minibatch=minibatch, batch_size=batch_size)
+    n_labels = len(np.unique(labels))
+    if 1 < n_labels < len(X):
+        sil = float(silhouette_score(
+            X, labels,
+            sample_size=min(sample_size, len(X)),
+            random_state=RANDOM_STATE,
+        ))
+    else:
+        sil = float("nan")
+    return {"k": int(k), "inertia": inertia(X, centroids, labels), "silhouette": sil}
+
+
+def sweep_k(X, k_values, minibatch=False, batch_size=BATCH_SIZE, workers=None):
+    """Score every K in k_values in parallel processes; returns results sorted by K."""
+    k_values = [k for k in k_values if 1 < k < len(X)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(score_k, X, k, minibatch, batch_size) for k in k_values]
+        results = [f.result() for f in futures]
+    return sorted(results, key=lambda r: r["k"])
+
+
+def best_k(results):
+    """Pick the K with the highest silhouette (ties -> smaller K)."""
+    scored = [r for r in results if not np.isnan(r["silhouette"])]
+    if not scored:
+        raise SystemExit("[ERR] K sweep produced no valid silhouette scores")
+    return max(scored, key=lambda r: (r["silhouette"], -r["k"]))["k"]
+
+
+def brightness_label_map(centroids):
+    """Sort centroids by L and map them to DEFAULT_LABELS_BY_BRIGHTNESS (darkest -> lightest)."""
+    k = len(centroids)
+    centroid_df = pd.DataFrame(centroids, columns=["L", "a", "b"])
+    centroid_df["cluster_id"] = centroid_df.index
+    centroid_df = centroid_df.sort_values("L").reset_index(drop=True)
+
+    # map sorted cluster order to labels_by_brightness
+    if len(DEFAULT_LABELS_BY_BRIGHTNESS) >= k:
+        labels_map = {int(row["cluster_id"]): DEFAULT_LABELS_BY_BRIGHTNESS[i] for i, row in centroid_df.iterrows()}
+    else:
+        # fallback: generate generic names
+        labels_map = {int(row["cluster_id"]): f"cluster_{i}" for i, row in centroid_df.iterrows()}
+    return centroid_df, labels_map
+
+
+def load_centroids(path=OUT_JSON):
+    """Read skin-tone-clusters.json back. Returns (centroids (K,3), cluster_ids, labels, features)."""
+    if not path.exists():
+        raise SystemExit(f"[ERR] {path} not found. Run a full clustering pass first.")
+    meta = json.loads(path.read_text(encoding="utf-8"))
+    records = meta["centroids_sorted_by_L"]
+    centroids = np.array([[r["L"], r["a"], r["b"]] for r in records], dtype=np.float64)
+    cluster_ids = np.array([int(r["cluster_id"]) for r in records])
+    labels_map = {int(cid): name for cid, name in meta["labels_map"].items()}
+    labels = [labels_map[int(cid)] for cid in cluster_ids]
+    # files written before feature settings were recorded used the unmasked mean
+    features = meta.get("features", {"stat": "mean", "skin_mask": False})
+    return centroids, cluster_ids, labels, features
+
+
+def nearest_centroid(X, centroids, batch_size=PREDICT_BATCH):
+    """Index of the nearest centroid for every row of X, computed in batches."""
+    X = np.asarray(X, dtype=np.float64)
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(X), dtype=np.int64)
+    for start in range(0, len(X), batch_size):
+        xb = X[start:start + batch_size]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2 ; |x|^2 is constant per row
+        d = c_sq[None, :] - 2.0 * xb @ centroids.T
+        out[start:start + batch_size] = d.argmin(axis=1)
+    return out
+
+
+def predict_batch(paths, centroids, cluster_ids, labels, features):
+    """Featurize a batch of patch paths and assign them to the stored centroids."""
+    df = collect_lab_features(paths, stat=features["stat"], use_skin_mask=features["skin_mask"])
+    if len(df) == 0:
+        return df
+    idx = nearest_centroid(df[["L", "a", "b"]].values, centroids)
+    df["cluster_id"] = cluster_ids[idx]
+    df["suggested_label"] = [labels[i] for i in idx]
+    return df[CSV_COLUMNS]
+
+
+def append_rows(df):
+    """Append rows to OUT_CSV, writing the header only when the file is new."""
+    if len(df) == 0:
+        return
+    write_header = not OUT_CSV.exists() or OUT_CSV.stat().st_size == 0
+    df.to_csv(OUT_CSV, mode="a", header=write_header, index=False)
+
+
+def iter_stdin_paths():
+    """Patch paths streamed one per line (e.g. from extract_skin_patches.py --emit-paths)."""
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            p = Path(line)
+            yield p if p.is_absolute() else SKIN_DIR / p
+
+
+def run_predict(from_stdin=False, batch_size=PREDICT_BATCH):
+    """Label only patches missing from OUT_CSV; cost is O(new patches)."""
+    centroids, cluster_ids, labels, features = load_centroids()
+
+    known = set()
+    if OUT_CSV.exists() and OUT_CSV.stat().st_size > 0:
+        known = set(pd.read_csv(OUT_CSV, usecols=["filename"], dtype=str)["filename"])
+
+    source = iter_stdin_paths() if from_stdin else iter_patch_paths()
+    added = 0
+    batch = []
+    for p in source:
+        if p.name in known:
+            continue
+        known.add(p.name)
+        batch.append(p)
+        if len(batch) >= batch_size:
+            df = predict_batch(batch, centroids, cluster_ids, labels, features)
+            append_rows(df)
+            added += len(df)
+            batch = []
+    if batch:
+        df = predict_batch(batch, centroids, cluster_ids, labels, features)
+        append_rows(df)
+        added += len(df)
+
+    print(f"[OK] Labeled {added} new patches with stored centroids → {OUT_CSV}")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Auto-suggest skin tone labels by clustering LAB color.")
+    ap.add_argument("--k", type=int, default=K, help=f"number of clusters (default {K})")
+    ap.add_argument("--k-range", type=int, nargs=2, metavar=("MIN", "MAX"),
+                    help="sweep K in [MIN, MAX] and keep the best silhouette")
+    ap.add_argument("--minibatch", action="store_true", help="use MiniBatchKMeans partial_fit")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--workers", type=int, default=None, help="processes for the K sweep")
+    ap.add_argument("--stat", choices=STATS, default=FEATURE_STAT,
+                    help=f"per-patch statistic over skin pixels (default {FEATURE_STAT})")
+    ap.add_argument("--no-skin-mask", action="store_true",
+                    help="average every pixel instead of skin-colored pixels only")
+    ap.add_argument("--predict", action="store_true",
+                    help="assign new patches to the stored centroids instead of refitting")
+    ap.add_argument("--stdin", action="store_true",
+                    help="with --predict: read patch paths from stdin as they are produced")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    if args.predict:
+        run_predict(from_stdin=args.stdin, batch_size=PREDICT_BATCH)
+        return
+
+    df = collect_lab_features(stat=args.stat, use_skin_mask=not args.no_skin_mask)
+    if len(df) == 0:
+        raise SystemExit("[ERR] No skin patch images found in processed/skin-patches/")
+
+    # clustering on L,a,b
+    X = df[["L", "a", "b"]].values
+
+    k = args.k
+    sweep = None
+    if args.k_range:
+        k_min, k_max = sorted(args.k_range)
+        sweep = sweep_k(X, range(k_min, k_max + 1), args.minibatch, args.batch_size, args.workers)
+        print("\n  K   inertia        silhouette")
+        for r in sweep:
+            print(f"{r['k']:3}   {r['inertia']:12.1f}   {r['silhouette']:.4f}")
+        k = best_k(sweep)
+        print(f"[OK] Best K by silhouette: {k}\n")
+
+    centroids, cluster_ids = fit_clusters(X, k, minibatch=args.minibatch, batch_size=args.batch_size)
+    df["cluster_id"] = cluster_ids
+
+    # compute cluster centroids and sort by L (brightness)
+    centroid_df, labels_map = brightness_label_map(centroids)
+
+    # now assign suggested labels according to mapping
+    df["suggested_label"] = df["cluster_id"].map(labels_map)
+
+    # write CSV and cluster JSON for inspection
+    df.to_csv(OUT_CSV, index=False)
+
+    meta = {
+        "k": k,
+        "algorithm": "minibatch_kmeans" if args.minibatch else "kmeans",
+        "features": {"stat": args.stat, "skin_mask": not args.no_skin_mask},
+        "labels_map": labels_map,
+        "centroids_sorted_by_L": centroid_df.to_dict(orient="records")
+    }
+    if sweep is not None:
+        meta["k_sweep"] = sweep
+    with open(OUT_JSON, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"[OK] Wrote auto suggestions: {OUT_CSV}")
+    print(f"[OK] Wrote cluster metadata: {OUT_JSON}")
+    print("Review suggested labels and edit CSV before using for training.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+Offline throughput benchmarks for every pipeline stage
+
+Everything runs against a deterministic synthetic corpus, so results are
+comparable across machines/commits and no network or real data is needed:
+ - corpus:  solid / noise / rendered-figure JPEGs at several resolutions,
+            plus 128x128 skin-tone patches (same seed → same bytes)
+ - server:  a local HTTP server serving the corpus, with a fake Pexels-style
+            search API at /v1/search (used by the scraper benchmarks)
+
+Benchmarks (each timed --repeat times; throughput uses the median):
+    decode        cv2.imread of every corpus image
+    decode_half   same with IMREAD_REDUCED_COLOR_2
+    haar          extract_skin_patches.extract_patch_from_body (face/upper-body cascades)
+    crop_cached   extract_skin_patches --crop-only per image: hash, detection_cache
+                  lookup, decode, crop, resize (compare with decode + haar)
+    pose          MediaPipe Pose as configured in extract_landmarks.py (skipped if unavailable)
+    api_single    stylemate_api.Analyzer.analyze, one image per call (p50/p99 ms per call)
+    api_batch     same, API_BATCH images per call (p50/p99 ms per call)
+    lab           skin_features.lab_features on patch batches
+    npz           build_skin_npz decode + build_npz into a temp file
+    label_skin    auto_label_skin_tone.fit_clusters + nearest_centroid
+    label_knn     skin_knn.KnnIndex.predict against half the rows as labeled neighbors
+    label_body    auto_label_body_shape.label_frame on tiled real landmarks
+    search_api    scrape_pexels.safe_get against the fake search API
+    download      scrape_pexels.download of every corpus image from the local server
+
+Output is JSON (--out, default stdout) with environment info and per-benchmark
+items/s; a summary table goes to stderr. With --baseline, every benchmark
+present in both runs is compared and flagged as a regression when throughput
+drops by more than its threshold (--threshold, per benchmark with
+--threshold-for NAME=FRAC); any regression makes the exit code 1.
+
+Examples:
+    python scripts/benchmark.py --out bench.json
+    python scripts/benchmark.py --only decode lab npz --baseline bench.json
+    python scripts/benchmark.py --corpus-dir /tmp/stylemate-corpus --per-kind 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SEED = 0
+KINDS = ("solid", "noise", "figure")
+RESOLUTIONS = [(360, 540), (720, 1080), (1440, 2160)]   # (w, h), portrait like the raw photos
+PER_KIND = 2
+N_PATCHES = 256
+PATCH_SIZE = 128
+JPEG_QUALITY = 90
+
+REPEAT = 3
+THRESHOLD = 0.10
+# network and model stages are noisier
+DEFAULT_THRESHOLDS = {"pose": 0.20, "api_single": 0.20, "api_batch": 0.20, "search_api": 0.25, "download": 0.25}
+
+LABEL_ROWS = 20_000
+BODY_ROWS = 20_000
+SEARCH_CALLS = 50
+POSE_COMPLEXITY = 2
+API_BATCH = 8
+
+# BGR skin tones for rendered figures and patches, light to deep
+SKIN_TONES = [(196, 214, 241), (160, 190, 225), (120, 160, 205), (80, 120, 170), (50, 80, 120), (35, 55, 85)]
+
+
+# ---------------------------------------------------
+# Corpus
+# ---------------------------------------------------
+
+def render_figure(w, h, rng):
+    """A flat-shaded standing figure (head, torso, arms, legs) on a plain background."""
+    img = np.empty((h, w, 3), dtype=np.uint8)
+    img[:] = rng.integers(150, 256, 3)
+    skin = SKIN_TONES[int(rng.integers(len(SKIN_TONES)))]
+    cloth = tuple(int(c) for c in rng.integers(0, 200, 3))
+    u = h / 8.5                                   # head-height unit
+    cx = w / 2 + rng.normal(0, w * 0.03)
+    sh, hip = rng.uniform(0.8, 1.15) * u, rng.uniform(0.7, 1.15) * u
+    ys, yh, yf = 1.9 * u, 4.3 * u, 8.0 * u
+
+    def pt(x, y):
+        return int(round(x)), int(round(y))
+
+    cv2.ellipse(img, pt(cx, 1.0 * u), (int(0.38 * u), int(0.5 * u)), 0, 0, 360, skin, -1)
+    cv2.line(img, pt(cx, 1.4 * u), pt(cx, ys), skin, max(1, int(0.3 * u)))
+    torso = np.array([pt(cx - sh, ys), pt(cx + sh, ys), pt(cx + hip, yh), pt(cx - hip, yh)], dtype=np.int32)
+    cv2.fillConvexPoly(img, torso, cloth)
+    for side in (-1, 1):
+        hand = pt(cx + side * (sh + rng.uniform(0.1, 0.6) * u), rng.uniform(4.0, 4.6) * u)
+        cv2.line(img, pt(cx + side * sh, ys), hand, skin, max(1, int(0.28 * u)))
+        foot = pt(cx + side * rng.uniform(0.3, 0.8) * u, yf)
+        cv2.line(img, pt(cx + side * hip * 0.6, yh), foot, cloth, max(1, int(0.4 * u)))
+    noise = rng.normal(0, 4, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+
+def render(kind, w, h, rng):
+    if kind == "solid":
+        img = np.empty((h, w, 3), dtype=np.uint8)
+        img[:] = rng.integers(0, 256, 3)
+        return img
+    if kind == "noise":
+        return rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    return render_figure(w, h, rng)
+
+
+def render_patch(rng, size=PATCH_SIZE):
+    tone = np.asarray(SKIN_TONES[int(rng.integers(len(SKIN_TONES)))], dtype=np.float32)
+    img = tone + rng.normal(0, 6, (size, size, 3)) + rng.normal(0, 8, 3)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def make_corpus(out_dir, per_kind=PER_KIND, resolutions=RESOLUTIONS, n_patches=N_PATCHES, seed=SEED):
+    """Write the corpus (reused if out_dir already holds the same spec). Returns its manifest."""
+    out_dir = Path(out_dir)
+    spec = {"seed": seed, "per_kind": per_kind, "resolutions": [list(r) for r in resolutions],
+            "kinds": list(KINDS), "n_patches": n_patches, "jpeg_quality": JPEG_QUALITY}
+    manifest_path = out_dir / "manifest.json"
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest["spec"] == spec:
+            return manifest
+
+    (out_dir / "images").mkdir(parents=True, exist_ok=True)
+    (out_dir / "patches").mkdir(parents=True, exist_ok=True)
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+    images = []
+    for k, kind in enumerate(KINDS):
+        for r, (w, h) in enumerate(resolutions):
+            for i in range(per_kind):
+                rng = np.random.default_rng(np.random.SeedSequence([seed, k, r, i]))
+                name = f"{kind}_{w}x{h}_{i:03d}.jpg"
+                cv2.imwrite(str(out_dir / "images" / name), render(kind, w, h, rng), params)
+                images.append({"name": name, "kind": kind, "size": [w, h]})
+    patches = []
+    for i in range(n_patches):
+        rng = np.random.default_rng(np.random.SeedSequence([seed, 99, i]))
+        name = f"patch_{i:05d}.jpg"
+        cv2.imwrite(str(out_dir / "patches" / name), render_patch(rng), params)
+        patches.append(name)
+
+    manifest = {"spec": spec, "images": images, "patches": patches}
+    manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+# ---------------------------------------------------
+# Local image server + fake search API
+# ---------------------------------------------------
+
+class CorpusHandler(SimpleHTTPRequestHandler):
+    """Serves corpus files; /v1/search answers like the Pexels search endpoint."""
+
+    corpus = None   # manifest, set by serve_corpus
+    base_url = ""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/v1/search":
+            return super().do_GET()
+        q = parse_qs(url.query)
+        page = int(q.get("page", ["1"])[0])
+        per_page = int(q.get("per_page", ["20"])[0])
+        images = self.corpus["images"]
+        chunk = images[(page - 1) * per_page: page * per_page]
+        body = json.dumps({
+            "page": page,
+            "per_page": per_page,
+            "photos": [
+                {"id": (page - 1) * per_page + i, "photographer": "synthetic",
+                 "url": f"{self.base_url}/images/{img['name']}",
+                 "src": {"original": f"{self.base_url}/images/{img['name']}"}}
+                for i, img in enumerate(chunk)
+            ],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_corpus(corpus_dir, manifest):
+    """Run the corpus server on a free localhost port; yields its base URL."""
+    handler = type("Handler", (CorpusHandler,), {"corpus": manifest})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=str(corpus_dir)))
+    handler.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield handler.base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# ---------------------------------------------------
+# Benchmarks: each returns (work, info); work() is what gets timed
+# ---------------------------------------------------
+
+class Context:
+    def __init__(self, corpus_dir, manifest, tmp_dir, base_url=None, pose_complexity=POSE_COMPLEXITY):
+        self.dir = Path(corpus_dir)
+        self.manifest = manifest
+        self.tmp = Path(tmp_dir)
+        self.base_url = base_url
+        self.pose_complexity = pose_complexity
+        self.image_paths = [self.dir / "images" / m["name"] for m in manifest["images"]]
+        self.patch_paths = [self.dir / "patches" / n for n in manifest["patches"]]
+        self._decoded = None
+
+    def decoded(self):
+        if self._decoded is None:
+            self._decoded = [cv2.imread(str(p)) for p in self.image_paths]
+        return self._decoded
+
+    def corpus_bytes(self, paths):
+        return sum(p.stat().st_size for p in paths)
+
+
+class Skip(Exception):
+    """Benchmark cannot run here (missing model/dependency)."""
+
+
+def bench_decode(ctx):
+    paths = ctx.image_paths
+
+    def work():
+        for p in paths:
+            cv2.imread(str(p))
+    return work, {"items": len(paths), "bytes": ctx.corpus_bytes(paths)}
+
+
+def bench_decode_half(ctx):
+    paths = ctx.image_paths
+
+    def work():
+        for p in paths:
+            cv2.imread(str(p), cv2.IMREAD_REDUCED_COLOR_2)
+    return work, {"items": len(paths), "bytes": ctx.corpus_bytes(paths)}
+
+
+def bench_haar(ctx):
+    with contextlib.redirect_stdout(io.StringIO()):
+        from extract_skin_patches import extract_patch_from_body, get_cascades
+    get_cascades()     # loads the cascades outside the timed region
+    images = ctx.decoded()
+
+    def work():
+        for img in images:
+            extract_patch_from_body(img)
+    return work, {"items": len(images)}
+
+
+def bench_crop_cached(ctx):
+    with contextlib.redirect_stdout(io.StringIO()):
+        from detection_cache import DetectionCache
+        from extract_skin_patches import DETECTOR_KEY, crop_region, detect_region, normalize_patch
+        from inventory import sha256_file
+    cache = DetectionCache(DETECTOR_KEY, ctx.tmp / "detections.sqlite")
+    paths = ctx.image_paths
+    for p, img in zip(paths, ctx.decoded()):      # fill the cache outside the timed region
+        cache.put(sha256_file(p), detect_region(img))
+    cache.flush()
+
+    def work():
+        for p in paths:
+            detection = cache.get(sha256_file(p))
+            normalize_patch(crop_region(cv2.imread(str(p)), detection))
+    return work, {"items": len(paths), "bytes": ctx.corpus_bytes(paths)}
+
+
+def bench_pose(ctx):
+    try:
+        import mediapipe as mp
+        pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=ctx.pose_complexity,
+                                      min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        rgb = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in ctx.decoded()]
+        pose.process(rgb[0])   # loads the model outside the timed region
+    except Exception as e:
+        raise Skip(f"{type(e).__name__}: {e}")
+
+    def work():
+        for img in rgb:
+            pose.process(img)
+    return work, {"items": len(rgb), "model_complexity": ctx.pose_complexity}
+
+
+def _analyzer(ctx):
+    try:
+        from stylemate_api import Analyzer
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyzer = Analyzer(model_complexity=ctx.pose_complexity).warm()
+            analyzer.analyze(ctx.decoded()[:1])   # first call outside the timed region
+    except Exception as e:
+        raise Skip(f"{type(e).__name__}: {e}")
+    return analyzer
+
+
+def bench_api_single(ctx):
+    analyzer = _analyzer(ctx)
+    images = ctx.decoded()
+    latencies = []
+
+    def work():
+        for img in images:
+            t = time.perf_counter()
+            analyzer.analyze([img])
+            latencies.append(time.perf_counter() - t)
+    return work, {"items": len(images), "latencies": latencies}
+
+
+def bench_api_batch(ctx):
+    analyzer = _analyzer(ctx)
+    images = ctx.decoded()
+    batches = [images[i:i + API_BATCH] for i in range(0, len(images), API_BATCH)]
+    latencies = []
+
+    def work():
+        for batch in batches:
+            t = time.perf_counter()
+            analyzer.analyze(batch)
+            latencies.append(time.perf_counter() - t)
+    return work, {"items": len(images), "batch": API_BATCH, "latencies": latencies}
+
+
+def bench_lab(ctx):
+    from skin_features import lab_features, load_patch_batch
+    paths = ctx.patch_paths
+
+    def work():
+        for i in range(0, len(paths), 64):
+            batch, _ = load_patch_batch(paths[i:i + 64])
+            lab_features(batch)
+    return work, {"items": len(paths)}
+
+
+def bench_npz(ctx):
+    from build_skin_npz import DEFAULT_WORKERS, build_npz, iter_patch_images
+    paths = ctx.patch_paths
+    out = ctx.tmp / "bench_patches.npz"
+
+    def work():
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_npz(iter_patch_images(paths, DEFAULT_WORKERS), {}, out_file=out)
+    return work, {"items": len(paths), "workers": DEFAULT_WORKERS}
+
+
+def bench_label_skin(ctx):
+    from auto_label_skin_tone import K, fit_clusters, nearest_centroid
+    from skin_features import lab_features, load_patch_batch
+    batch, _ = load_patch_batch(ctx.patch_paths)
+    X = lab_features(batch)
+    rng = np.random.default_rng(SEED)
+    X = np.tile(X, (int(np.ceil(LABEL_ROWS / len(X))), 1))[:LABEL_ROWS]
+    X = X + rng.normal(0, 1.0, X.shape)
+
+    def work():
+        centroids, _ = fit_clusters(X, K)
+        nearest_centroid(X, centroids)
+    return work, {"items": len(X), "k": K}
+
+
+def bench_label_knn(ctx):
+    from skin_features import lab_features, load_patch_batch
+    from skin_knn import KnnIndex
+    batch, _ = load_patch_batch(ctx.patch_paths)
+    X = lab_features(batch)
+    rng = np.random.default_rng(SEED)
+    X = np.tile(X, (int(np.ceil(LABEL_ROWS / len(X))), 1))[:LABEL_ROWS]
+    X = X + rng.normal(0, 1.0, X.shape)
+    labeled, query = X[::2], X[1::2]
+    labels = [f"tone_{int(v) // 32}" for v in labeled[:, 0]]
+    index = KnnIndex().fit(labeled, labels, np.arange(len(labeled)).astype(str))
+
+    def work():
+        index.predict(query)
+    return work, {"items": len(query), "labeled": len(labeled), "k": index.k}
+
+
+def bench_label_body(ctx):
+    import pandas as pd
+    from auto_label_body_shape import label_frame
+    from landmark_store import LANDMARK_CSV
+    if not LANDMARK_CSV.exists():
+        raise Skip(f"{LANDMARK_CSV.relative_to(ROOT)} not found")
+    real = pd.read_csv(LANDMARK_CSV)
+    df = pd.concat([real] * int(np.ceil(BODY_ROWS / len(real))), ignore_index=True).iloc[:BODY_ROWS]
+
+    def work():
+        label_frame(df)
+    return work, {"items": len(df)}
+
+
+def _scraper():
+    with contextlib.redirect_stdout(io.StringIO()):
+        import scrape_pexels
+    return scrape_pexels
+
+
+def bench_search_api(ctx):
+    scrape_pexels = _scraper()
+    url = f"{ctx.base_url}/v1/search"
+
+    def work():
+        for page in range(1, SEARCH_CALLS + 1):
+            scrape_pexels.safe_get(url, {"query": "benchmark", "page": page % 3 + 1, "per_page": 20})
+    return work, {"items": SEARCH_CALLS}
+
+
+def bench_download(ctx):
+    scrape_pexels = _scraper()
+    dest = ctx.tmp / "downloads"
+    dest.mkdir(exist_ok=True)
+    items = [(f"{ctx.base_url}/images/{p.name}", dest / p.name) for p in ctx.image_paths]
+
+    def work():
+        for url, path in items:
+            if not scrape_pexels.download(url, path):
+                raise RuntimeError(f"download failed: {url}")
+    return work, {"items": len(items), "bytes": ctx.corpus_bytes(ctx.image_paths)}
+
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "decode_half": bench_decode_half,
+    "haar": bench_haar,
+    "crop_cached": bench_crop_cached,
+    "pose": bench_pose,
+    "api_single": bench_api_single,
+    "api_batch": bench_api_batch,
+    "lab": bench_lab,
+    "npz": bench_npz,
+    "label_skin": bench_label_skin,
+    "label_knn": bench_label_knn,
+    "label_body": bench_label_body,
+    "search_api": bench_search_api,
+    "download": bench_download,
+}
+
+
+def time_work(work, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmark(name, ctx, repeat=REPEAT):
+    try:
+        work, info = BENCHMARKS[name](ctx)
+    except Skip as e:
+        return {"skipped": str(e)}
+    latencies = info.pop("latencies", None)
+    times = time_work(work, repeat)
+    median = statistics.median(times)
+    result = dict(info)
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99])
+        result.update({"calls": len(latencies), "p50_ms": round(p50 * 1000, 3), "p99_ms": round(p99 * 1000, 3)})
+    result.update({
+        "repeat": repeat,
+        "seconds_median": round(median, 6),
+        "seconds_best": round(min(times), 6),
+        "items_per_s": round(info["items"] / median, 3) if median > 0 else None,
+    })
+    if "bytes" in info and median > 0:
+        result["mb_per_s"] = round(info["bytes"] / median / 1e6, 3)
+    return result
+
+
+# ---------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------
+
+def compare(results, baseline, threshold=THRESHOLD, overrides=None):
+    """Per-benchmark change in items/s vs baseline; status is ok / improved / regression."""
+    limits = dict(DEFAULT_THRESHOLDS)
+    limits.update(overrides or {})
+    out = {}
+    for name, cur in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not cur.get("items_per_s") or not base.get("items_per_s"):
+            continue
+        change = cur["items_per_s"] / base["items_per_s"] - 1.0
+        limit = limits.get(name, threshold)
+        status = "regression" if change < -limit else "improved" if change > limit else "ok"
+        out[name] = {"baseline": base["items_per_s"], "current": cur["items_per_s"],
+                     "change": round(change, 4), "threshold": limit, "status": status}
+    return out
+
+
+def environment():
+    import pandas as pd
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pandas": pd.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def print_summary(report, file=sys.stderr):
+    comparison = report.get("comparison", {})
+    print(f"{'benchmark':12} {'items':>7} {'items/s':>12} {'MB/s':>9}  vs baseline", file=file)
+    for name, r in report["results"].items():
+        if "skipped" in r:
+            print(f"{name:12} skipped: {r['skipped']}", file=file)
+            continue
+        c = comparison.get(name)
+        vs = f"{c['change'] * 100:+6.1f}% {c['status']}" if c else ""
+        mb = f"{r['mb_per_s']:9.1f}" if "mb_per_s" in r else " " * 9
+        lat = f"  p50 {r['p50_ms']:.1f} ms, p99 {r['p99_ms']:.1f} ms" if "p50_ms" in r else ""
+        print(f"{name:12} {r['items']:7} {r['items_per_s']:12.1f} {mb}  {vs}{lat}", file=file)
+
+
+def parse_threshold_overrides(items):
+    out = {}
+    for item in items:
+        name, _, frac = item.partition("=")
+        if name not in BENCHMARKS:
+            raise ValueError(f"unknown benchmark {name!r}")
+        out[name] = float(frac)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline throughput benchmarks on a synthetic corpus.")
+    ap.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None)
+    ap.add_argument("--repeat", type=int, default=REPEAT)
+    ap.add_argument("--per-kind", type=int, default=PER_KIND, help="images per kind per resolution")
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--corpus-dir", type=Path, default=None, help="keep/reuse the corpus here (default: temp)")
+    ap.add_argument("--pose-complexity", type=int, choices=[0, 1, 2], default=POSE_COMPLEXITY)
+    ap.add_argument("--out", default="-", help="JSON results path (default: stdout)")
+    ap.add_argument("--baseline", type=Path, default=None, help="earlier JSON results to compare against")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed throughput drop (fraction)")
+    ap.add_argument("--threshold-for", nargs="+", default=[], metavar="NAME=FRAC")
+    args = ap.parse_args()
+    try:
+        overrides = parse_threshold_overrides(args.threshold_for)
+    except ValueError as e:
+        ap.error(str(e))
+
+    names = args.only or list(BENCHMARKS)
+    with tempfile.TemporaryDirectory(prefix="stylemate-bench-") as tmp:
+        corpus_dir = args.corpus_dir or Path(tmp) / "corpus"
+        manifest = make_corpus(corpus_dir, per_kind=args.per_kind, seed=args.seed)
+        with serve_corpus(corpus_dir, manifest) as base_url:
+            ctx = Context(corpus_dir, manifest, tmp, base_url, args.pose_complexity)
+            results = {}
+            for name in names:
+                print(f"[bench] {name} ...", file=sys.stderr)
+                results[name] = run_benchmark(name, ctx, args.repeat)
+        if args.corpus_dir is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {"environment": environment(), "corpus": manifest["spec"], "results": results}
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        report["baseline"] = str(args.baseline)
+        report["comparison"] = compare(results, baseline, args.threshold, overrides)
+
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print_summary(report)
+
+    regressions = [n for n, c in report.get("comparison", {}).items() if c["status"] == "regression"]
+    if regressions:
+        print(f"\nREGRESSION: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
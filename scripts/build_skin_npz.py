@@ -6,57 +6,243 @@ Creates datasets/skin_patches.npz:
  - X: (N,64,64,3) float32 normalized 0..1
  - y: list of labels (strings) or ints if you map them
 
+With --format memmap it instead streams patches into a preallocated uint8
+memmap (see skin_dataset.py), keeping memory flat during the build:
+ - datasets/skin_patches_u8.npy          (N,64,64,3) uint8 RGB
+ - datasets/skin_patches_labels.npy
+ - datasets/skin_patches_filenames.npy
+Normalization to 0..1 happens lazily when the dataset is read.
+
+With --format shards it writes fixed-size shards + index.json (see shards.py)
+to datasets/skin_shards/, for loaders that stream batches instead of
+holding the whole set in RAM.
+
+With --from-pyramid the patches are read from the uint8 arrays written by
+extract_skin_patches.py --pyramid (64x64 level) instead of decoding JPEGs.
+
+Patches are decoded on a thread pool (--workers, OpenCV releases the GIL)
+and JPEGs use OpenCV's reduced-resolution decode when the patch size allows
+it (128x128 patches decode straight at 64x64). Rows are always written in
+sorted filename order regardless of the worker count.
+
 Requires: pip install numpy opencv-python pandas
 """
+import argparse
 import cv2
+import os
 import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from shards import SHARD_SIZE, ShardWriter
+from skin_dataset import (
+    MEMMAP_PREFIX, PYRAMID_SIZES, create_pixel_memmap, load_pyramid, memmap_paths, truncate_npy, write_sidecars
+)
+
 ROOT = Path(__file__).resolve().parent.parent
 SKIN_DIR = ROOT / "processed" / "skin-patches"
 LABEL_FILE = ROOT / "labels" / "skin-tone-labels.csv"
 OUT_DIR = ROOT / "datasets"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_FILE = OUT_DIR / "skin_patches.npz"
+SHARD_DIR = OUT_DIR / "skin_shards"
 
 IMG_SIZE = (64,64)
 
-# Read labels CSV into dict
-label_map = {}
-if LABEL_FILE.exists():
-    df = pd.read_csv(LABEL_FILE, dtype=str)
-    if "filename" in df.columns and "skin_tone" in df.columns:
-        label_map = dict(zip(df["filename"].astype(str), df["skin_tone"].astype(str)))
-    else:
-        print("[WARN] skin label CSV columns not found. Expected 'filename','skin_tone'")
+# size written by extract_skin_patches.py (normalize_patch)
+SOURCE_SIZE = (128, 128)
+
+# JPEG scale-on-decode flags, largest reduction first
+REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+# largest reduction that still decodes at or above IMG_SIZE
+JPEG_READ_FLAG = next(
+    (flag for f, flag in REDUCED_FLAGS
+     if SOURCE_SIZE[0] // f >= IMG_SIZE[0] and SOURCE_SIZE[1] // f >= IMG_SIZE[1]),
+    cv2.IMREAD_COLOR,
+)
+
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# flush the memmap to disk every this many rows
+FLUSH_EVERY = 4096
+
 
-X_list = []
-y_list = []
-filenames = []
+def load_label_map():
+    """Read labels CSV into dict"""
+    label_map = {}
+    if LABEL_FILE.exists():
+        df = pd.read_csv(LABEL_FILE, dtype=str)
+        if "filename" in df.columns and "skin_tone" in df.columns:
+            label_map = dict(zip(df["filename"].astype(str), df["skin_tone"].astype(str)))
+        else:
+            print("[WARN] skin label CSV columns not found. Expected 'filename','skin_tone'")
+    return label_map
 
-for img_path in sorted(SKIN_DIR.glob("*")):
-    if img_path.suffix.lower() not in [".jpg",".jpeg",".png"]:
-        continue
-    img = cv2.imread(str(img_path))
+
+def list_patches():
+    return [p for p in sorted(SKIN_DIR.glob("*")) if p.suffix.lower() in [".jpg",".jpeg",".png"]]
+
+
+def decode_patch(img_path):
+    """Read one patch as (64,64,3) uint8 RGB, or None if unreadable."""
+    img = None
+    if JPEG_READ_FLAG != cv2.IMREAD_COLOR and img_path.suffix.lower() in [".jpg", ".jpeg"]:
+        img = cv2.imread(str(img_path), JPEG_READ_FLAG)
+        # patch smaller than SOURCE_SIZE: decode at full size instead
+        if img is not None and (img.shape[1] < IMG_SIZE[0] or img.shape[0] < IMG_SIZE[1]):
+            img = None
+    if img is None:
+        img = cv2.imread(str(img_path))
     if img is None:
         print(f"[WARN] Cannot read {img_path.name}")
-        continue
+        return None
     # ensure 3 channels
     if len(img.shape) == 2:
         img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    img = cv2.resize(img, IMG_SIZE, interpolation=cv2.INTER_AREA)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # keep RGB
-    img = img.astype("float32") / 255.0
-    label = label_map.get(img_path.name, "")
-    X_list.append(img)
-    y_list.append(label)
-    filenames.append(img_path.name)
-
-if len(X_list) == 0:
-    print("[ERROR] No skin patch images found. Exiting.")
-else:
+    if img.shape[1::-1] != IMG_SIZE:
+        img = cv2.resize(img, IMG_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # keep RGB
+
+
+def iter_decoded(paths, workers=DEFAULT_WORKERS):
+    """
+    Yield (path, image) in the order of paths, decoding on a thread pool.
+
+    At most workers * 4 decodes are in flight, so memory stays bounded no
+    matter how far the pool runs ahead of the consumer.
+    """
+    if workers <= 1:
+        for p in paths:
+            yield p, decode_patch(p)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for p in paths:
+            pending.append((p, ex.submit(decode_patch, p)))
+            if len(pending) >= workers * 4:
+                head, fut = pending.popleft()
+                yield head, fut.result()
+        while pending:
+            head, fut = pending.popleft()
+            yield head, fut.result()
+
+
+def iter_pyramid():
+    """Yield (filename, image) from the IMG_SIZE pyramid level; no decoding."""
+    if IMG_SIZE[0] != IMG_SIZE[1] or IMG_SIZE[0] not in PYRAMID_SIZES:
+        raise SystemExit(f"[ERROR] No {IMG_SIZE} level in the patch pyramid {PYRAMID_SIZES}")
+    pixels, names = load_pyramid(IMG_SIZE[0])
+    order = np.argsort(names, kind="stable")  # same sorted order as the JPEG path
+    for i in order:
+        yield str(names[i]), pixels[i]
+
+
+def iter_patch_images(paths, workers=DEFAULT_WORKERS):
+    """Yield (filename, image or None) decoded from patch files."""
+    for img_path, img in iter_decoded(paths, workers):
+        yield img_path.name, img
+
+
+def build_npz(items, label_map, out_file=OUT_FILE):
+    X_list = []
+    y_list = []
+    filenames = []
+
+    for name, img in items:
+        if img is None:
+            continue
+        X_list.append(img.astype("float32") / 255.0)
+        y_list.append(label_map.get(name, ""))
+        filenames.append(name)
+
+    if len(X_list) == 0:
+        print("[ERROR] No skin patch images found. Exiting.")
+        return
     X = np.stack(X_list, axis=0)
     y = np.array(y_list, dtype=object)
-    np.savez_compressed(OUT_FILE, X=X, y=y, filenames=np.array(filenames))
-    print(f"[OK] Saved {OUT_FILE} with {X.shape[0]} samples.")
+    np.savez_compressed(out_file, X=X, y=y, filenames=np.array(filenames))
+    print(f"[OK] Saved {out_file} with {X.shape[0]} samples.")
+
+
+def build_memmap(items, n_max, label_map, prefix=MEMMAP_PREFIX):
+    """Stream patches into a preallocated uint8 memmap; only in-flight patches are held in memory."""
+    if n_max == 0:
+        print("[ERROR] No skin patch images found. Exiting.")
+        return
+    pixels_path = memmap_paths(prefix)[0]
+    X = create_pixel_memmap(pixels_path, n_max, IMG_SIZE)
+
+    y_list = []
+    filenames = []
+    n = 0
+    for name, img in items:
+        if img is None:
+            continue
+        X[n] = img
+        y_list.append(label_map.get(name, ""))
+        filenames.append(name)
+        n += 1
+        if n % FLUSH_EVERY == 0:
+            X.flush()
+    X.flush()
+    del X
+
+    # drop the rows reserved for unreadable files
+    truncate_npy(pixels_path, n)
+    write_sidecars(prefix, y_list, filenames)
+    print(f"[OK] Saved {pixels_path} with {n} samples (uint8 memmap).")
+
+
+def build_shards(items, label_map, out_dir=SHARD_DIR, shard_size=SHARD_SIZE):
+    """Write uint8 RGB patches, labels and source filenames as fixed-size shards."""
+    meta = {"source": str(SKIN_DIR), "image_size": list(IMG_SIZE), "color": "RGB"}
+    with ShardWriter(out_dir, shard_size=shard_size, meta=meta) as writer:
+        for name, img in items:
+            if img is None:
+                continue
+            writer.add({"images": img, "labels": label_map.get(name, ""), "ids": name})
+    if writer.total == 0:
+        print("[ERROR] No skin patch images found. Exiting.")
+        return
+    print(f"[OK] Saved {len(writer.shards)} shards ({writer.total} samples) → {out_dir}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pack processed/skin-patches into a training array.")
+    ap.add_argument("--format", choices=["npz", "memmap", "shards"], default="npz",
+                    help="npz: float32 savez_compressed (default); memmap: uint8 .npy + sidecars; "
+                         "shards: fixed-size shards + index.json")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    ap.add_argument("--from-pyramid", action="store_true",
+                    help="read patches from processed/skin-patch-arrays/ instead of decoding JPEGs")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                    help=f"decode threads (default {DEFAULT_WORKERS}; 1 = serial)")
+    args = ap.parse_args()
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    label_map = load_label_map()
+
+    if args.from_pyramid:
+        n_max = len(load_pyramid(IMG_SIZE[0])[1])
+        items = iter_pyramid()
+    else:
+        paths = list_patches()
+        n_max = len(paths)
+        items = iter_patch_images(paths, args.workers)
+
+    if args.format == "memmap":
+        build_memmap(items, n_max, label_map)
+    elif args.format == "shards":
+        build_shards(items, label_map, shard_size=args.shard_size)
+    else:
+        build_npz(items, label_map)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,36 @@
 combine_real_and_synthetic.py
 Merges real (biased) dataset + the balanced synthetic one
 → Produces the final clean, balanced training CSV
+
+The merge streams, so the synthetic side can be far larger than RAM:
+ 1. partition: both CSVs are read in chunks; every row gets its global input
+    order (real rows first) and goes to one of --partitions files chosen by a
+    hash of its filename, so all copies of a filename land in one partition
+ 2. dedupe:    each partition is deduplicated on its own, keeping the row
+               that came first (real data has priority)
+ 3. shuffle:   survivors are scattered into position buckets of the final
+               shuffled order, then each bucket is sorted and appended
+
+The shuffle is the same permutation DataFrame.sample(frac=1, random_state=42)
+draws, so the output is identical to the old in-memory concat/dedupe/sample.
+Row data never has to fit in memory at once; the only whole-dataset arrays are
+a few integers per row (input order -> output position).
+
+Options:
+    --shards   also write the final dataset as fixed-size shards + index.json
+               (datasets/body_shape_shards/, see shards.py)
 """
 
+import argparse
+import numpy as np
 import pandas as pd
+import pickle
+import tempfile
+from collections import Counter
 from pathlib import Path
 
+from shards import SHARD_SIZE, write_csv_shards
+
 # ------------------------------------------------------------------
 # Update these paths if folder structure is different
 # ------------------------------------------------------------------
@@ -16,57 +41,174 @@ ROOT = Path(__file__).resolve().parent.parent
 REAL_CSV      = ROOT / "labels" / "body_shapes_final.csv"                    # your 250 real rows
 SYNTHETIC_CSV = ROOT / "labels" / "body_shapes_synthetic_balanced_1100.csv"  # from previous script
 OUTPUT_CSV    = ROOT / "labels" / "FINAL_TRAINING_DATASET_v1.csv"            # ← final file
+SHARD_DIR     = ROOT / "datasets" / "body_shape_shards"
 
-# ------------------------------------------------------------------
-# Load
-# ------------------------------------------------------------------
-if not REAL_CSV.exists():
-    print(f"ERROR: Real dataset not found → {REAL_CSV}")
-    exit(1)
-if not SYNTHETIC_CSV.exists():
-    print(f"ERROR: Synthetic dataset not found → {SYNTHETIC_CSV}")
-    print("   Run generate_synthetic_body_data.py first!")
-    exit(1)
-
-print("Loading real dataset...")
-real_df = pd.read_csv(REAL_CSV)
-print(f"   → {len(real_df)} real samples (mostly Inverted Triangle)")
-
-print("Loading synthetic balanced dataset...")
-syn_df = pd.read_csv(SYNTHETIC_CSV)
-print(f"   → {len(syn_df)} synthetic samples")
+FEATURE_COLUMNS = ["shoulder_width", "hip_width", "waist_width", "SHR", "WHR"]
 
-# ------------------------------------------------------------------
-# Combine (real data has priority if filename collision)
-# ------------------------------------------------------------------
-combined = pd.concat([real_df, syn_df], ignore_index=True)
+SEED = 42
+CHUNK_ROWS = 250_000
+PARTITIONS = 64
 
-print(f"Before deduplication: {len(combined)} rows")
-combined.drop_duplicates(subset="filename", keep="first", inplace=True)
-print(f"After deduplication : {len(combined)} rows")
+SEQ_COL = "__seq"   # global input order (real rows first)
+POS_COL = "__pos"   # position in the shuffled output
 
-# ------------------------------------------------------------------
-# Final shuffle (important for training)
-# ------------------------------------------------------------------
-combined = combined.sample(frac=1, random_state=42).reset_index(drop=True)
 
-# ------------------------------------------------------------------
-# Save
-# ------------------------------------------------------------------
-OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
-combined.to_csv(OUTPUT_CSV, index=False)
-print(f"\nFINAL DATASET SAVED → {OUTPUT_CSV}")
-print(f"Total samples: {len(combined)}")
+def _append_frame(df, path):
+    # scratch files are a sequence of pickled frames: appending is cheap and dtypes survive
+    with open(path, "ab") as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-# ------------------------------------------------------------------
-# Show final class distribution (should be nicely balanced now)
-# ------------------------------------------------------------------
-print("\n" + "="*60)
-print("FINAL CLASS DISTRIBUTION")
-print("="*60)
-dist = combined["body_shape"].value_counts().sort_index()
-for shape, count in dist.items():
-    perc = count / len(combined) * 100
-    bar = "█" * int(perc // 2)
-    print(f"{shape:18} → {count:4} ({perc:5.1f}%) {bar}")
-print("="*60)
\ No newline at end of file
+
+def _read_frames(path):
+    frames = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                frames.append(pickle.load(f))
+            except EOFError:
+                break
+    return pd.concat(frames, ignore_index=True)
+
+
+def partition_inputs(sources, part_dir, n_parts=PARTITIONS, chunk_rows=CHUNK_ROWS):
+    """
+    Pass 1: stream every source CSV into n_parts files, partitioned by a hash of filename.
+
+    Returns (columns, rows per source).
+    """
+    columns = []
+    for path in sources:
+        columns += [c for c in pd.read_csv(path, nrows=0).columns if c not in columns]
+
+    seq, counts = 0, []
+    for path in sources:
+        n = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            chunk = chunk.reindex(columns=columns)
+            chunk.insert(0, SEQ_COL, np.arange(seq, seq + len(chunk), dtype=np.int64))
+            seq += len(chunk)
+            n += len(chunk)
+            part = pd.util.hash_pandas_object(chunk["filename"].astype(str), index=False).to_numpy() % n_parts
+            for p in np.unique(part):
+                _append_frame(chunk[part == p], Path(part_dir) / f"part-{p:03d}.pkl")
+        counts.append(n)
+    return columns, counts
+
+
+def dedupe_partitions(part_dir, total):
+    """Pass 2: boolean mask over input order, True for the first row of every filename."""
+    kept = np.zeros(total, dtype=bool)
+    for path in sorted(Path(part_dir).glob("part-*.pkl")):
+        df = _read_frames(path)[[SEQ_COL, "filename"]]
+        # rows were appended in input order, so "first" = lowest input position
+        first = df.drop_duplicates(subset="filename", keep="first")
+        kept[first[SEQ_COL].to_numpy(dtype=np.int64)] = True
+    return kept
+
+
+def shuffle_positions(kept, seed=SEED):
+    """Output position of every input row (-1 = dropped), matching DataFrame.sample(frac=1, random_state=seed)."""
+    n = int(kept.sum())
+    order = np.random.RandomState(seed).choice(n, size=n, replace=False)  # what sample() draws
+    pos_of_rank = np.empty(n, dtype=np.int64)
+    pos_of_rank[order] = np.arange(n, dtype=np.int64)
+    pos = np.full(len(kept), -1, dtype=np.int64)
+    pos[kept] = pos_of_rank
+    return pos
+
+
+def scatter_to_buckets(part_dir, bucket_dir, pos, bucket_rows=CHUNK_ROWS):
+    """Pass 3: move the surviving rows of every partition to the bucket of their output position."""
+    for path in sorted(Path(part_dir).glob("part-*.pkl")):
+        df = _read_frames(path)
+        p = pos[df[SEQ_COL].to_numpy(dtype=np.int64)]
+        df = df[p >= 0].drop(columns=SEQ_COL)
+        p = p[p >= 0]
+        df.insert(0, POS_COL, p)
+        bucket = p // bucket_rows
+        for b in np.unique(bucket):
+            _append_frame(df[bucket == b], Path(bucket_dir) / f"bucket-{b:06d}.pkl")
+        path.unlink()
+
+
+def gather_buckets(bucket_dir, out_csv, columns):
+    """Pass 4: sort each bucket by output position and append it to out_csv. Returns class counts."""
+    counts = Counter()
+    out_csv = Path(out_csv)
+    pd.DataFrame(columns=columns).to_csv(out_csv, index=False)
+    for path in sorted(Path(bucket_dir).glob("bucket-*.pkl")):
+        df = _read_frames(path)
+        df = df.iloc[np.argsort(df[POS_COL].to_numpy(dtype=np.int64), kind="stable")]
+        df.drop(columns=POS_COL).to_csv(out_csv, mode="a", header=False, index=False)
+        counts.update(df["body_shape"].tolist())
+    return counts
+
+
+def merge(sources, out_csv, seed=SEED, chunk_rows=CHUNK_ROWS, n_parts=PARTITIONS, tmp_dir=None):
+    """Streaming concat + dedupe(filename, keep first) + shuffle. Returns (rows in, rows out, class counts)."""
+    with tempfile.TemporaryDirectory(prefix="combine-", dir=tmp_dir) as tmp:
+        part_dir, bucket_dir = Path(tmp) / "parts", Path(tmp) / "buckets"
+        part_dir.mkdir()
+        bucket_dir.mkdir()
+        columns, counts = partition_inputs(sources, part_dir, n_parts, chunk_rows)
+        kept = dedupe_partitions(part_dir, sum(counts))
+        scatter_to_buckets(part_dir, bucket_dir, shuffle_positions(kept, seed), chunk_rows)
+        dist = gather_buckets(bucket_dir, out_csv, columns)
+    return counts, int(kept.sum()), dist
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge real + synthetic body-shape CSVs.")
+    ap.add_argument("--shards", action="store_true",
+                    help=f"also write {SHARD_DIR.relative_to(ROOT)}/ shards from the final CSV")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    ap.add_argument("--seed", type=int, default=SEED, help="shuffle seed")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows read/written per step")
+    ap.add_argument("--partitions", type=int, default=PARTITIONS, help="filename hash partitions")
+    ap.add_argument("--tmp-dir", type=Path, default=None, help="scratch space (default: system temp)")
+    args = ap.parse_args()
+
+    # ------------------------------------------------------------------
+    # Load
+    # ------------------------------------------------------------------
+    if not REAL_CSV.exists():
+        print(f"ERROR: Real dataset not found → {REAL_CSV}")
+        exit(1)
+    if not SYNTHETIC_CSV.exists():
+        print(f"ERROR: Synthetic dataset not found → {SYNTHETIC_CSV}")
+        print("   Run generate_synthetic_body_data.py first!")
+        exit(1)
+
+    print("Merging real + synthetic (real data has priority if filename collision)...")
+    OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
+    (n_real, n_syn), total, dist = merge([REAL_CSV, SYNTHETIC_CSV], OUTPUT_CSV, seed=args.seed,
+                                         chunk_rows=args.chunk_rows, n_parts=args.partitions,
+                                         tmp_dir=args.tmp_dir)
+    print(f"   → {n_real} real samples (mostly Inverted Triangle)")
+    print(f"   → {n_syn} synthetic samples")
+    print(f"Before deduplication: {n_real + n_syn} rows")
+    print(f"After deduplication : {total} rows")
+
+    print(f"\nFINAL DATASET SAVED → {OUTPUT_CSV}")
+    print(f"Total samples: {total}")
+
+    if args.shards:
+        n = write_csv_shards(OUTPUT_CSV, SHARD_DIR, FEATURE_COLUMNS, "body_shape", "filename",
+                             shard_size=args.shard_size)
+        print(f"SHARDS SAVED → {SHARD_DIR} ({n} rows)")
+
+    # ------------------------------------------------------------------
+    # Show final class distribution (should be nicely balanced now)
+    # ------------------------------------------------------------------
+    print("\n" + "="*60)
+    print("FINAL CLASS DISTRIBUTION")
+    print("="*60)
+    for shape, count in sorted(dist.items()):
+        perc = count / total * 100
+        bar = "█" * int(perc // 2)
+        print(f"{shape:18} → {count:4} ({perc:5.1f}%) {bar}")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
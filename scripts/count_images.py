@@ -1,21 +1,23 @@
-import os
-from pathlib import Path
+import argparse
+from contextlib import closing
 
-# Root folder
-ROOT = Path(__file__).resolve().parent.parent
-BODY_DIR = ROOT / "raw/body"
-SKIN_DIR = ROOT / "raw/skin"
-
-def count_images(folder: Path):
-    if not folder.exists():
-        return 0
-    # Count common image file extensions
-    extensions = [".jpg", ".jpeg", ".png"]
-    return sum(1 for f in folder.iterdir() if f.suffix.lower() in extensions)
+import inventory
 
 def main():
-    body_count = count_images(BODY_DIR)
-    skin_count = count_images(SKIN_DIR)
+    # Counts come from the inventory index (.pipeline/inventory.sqlite); the quick
+    # refresh only re-lists directories that changed since the last call.
+    ap = argparse.ArgumentParser(description="Dataset image counts from the inventory index.")
+    ap.add_argument("--rescan", action="store_true", help="full re-stat of every file before counting")
+    ap.add_argument("--status", action="store_true", help="also show per-stage status of raw images")
+    args = ap.parse_args()
+
+    with closing(inventory.connect()) as con:
+        inventory.refresh(con, full=args.rescan)
+        counts = inventory.counts(con)
+        status = inventory.status_summary(con) if args.status else {}
+
+    body_count = counts.get("raw_body", (0, 0))[0]
+    skin_count = counts.get("raw_skin", (0, 0))[0]
     total_count = body_count + skin_count
 
     print("="*40)
@@ -25,6 +27,15 @@ def main():
     print(f"Skin images: {skin_count}")
     print(f"Total images: {total_count}")
     print("="*40)
+    if args.status:
+        for kind, label in (("raw_body", "Body"), ("raw_skin", "Skin")):
+            s = status.get(kind)
+            if not s:
+                continue
+            print(f"{label}: landmarks {s['has_landmarks']}, patches {s['has_patch']}, "
+                  f"body labels {s['has_body_label']}, skin labels {s['has_skin_label']}")
+        print(f"Skin patches: {counts.get('skin_patch', (0, 0))[0]}")
+        print("="*40)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+crawl_scheduler.py
+
+One crawler for Pexels, Unsplash and Pinterest, replacing three sequential
+main loops with a scheduler over (source, query, page) work items:
+ - sources run concurrently, each under its own API rate limit (a token
+   bucket per source, requests/hour) and page concurrency, so a crawl takes
+   as long as the slowest quota instead of the sum of all sources
+ - image downloads share one thread pool, an optional global bandwidth cap
+   and a disk budget; when the budget is reached no new downloads start and
+   unfinished pages are left for the next run
+ - one SQLite store (.pipeline/crawl.sqlite) is the checkpoint (pages done,
+   with their result counts) and the dedupe/metadata store (one row per
+   image: source id, file, URL, size, SHA-256, source metadata). An image
+   already fetched under its source id is never downloaded again; one whose
+   content matches an earlier image from any source is deleted and recorded
+   as a duplicate.
+
+The per-source search/download code, query lists and file naming are the
+existing scrapers' (scrape_pexels.py, scrape_unsplash.py, scrape_pinterest.py).
+Their progress JSON files are imported into the checkpoint on the first run.
+
+Options:
+    --sources S ...    pexels unsplash pinterest (default: all)
+    --kinds K ...      body skin (default: both; Pinterest only has body queries)
+    --rate S=N         API requests/hour for source S
+    --concurrency S=N  pages of source S in flight at once
+    --max-pages N      pages per query for the paged sources (Pexels, Unsplash)
+    --bandwidth-mb F   cap on total download rate, MB/s (default: none)
+    --disk-budget-gb F stop downloading once crawled images take F GB
+    --min-free-gb F    stop downloading when the disk has less than F GB free
+    --status           print the checkpoint per source and exit
+    --dry-run          print the work that would be scheduled and exit
+
+Examples:
+    python scripts/crawl_scheduler.py --sources pexels unsplash --kinds skin
+    python scripts/crawl_scheduler.py --disk-budget-gb 20 --bandwidth-mb 5
+    python scripts/crawl_scheduler.py --status
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+from instrumentation import Telemetry, add_arguments
+from inventory import sha256_file
+
+ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT / ".pipeline" / "crawl.sqlite"
+STAGING_DIR = ROOT / ".pipeline" / "crawl-staging"
+OUT_DIRS = {"body": ROOT / "raw" / "body", "skin": ROOT / "raw" / "skin"}
+
+# documented free-tier quotas; Pinterest has none, so stay polite
+SOURCE_LIMITS = {
+    "pexels": {"per_hour": 200, "concurrency": 2},
+    "unsplash": {"per_hour": 50, "concurrency": 1},
+    "pinterest": {"per_hour": 60, "concurrency": 1},
+}
+BURST = 5                  # API requests a source may make back to back
+DOWNLOAD_WORKERS = 8
+MIN_FREE_GB = 1.0
+
+WorkItem = namedtuple("WorkItem", ["source", "query", "page", "kind"])
+Candidate = namedtuple("Candidate", ["item_id", "filename", "url", "meta"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    source   TEXT NOT NULL,
+    query    TEXT NOT NULL,
+    page     INTEGER NOT NULL,
+    kind     TEXT NOT NULL,
+    status   TEXT NOT NULL,
+    results  INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated  TEXT,
+    PRIMARY KEY (source, query, page)
+);
+CREATE TABLE IF NOT EXISTS assets (
+    source       TEXT NOT NULL,
+    item_id      TEXT NOT NULL,
+    filename     TEXT NOT NULL,
+    kind         TEXT NOT NULL,
+    query        TEXT,
+    url          TEXT,
+    bytes        INTEGER,
+    sha256       TEXT,
+    duplicate_of TEXT,
+    meta         TEXT,
+    fetched      TEXT,
+    PRIMARY KEY (source, item_id)
+);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets(sha256);
+"""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. take() waits for a positive balance and may
+    overdraw it, so a cost known only afterwards (bytes downloaded) is paid
+    off by later callers.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate                 # tokens per second
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n=1, stop=None):
+        """Spend n tokens once the balance is positive. False if stop was set while waiting."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens > 0:
+                    self.tokens -= n
+                    return True
+                delay = -self.tokens / self.rate + 1e-3
+            if stop is not None and stop.wait(delay):
+                return False
+            if stop is None:
+                time.sleep(delay)
+
+
+# -----------------------------
+# Sources (wrapping the existing scrapers)
+# -----------------------------
+class PexelsSource:
+    name = "pexels"
+    fetch_uses_api = False
+
+    def __init__(self):
+        import scrape_pexels
+        self.api = scrape_pexels
+        self.max_pages = 5                       # scrape_query() default
+
+    def queries(self, kind):
+        return {"body": self.api.TARGETED_BODY_QUERIES, "skin": self.api.SKIN_QUERIES}[kind]
+
+    def search(self, item):
+        params = {"query": item.query, "page": item.page, "per_page": self.api.DEFAULT_PER_PAGE}
+        if item.kind == "skin":
+            params["orientation"] = "portrait"   # as scrape_skin()
+        photos = self.api.safe_get(self.api.BASE_URL, params).get("photos", [])
+        return [Candidate(str(p["id"]), f"pexels_{p['id']}.jpg", self.api.best_src(p),
+                          {"id": p["id"], "photographer": p.get("photographer"), "page_url": p.get("url")})
+                for p in photos]
+
+    def fetch(self, cand, dest):
+        return cand.url is not None and self.api.download(cand.url, dest)
+
+
+class UnsplashSource:
+    name = "unsplash"
+    fetch_uses_api = True                        # download_location is an API call
+
+    def __init__(self):
+        import scrape_unsplash
+        self.api = scrape_unsplash
+        self.max_pages = scrape_unsplash.MAX_PAGES
+
+    def queries(self, kind):
+        return {"body": self.api.BODY_QUERIES, "skin": self.api.SKIN_QUERIES}[kind]
+
+    def search(self, item):
+        data = self.api.search_unsplash(item.query, item.page)
+        if data is None:
+            raise RuntimeError("Unsplash search failed (key, quota or network)")
+        return [Candidate(img["id"], f"{img['id']}.jpg", None,
+                          {"id": img["id"], "photographer": (img.get("user") or {}).get("name"),
+                           "page_url": (img.get("links") or {}).get("html"), "links": img.get("links")})
+                for img in data.get("results", [])]
+
+    def fetch(self, cand, dest):
+        url = self.api.resolve_download_url(cand.meta)
+        return url is not None and self.api.download_image(url, dest)
+
+
+class PinterestSource:
+    """pinterest_dl searches and downloads in one call: a query is a single page staged, then moved."""
+    name = "pinterest"
+    fetch_uses_api = False
+    max_pages = 1
+
+    def __init__(self):
+        import scrape_pinterest
+        self.api = scrape_pinterest
+        self._dl = None
+
+    def queries(self, kind):
+        return self.api.QUERIES if kind == "body" else []
+
+    def search(self, item):
+        if self._dl is None:
+            from pinterest_dl import PinterestDL
+            self._dl = PinterestDL.with_api(timeout=self.api.TIMEOUT, verbose=self.api.VERBOSE, ensure_alt=True)
+        staging = STAGING_DIR / self.api.progress_key(item.query)
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        self._dl.search_and_download(query=item.query, output_dir=str(staging),
+                                     num=self.api.NUM_IMAGES_PER_QUERY, download_streams=True)
+        return [Candidate(f.stem, f"pin_stand_{f.name}", str(f), {"query": item.query})
+                for f in sorted(staging.iterdir()) if f.is_file()]
+
+    def fetch(self, cand, dest):
+        shutil.move(cand.url, dest)
+        return True
+
+
+SOURCES = {cls.name: cls for cls in (PexelsSource, UnsplashSource, PinterestSource)}
+
+
+# -----------------------------
+# Checkpoint / dedupe store
+# -----------------------------
+def connect(db_path=DB_PATH):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(SCHEMA)
+    return con
+
+
+def import_legacy_progress(con, sources):
+    """Seed an empty checkpoint from the scrapers' progress JSON files (pages done per query)."""
+    if con.execute("SELECT COUNT(*) FROM pages").fetchone()[0]:
+        return 0
+    now = datetime.now().isoformat()
+    rows = []
+    for src in sources.values():
+        if not src.api.PROGRESS_FILE.exists():
+            continue
+        progress = json.loads(src.api.PROGRESS_FILE.read_text(encoding="utf-8"))
+        for kind in OUT_DIRS:
+            for query in src.queries(kind):
+                if src.name == "pinterest":
+                    done = 1 if progress.get(src.api.progress_key(query), {}).get("done") else 0
+                else:
+                    done = progress.get(query, 0)
+                rows += [(src.name, query, page, kind, "done", None, 1, now) for page in range(1, done + 1)]
+    with con:
+        con.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def plan(con, sources, kinds, max_pages=None):
+    """First unfinished WorkItem of every (source, query), in source order."""
+    items = []
+    for src in sources.values():
+        limit = src.max_pages if max_pages is None or src.max_pages == 1 else max_pages
+        for kind in kinds:
+            for query in src.queries(kind):
+                last, fewest = con.execute(
+                    "SELECT MAX(page), MIN(results) FROM pages WHERE source = ? AND query = ? AND status = 'done'",
+                    (src.name, query)).fetchone()
+                last = last or 0
+                if fewest == 0 or last >= limit:
+                    continue                     # exhausted (an empty page) or all pages done
+                items.append((WorkItem(src.name, query, last + 1, kind), limit))
+    return items
+
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+class CrawlScheduler:
+    def __init__(self, con, sources, limits, telemetry, bandwidth_mb=None,
+                 disk_budget_gb=None, min_free_gb=MIN_FREE_GB):
+        self.con = con
+        self.sources = sources
+        self.limits = limits
+        self.tel = telemetry
+        self.api_buckets = {name: TokenBucket(limits[name]["per_hour"] / 3600, BURST) for name in sources}
+        self.bandwidth = (TokenBucket(bandwidth_mb * 1e6, bandwidth_mb * 1e6)
+                          if bandwidth_mb else None)
+        self.disk_budget = disk_budget_gb * 1e9 if disk_budget_gb else None
+        self.min_free = min_free_gb * 1e9
+        self.used = con.execute("SELECT COALESCE(SUM(bytes), 0) FROM assets WHERE duplicate_of IS NULL").fetchone()[0]
+        self.lock = threading.Lock()             # guards the connection, telemetry and self.used
+        self.stop = threading.Event()
+        self.claimed = set()                     # (source, item_id) being fetched by some page
+        self.downloads = None
+
+    # -- bookkeeping (all under self.lock) ---------------------------------
+    def count(self, name, n=1):
+        with self.lock:
+            self.tel.count(name, n)
+
+    def claim(self, source, item_id):
+        """False if the image is stored already or another page is fetching it."""
+        with self.lock:
+            if (source, item_id) in self.claimed or self.con.execute(
+                    "SELECT 1 FROM assets WHERE source = ? AND item_id = ?", (source, item_id)).fetchone():
+                return False
+            self.claimed.add((source, item_id))
+            return True
+
+    def record_asset(self, item, cand, size, digest=None, counter="downloaded"):
+        """Store an image; returns the filename it duplicates (the new file is then deleted) or None."""
+        with self.lock:
+            dup = None
+            if digest is not None:
+                row = self.con.execute("SELECT filename FROM assets WHERE sha256 = ? AND duplicate_of IS NULL",
+                                       (digest,)).fetchone()
+                dup = row[0] if row else None
+            with self.con:
+                self.con.execute("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (item.source, cand.item_id, cand.filename, item.kind, item.query,
+                                  cand.url if item.source != "pinterest" else None, size, digest, dup,
+                                  json.dumps(cand.meta, default=str), datetime.now().isoformat()))
+            if dup is None:
+                self.used += size
+            self.tel.count("duplicate" if dup else counter)
+            return dup
+
+    def record_page(self, item, status, results=None):
+        with self.lock:
+            with self.con:
+                self.con.execute("""
+                    INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                    ON CONFLICT(source, query, page) DO UPDATE SET
+                        status = excluded.status, results = excluded.results,
+                        attempts = attempts + 1, updated = excluded.updated""",
+                                 (item.source, item.query, item.page, item.kind, status, results,
+                                  datetime.now().isoformat()))
+            self.tel.count(f"pages_{status}")
+            self.tel.advance()
+
+    def out_of_budget(self):
+        if self.disk_budget is not None and self.used >= self.disk_budget:
+            return "disk budget reached"
+        if shutil.disk_usage(OUT_DIRS["body"].parent).free < self.min_free:
+            return "free disk space below --min-free-gb"
+        return None
+
+    # -- work ----------------------------------------------------------------
+    def fetch(self, item, src, cand):
+        """Download one image. True/False for success/failure, None when stopped before it started."""
+        reason = self.out_of_budget()
+        if reason and not self.stop.is_set():
+            self.stop.set()
+            with self.lock:
+                self.tel.warn(f"[STOP] {reason}; unfinished pages resume next run")
+        if self.stop.is_set():
+            return None
+        if self.bandwidth is not None and not self.bandwidth.take(0, self.stop):
+            return None
+        if src.fetch_uses_api and not self.api_buckets[item.source].take(1, self.stop):
+            return None
+
+        dest = OUT_DIRS[item.kind] / cand.filename
+        part = dest.with_name(f".{dest.name}.part")   # only a complete download is renamed to dest
+        t = time.perf_counter()
+        try:
+            ok = src.fetch(cand, part) and part.exists()
+            if ok:
+                os.replace(part, dest)
+        finally:
+            part.unlink(missing_ok=True)
+        elapsed = time.perf_counter() - t
+        if not ok:
+            self.count("failed_download")
+            return False
+        size = dest.stat().st_size
+        if self.bandwidth is not None:
+            self.bandwidth.take(size)
+        dup = self.record_asset(item, cand, size, sha256_file(dest))
+        if dup is not None:
+            dest.unlink()
+        with self.lock:
+            self.tel.timers["download"] += elapsed
+            self.tel.log(f"[{item.source}] {cand.filename}" + (f" duplicate of {dup}" if dup else ""))
+        return True
+
+    def run_page(self, item):
+        """Search one page and download its new images. Returns the result count, or None if stopped."""
+        src = self.sources[item.source]
+        if not self.api_buckets[item.source].take(1, self.stop):
+            return None
+        t = time.perf_counter()
+        candidates = src.search(item)
+        with self.lock:
+            self.tel.timers[f"search_{item.source}"] += time.perf_counter() - t
+
+        futures, mine = [], []
+        for cand in candidates:
+            dest = OUT_DIRS[item.kind] / cand.filename
+            if not self.claim(item.source, cand.item_id):
+                self.count("known")
+                if item.source == "pinterest":
+                    Path(cand.url).unlink(missing_ok=True)
+                continue
+            mine.append((item.source, cand.item_id))
+            if dest.exists():                    # fetched before the checkpoint existed
+                self.record_asset(item, cand, dest.stat().st_size, counter="existing")
+                if item.source == "pinterest":
+                    Path(cand.url).unlink(missing_ok=True)
+            else:
+                futures.append(self.downloads.submit(self.fetch, item, src, cand))
+        stopped = any(f.result() is None for f in futures)
+        with self.lock:
+            self.claimed.difference_update(mine)
+        return None if stopped else len(candidates)
+
+    def run(self, items):
+        """Run every planned (WorkItem, max_pages); later pages are queued as earlier ones return results."""
+        queues = {name: deque() for name in self.sources}
+        for item, limit in items:
+            queues[item.source].append((item, limit))
+        active = dict.fromkeys(self.sources, 0)
+        running = {}
+
+        for d in OUT_DIRS.values():
+            d.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(DOWNLOAD_WORKERS) as self.downloads, \
+                ThreadPoolExecutor(sum(self.limits[n]["concurrency"] for n in self.sources)) as pages:
+            try:
+                while True:
+                    for name, queue in queues.items():
+                        while queue and active[name] < self.limits[name]["concurrency"] and not self.stop.is_set():
+                            item, limit = queue.popleft()
+                            running[pages.submit(self.run_page, item)] = (item, limit)
+                            active[name] += 1
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        item, limit = running.pop(fut)
+                        active[item.source] -= 1
+                        try:
+                            results = fut.result()
+                        except Exception as e:
+                            self.record_page(item, "failed")
+                            with self.lock:
+                                self.tel.warn(f"[ERR] {item.source} '{item.query}' page {item.page}: {e}")
+                            continue
+                        if results is None:
+                            continue                 # stopped mid-page; redone next run
+                        self.record_page(item, "done", results)
+                        if results and item.page < limit:
+                            queues[item.source].append((item._replace(page=item.page + 1), limit))
+            except KeyboardInterrupt:
+                self.stop.set()
+                with self.lock:
+                    self.tel.warn("[STOP] interrupted; finishing in-flight downloads")
+                wait(running)
+        return sum(len(q) for q in queues.values())
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def status(con):
+    rows = con.execute("""
+        SELECT source, COUNT(DISTINCT query), SUM(status = 'done'), SUM(status = 'failed') FROM pages
+        GROUP BY source ORDER BY source""").fetchall()
+    assets = {s: (n, b, d) for s, n, b, d in con.execute("""
+        SELECT source, SUM(duplicate_of IS NULL), COALESCE(SUM(CASE WHEN duplicate_of IS NULL THEN bytes END), 0),
+               SUM(duplicate_of IS NOT NULL)
+        FROM assets GROUP BY source""")}
+    print(f"{'source':10} {'queries':>8} {'pages':>6} {'failed':>6} {'images':>7} {'MB':>8} {'dupes':>6}")
+    for source, queries, done, failed in rows:
+        n, b, d = assets.get(source, (0, 0, 0))
+        print(f"{source:10} {queries:8} {done:6} {failed:6} {n:7} {b / 1e6:8.1f} {d:6}")
+
+
+def parse_overrides(items, cast, ap):
+    out = {}
+    for item in items or []:
+        name, sep, value = item.partition("=")
+        if not sep or name not in SOURCES:
+            ap.error(f"expected SOURCE=VALUE with SOURCE in {list(SOURCES)}, got {item!r}")
+        out[name] = cast(value)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Concurrent, rate-limited crawl across Pexels, Unsplash and Pinterest.")
+    ap.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    ap.add_argument("--kinds", nargs="+", choices=list(OUT_DIRS), default=list(OUT_DIRS))
+    ap.add_argument("--rate", nargs="+", metavar="SOURCE=N", help="API requests/hour per source")
+    ap.add_argument("--concurrency", nargs="+", metavar="SOURCE=N", help="pages in flight per source")
+    ap.add_argument("--max-pages", type=int, default=None, help="pages per query for Pexels/Unsplash")
+    ap.add_argument("--bandwidth-mb", type=float, default=None, help="total download cap, MB/s")
+    ap.add_argument("--disk-budget-gb", type=float, default=None, help="stop once crawled images take this much")
+    ap.add_argument("--min-free-gb", type=float, default=MIN_FREE_GB)
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--status", action="store_true", help="print the checkpoint and exit")
+    ap.add_argument("--dry-run", action="store_true", help="print the planned work and exit")
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    limits = {name: dict(v) for name, v in SOURCE_LIMITS.items()}
+    for name, v in parse_overrides(args.rate, float, ap).items():
+        limits[name]["per_hour"] = v
+    for name, v in parse_overrides(args.concurrency, int, ap).items():
+        limits[name]["concurrency"] = max(1, v)
+
+    with closing(connect(args.db)) as con:
+        if args.status:
+            status(con)
+            return
+        sources = {name: SOURCES[name]() for name in args.sources}
+        seeded = import_legacy_progress(con, sources)
+        if seeded:
+            print(f"Imported {seeded} finished pages from the scrapers' progress files")
+        items = plan(con, sources, args.kinds, args.max_pages)
+        if args.dry_run:
+            for name in sources:
+                mine = [(i, limit) for i, limit in items if i.source == name]
+                pages = sum(limit - i.page + 1 for i, limit in mine)
+                print(f"{name:10} {len(mine):4} queries, up to {pages} pages at {limits[name]['per_hour']:g} req/h")
+            return
+        if not items:
+            print("Nothing to crawl: every query is finished")
+            return
+
+        total = sum(limit - i.page + 1 for i, limit in items)
+        with Telemetry.from_args(args, "crawl", total=total) as tel:
+            scheduler = CrawlScheduler(con, sources, limits, tel, args.bandwidth_mb,
+                                       args.disk_budget_gb, args.min_free_gb)
+            left = scheduler.run(items)
+        if left or scheduler.stop.is_set():
+            print(f"Stopped early; {left} queued pages and any unfinished ones resume on the next run")
+        status(con)
+
+
+if __name__ == "__main__":
+    main()
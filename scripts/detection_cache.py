@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+detection_cache.py
+
+SQLite cache of skin-patch detections (.pipeline/detections.sqlite), so patch
+geometry can change without running the Haar cascades again.
+
+One row per (image content, detector parameters):
+ - sha256:  SHA-256 of the raw image file (the same hash inventory.py stores)
+ - params:  detector key (extract_skin_patches.DETECTOR_KEY: cascade settings
+            and OpenCV version); changing the detector invalidates its rows
+ - method:  face | upperbody | center (nothing detected)
+ - x, y, w, h:  the detected box in full-resolution pixels (NULL for center)
+
+Keying on content rather than path means renamed or re-downloaded copies of
+an image hit the cache, and an edited image misses it.
+
+extract_skin_patches.py fills the cache on every body-image run and reads it
+with --crop-only, which then only decodes, crops and resizes.
+
+Usage:
+    python scripts/detection_cache.py stats
+    python scripts/detection_cache.py clear [--params KEY]
+"""
+import argparse
+import sqlite3
+from collections import namedtuple
+from contextlib import closing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT / ".pipeline" / "detections.sqlite"
+
+WRITE_BATCH = 500
+
+Detection = namedtuple("Detection", ["method", "box"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    sha256  TEXT NOT NULL,
+    params  TEXT NOT NULL,
+    method  TEXT NOT NULL,
+    x       INTEGER,
+    y       INTEGER,
+    w       INTEGER,
+    h       INTEGER,
+    PRIMARY KEY (sha256, params)
+) WITHOUT ROWID;
+"""
+
+
+class DetectionCache:
+    """Detections for one detector key; writes are batched and flushed on close()."""
+
+    def __init__(self, params, db_path=DB_PATH):
+        self.params = params
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(db_path)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.executescript(SCHEMA)
+        self.pending = []
+
+    def get(self, sha256):
+        """Detection for this content, or None if it was never detected with these params."""
+        row = self.con.execute(
+            "SELECT method, x, y, w, h FROM detections WHERE sha256 = ? AND params = ?",
+            (sha256, self.params)).fetchone()
+        if row is None:
+            return None
+        method, *box = row
+        return Detection(method, None if box[0] is None else tuple(box))
+
+    def put(self, sha256, detection):
+        box = tuple(int(v) for v in detection.box) if detection.box is not None else (None,) * 4
+        self.pending.append((sha256, self.params, detection.method, *box))
+        if len(self.pending) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or clear the skin-patch detection cache.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="rows per detector key and method")
+    clear = sub.add_parser("clear", help="delete cached detections")
+    clear.add_argument("--params", default=None, help="only this detector key (default: all)")
+    args = ap.parse_args()
+
+    if not args.db.exists():
+        print(f"No detection cache at {args.db}")
+        return
+    with closing(sqlite3.connect(args.db)) as con:
+        if args.cmd == "stats":
+            rows = con.execute("SELECT params, method, COUNT(*) FROM detections "
+                               "GROUP BY params, method ORDER BY params, method").fetchall()
+            for params, method, n in rows:
+                print(f"{n:8}  {method:10} {params}")
+            if not rows:
+                print("Detection cache is empty")
+        else:
+            with con:
+                if args.params is None:
+                    n = con.execute("DELETE FROM detections").rowcount
+                else:
+                    n = con.execute("DELETE FROM detections WHERE params = ?", (args.params,)).rowcount
+            print(f"Deleted {n} cached detections")
+
+
+if __name__ == "__main__":
+    main()
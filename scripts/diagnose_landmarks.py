@@ -1,10 +1,219 @@
-# scripts/diagnose_landmarks.py
+#!/usr/bin/env python3
+"""
+diagnose_landmarks.py
+
+QA over the landmark store (landmark_store.load_landmarks), vectorized over the
+full (N, 33, 4) tensor:
+ - per-landmark x/y distributions (mean, std, p1/p50/p99) and visibility
+   (mean, share visible, 10-bin histogram)
+ - torso-height fallback rate: normalize_landmarks() divides by the real
+   torso height, so a normalized shoulder-to-hip distance other than 1
+   means the FALLBACK_TORSO_HEIGHT (0.35) branch was taken
+ - left/right swaps: a person's left shoulder/hip sit at larger x than the
+   right ones when facing the camera; shoulders and hips ordered the other
+   way round from each other, or most limbs ordered against the torso,
+   point to swapped labels
+ - coordinate and ratio outliers by robust z-score (median / MAD) on each
+   landmark's x/y and on SHR/WHR and the widths from auto_label_body_shape
+
+Medians, MADs and quantiles are estimated on a seeded subsample of at most
+STATS_SAMPLE rows; every skeleton is then scored against them.
+
+Writes a compact JSON report and an outlier index (one row per flagged
+skeleton, one 0/1 column per check) to processed/landmarks-qa/ and prints a summary.
+
+Options:
+    --landmarks PATH   landmark CSV (default: body_landmarks_torso_normalized.csv)
+    --json-dir DIR     read per-image JSON files instead of the CSV
+    --z FLOAT          robust z-score threshold (default 3.5)
+
+Examples:
+    python scripts/diagnose_landmarks.py
+    python scripts/diagnose_landmarks.py --landmarks processed/landmarks-synthetic/body_landmarks_synthetic.csv
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-df = pd.read_csv("processed/landmarks/body_landmarks.csv")
 
-print("Sample raw x coordinates (should NOT be 0–1920 or 0–1080):")
-print(df[[f"x_11", f"x_12", f"x_23", f"x_24"]].head(10))
+from auto_label_body_shape import body_ratios
+from landmark_store import (FALLBACK_TORSO_HEIGHT, LANDMARK_CSV, LH, LS, N_LANDMARKS, RH, RS,
+                            load_landmarks)
+
+ROOT = Path(__file__).resolve().parent.parent
+OUT_DIR = ROOT / "processed" / "landmarks-qa"
+
+Z_THRESHOLD = 3.5            # robust z (Iglewicz & Hoaglin)
+COORD_Z_FACTOR = 2.0         # coordinate outliers use Z_THRESHOLD * this
+COORD_OUTLIER_MIN = 2        # visible outlying landmarks to flag a skeleton
+STATS_SAMPLE = 200_000       # rows medians/MADs/quantiles are estimated on
+MAD_SCALE = 1.4826           # MAD -> std for normal data
+VISIBLE = 0.5                # visibility counted as "visible"
+FALLBACK_TOL = 1e-3          # |normalized torso height - 1| above this = fallback taken
+QUANTILES = (0.01, 0.5, 0.99)
+VIS_BINS = 10
+
+# (left, right) landmark pairs beyond the torso: elbows, wrists, knees, ankles
+LIMB_PAIRS = ((13, 14), (15, 16), (25, 26), (27, 28))
+RATIO_KEYS = ("SHR", "WHR", "shoulder_width", "hip_width", "waist_width")
+
+
+def reference_sample(n, size=STATS_SAMPLE, seed=0):
+    """Row indices the medians/quantiles are estimated on: all rows, or a seeded subsample."""
+    if n <= size:
+        return slice(None)
+    return np.sort(np.random.default_rng(seed).choice(n, size, replace=False))
+
+
+def robust_z(a, ref=slice(None)):
+    """(a - median) / (1.4826 * MAD) per column of (N, ...) data, stats from rows ref; 0 where MAD is 0."""
+    a = np.asarray(a, dtype=np.float32)
+    flat = a.reshape(len(a), -1)
+    sample = flat[ref]
+    med = np.nanmedian(sample, axis=0)
+    mad = np.nanmedian(np.abs(sample - med), axis=0) * MAD_SCALE
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(mad > 0, (flat - med) / mad, 0.0)
+    return np.nan_to_num(z, nan=0.0).reshape(a.shape)
+
+
+def landmark_distributions(lm, ref=slice(None)):
+    """Per-landmark stats over all skeletons (quantiles from rows ref): list of 33 dicts."""
+    xy = lm[..., :2].reshape(len(lm), -1)                            # (N, 66)
+    vis = lm[..., 3]
+    mean, std = xy.mean(axis=0, dtype=np.float64), xy.std(axis=0, dtype=np.float64)
+    q = np.quantile(xy[ref], QUANTILES, axis=0)                      # (3, 66)
+    bins = np.clip((vis * VIS_BINS).astype(np.int64), 0, VIS_BINS - 1)
+    hist = np.bincount((bins + VIS_BINS * np.arange(N_LANDMARKS)).ravel(),
+                       minlength=N_LANDMARKS * VIS_BINS).reshape(N_LANDMARKS, VIS_BINS)
+    vis_mean, visible = vis.mean(axis=0), (vis >= VISIBLE).mean(axis=0)
+
+    out = []
+    for i in range(N_LANDMARKS):
+        d = {"landmark": i}
+        for c, name in enumerate("xy"):
+            j = 2 * i + c
+            d[name] = {"mean": round(float(mean[j]), 4), "std": round(float(std[j]), 4),
+                       **{f"p{int(qq * 100)}": round(float(q[k, j]), 4) for k, qq in enumerate(QUANTILES)}}
+        d["visibility"] = {"mean": round(float(vis_mean[i]), 4), "visible": round(float(visible[i]), 4),
+                           "hist": hist[i].tolist()}
+        out.append(d)
+    return out
+
+
+def torso_fallback(lm):
+    """(N,) bool: skeletons normalized with FALLBACK_TORSO_HEIGHT instead of their own torso."""
+    mid_shoulder_y = (lm[:, LS, 1] + lm[:, RS, 1]) / 2
+    mid_hip_y = (lm[:, LH, 1] + lm[:, RH, 1]) / 2
+    return np.abs(np.abs(mid_shoulder_y - mid_hip_y) - 1.0) > FALLBACK_TOL
+
+
+def lr_checks(lm):
+    """
+    Left/right ordering per skeleton. Returns dict of (N,) bool arrays:
+    back_facing (shoulders and hips both right-over-left), torso_mismatch
+    (shoulders and hips ordered differently) and limbs_swapped (most visible
+    limb pairs ordered against the torso).
+    """
+    shoulders = np.sign(lm[:, LS, 0] - lm[:, RS, 0])
+    hips = np.sign(lm[:, LH, 0] - lm[:, RH, 0])
+    torso = np.where(shoulders != 0, shoulders, hips)
+
+    left = lm[:, [l for l, _ in LIMB_PAIRS]]
+    right = lm[:, [r for _, r in LIMB_PAIRS]]
+    seen = np.minimum(left[..., 3], right[..., 3]) >= VISIBLE
+    against = (np.sign(left[..., 0] - right[..., 0]) == -torso[:, None]) & seen
+    return {
+        "back_facing": (shoulders < 0) & (hips < 0),
+        "torso_mismatch": shoulders * hips < 0,
+        "limbs_swapped": (seen.sum(axis=1) >= 3) & (against.sum(axis=1) * 2 > seen.sum(axis=1)),
+    }
+
+
+def analyze(filenames, lm, z=Z_THRESHOLD):
+    """Run every check. Returns (report dict, outlier DataFrame)."""
+    lm = np.asarray(lm, dtype=np.float32)
+    n = len(lm)
+    ref = reference_sample(n)
+    flags = {}
+
+    flags["torso_fallback"] = torso_fallback(lm)
+    flags.update(lr_checks(lm))
+
+    # only visible landmarks count; occluded ones are guesses by design. Wrists,
+    # elbows and feet are heavy-tailed, hence the wider coordinate threshold.
+    coord_z = np.abs(robust_z(lm[..., :2], ref))                   # (N, 33, 2)
+    coord_out = (coord_z > z * COORD_Z_FACTOR).any(axis=2) & (lm[..., 3] >= VISIBLE)  # (N, 33)
+    flags["coord_outlier"] = coord_out.sum(axis=1) >= COORD_OUTLIER_MIN
+
+    ratios = body_ratios(lm)
+    ratio_z = {}
+    for k in RATIO_KEYS:
+        v = ratios[k]
+        ratio_z[k] = robust_z(np.where(np.isfinite(v), v, np.nan), ref)
+        flags[f"{k}_outlier"] = np.abs(ratio_z[k]) > z
+    flags["ratio_invalid"] = ~(np.isfinite(ratios["SHR"]) & np.isfinite(ratios["WHR"]))
+
+    any_flag = np.zeros(n, dtype=bool)
+    for f in flags.values():
+        any_flag |= f
+
+    report = {
+        "skeletons": n,
+        "flagged": int(any_flag.sum()),
+        "rates": {k: round(float(v.mean()), 6) if n else 0.0 for k, v in flags.items()},
+        "counts": {k: int(v.sum()) for k, v in flags.items()},
+        "fallback_torso_height": FALLBACK_TORSO_HEIGHT,
+        "z_threshold": z,
+        "ratios": {k: dict(zip((f"p{int(q * 100)}" for q in QUANTILES),
+                                (round(float(x), 4) for x in np.nanquantile(ratios[k][ref], QUANTILES))))
+                   for k in RATIO_KEYS} if n else {},
+        "coord_outliers_per_landmark": coord_out.sum(axis=0).tolist(),
+        "landmarks": landmark_distributions(lm, ref) if n else [],
+    }
+
+    idx = np.flatnonzero(any_flag)
+    outliers = pd.DataFrame({
+        "filename": np.asarray(filenames)[idx],
+        "n_coord_outliers": coord_out[idx].sum(axis=1),
+        **{f"z_{k}": np.round(ratio_z[k][idx], 2) for k in ("SHR", "WHR")},
+        **{k: v[idx].astype(np.uint8) for k, v in flags.items()},
+    })
+    return report, outliers
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Landmark store QA report and outlier index.")
+    ap.add_argument("--landmarks", type=Path, default=LANDMARK_CSV)
+    ap.add_argument("--json-dir", type=Path, default=None)
+    ap.add_argument("--z", type=float, default=Z_THRESHOLD)
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    filenames, lm = load_landmarks(args.landmarks, json_dir=args.json_dir)
+    loaded = time.perf_counter()
+    report, outliers = analyze(filenames, lm, args.z)
+    report["source"] = str(args.json_dir or args.landmarks)
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    (args.out_dir / "qa_report.json").write_text(json.dumps(report, indent=1))
+    outliers.to_csv(args.out_dir / "qa_outliers.csv", index=False)
+    done = time.perf_counter()
+
+    n = report["skeletons"]
+    print("=" * 40)
+    print(f"Landmark QA: {n} skeletons, {report['flagged']} flagged")
+    print("=" * 40)
+    for k, c in report["counts"].items():
+        print(f"{k:22} {c:8} ({report['rates'][k]:.2%})")
+    for k, r in report["ratios"].items():
+        print(f"{k:22} median {r['p50']:.3f}  p1 {r['p1']:.3f}  p99 {r['p99']:.3f}")
+    print(f"Loaded in {loaded - start:.1f}s, analyzed in {done - loaded:.1f}s → {args.out_dir}")
+
 
-print("\nMax x values in your dataset:")
-print(df[[col for col in df.columns if col.startswith("x_")]].max().max())
-print(df[[col for col in df.columns if col.startswith("y_")]].max().max())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
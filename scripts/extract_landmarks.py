@@ -1,26 +1,58 @@
 #!/usr/bin/env python3
 """
 extract_landmarks.py
+
+Options:
+    --files PATH ...   only (re)process these images and merge them into the
+                       existing CSV/JSON store; a listed path that no longer
+                       exists is removed from the store. @list.txt reads the
+                       paths from a file, one per line (used by pipeline.py).
+    --prefiltered [CSV]  skip images prefilter_images.py rejected
+                       (default CSV: processed/prefilter.csv)
+    --decode-workers N decode in N processes that hand frames to Pose through a
+                       shared-memory ring (frame_ring.py); --infer-workers M
+                       runs M Pose processes. Default: decode and Pose inline.
+    --service [ADDR]   send the images to a running worker_service.py, which
+                       keeps Pose loaded between runs
+    --verbose          one line per image (default: a rate-limited progress line)
+    --metrics F        append JSON-lines timings/counters to F (see instrumentation.py)
+    --profile P        cprofile | sample
 """
+import argparse
 import cv2
 import json
 import pandas as pd
 from pathlib import Path
 import mediapipe as mp
 
+import frame_ring
+from frame_ring import imap_frames
+from instrumentation import Telemetry, add_arguments
+from prefilter_images import OUT_CSV as PREFILTER_CSV, rejected_paths
+import worker_service
+from worker_service import ServiceClient
+
 # Paths
 ROOT = Path(__file__).resolve().parent.parent
 RAW_BODY = ROOT / "raw" / "body"
 OUT_DIR = ROOT / "processed" / "landmarks"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+OUT_CSV = OUT_DIR / "body_landmarks_torso_normalized.csv"
 
 mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    static_image_mode=True,
-    model_complexity=2,                  # Better accuracy
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
+MODEL_COMPLEXITY = 2                     # Better accuracy
+ERROR = object()                         # process_results: inference raised, image kept
+_poses = {}
+
+def get_pose(model_complexity=MODEL_COMPLEXITY):
+    """The Pose model, built on first use (once per process, also in frame_ring workers)."""
+    if model_complexity not in _poses:
+        _poses[model_complexity] = mp_pose.Pose(
+            static_image_mode=True,
+            model_complexity=model_complexity,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+    return _poses[model_complexity]
 
 def normalize_landmarks(landmarks):
     lm = landmarks
@@ -62,34 +94,128 @@ def flatten_landmarks(norm_list, filename):
         flat[f"v_{i}"] = pt["visibility"]
     return flat
 
-def main():
-    print("Extracting landmarks → TORSO-HEIGHT NORMALIZED (Gold Standard)")
-    csv_rows = []
-    kept = deleted = 0
-
-    for idx, path in enumerate(sorted(RAW_BODY.glob("*.[pj][pn]g")), 1):
-        print(f"[{idx:4}] {path.name:50}", end="")
-        img = cv2.imread(str(path))
-        if img is None:
-            path.unlink(); deleted += 1; print(" → DELETED"); continue
-
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = pose.process(rgb)
-
-        if not results.pose_landmarks:
-            path.unlink(); deleted += 1; print(" → NO PERSON"); continue
-
-        normalized_lms, _ = normalize_landmarks(results.pose_landmarks.landmark)
+def detect_frame(img, path=None, model_complexity=MODEL_COMPLEXITY):
+    """Torso-normalized landmarks of one BGR frame, or None if no person was found."""
+    results = get_pose(model_complexity).process(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    if not results.pose_landmarks:
+        return None
+    normalized_lms, _ = normalize_landmarks(results.pose_landmarks.landmark)
+    return normalized_lms
+
+def store_result(idx, path, normalized_lms, tel):
+    """Write one image's JSON and return its flat CSV row; an image without a person is deleted."""
+    if normalized_lms is None:
+        path.unlink(); tel.count("no_person"); tel.log(f"[{idx:4}] {path.name:50} → NO PERSON"); return None
+    with tel.time("write"):
         json_path = OUT_DIR / f"{path.stem}.json"
         json_path.write_text(json.dumps(normalized_lms, indent=2))
+    tel.log(f"[{idx:4}] {path.name:50} → KEPT")
+    return flatten_landmarks(normalized_lms, path.name)
+
+def process_image(idx, path, tel):
+    """Landmark one image; returns its flat CSV row, or None if the image was deleted."""
+    with tel.time("decode"):
+        img = cv2.imread(str(path))
+    if img is None:
+        path.unlink(); tel.count("unreadable"); tel.log(f"[{idx:4}] {path.name:50} → DELETED"); return None
+
+    with tel.time("inference"):
+        normalized_lms = detect_frame(img)
+    return store_result(idx, path, normalized_lms, tel)
+
+def process_results(results, tel):
+    """
+    Rows from FrameResults computed elsewhere: frame_ring.imap_frames() or
+    worker_service.py. None for a deleted image, ERROR (image kept) when inference raised.
+    """
+    for r in results:
+        tel.timers["decode"] += r.decode_s
+        tel.timers["inference"] += r.infer_s
+        idx, path = r.idx + 1, r.path
+        if r.status == "unreadable":
+            path.unlink(); tel.count("unreadable"); tel.log(f"[{idx:4}] {path.name:50} → DELETED"); row = None
+        elif r.status == "error":
+            tel.count("error"); tel.warn(f"[{idx:4}] {path.name:50} → ERROR\n{r.value}"); row = ERROR
+        else:
+            row = store_result(idx, path, r.value, tel)
+        yield row
+
+def merge_rows(csv_rows, touched):
+    """Replace the rows of every touched filename in OUT_CSV with csv_rows (kept in filename order)."""
+    if not csv_rows and not OUT_CSV.exists():
+        return
+    df = pd.DataFrame(csv_rows)
+    if OUT_CSV.exists():
+        old = pd.read_csv(OUT_CSV)
+        df = pd.concat([old[~old["filename"].isin(touched)], df], ignore_index=True)
+        df = df.sort_values("filename", kind="stable")
+    df.to_csv(OUT_CSV, index=False)
 
-        csv_rows.append(flatten_landmarks(normalized_lms, path.name))
-        kept += 1
-        print(" → KEPT")
+def main():
+    ap = argparse.ArgumentParser(description="Extract torso-normalized pose landmarks from raw/body.",
+                                 fromfile_prefix_chars="@")
+    ap.add_argument("--files", nargs="+", type=Path, default=None,
+                    help="only these images (missing paths are dropped from the store)")
+    ap.add_argument("--prefiltered", nargs="?", type=Path, const=PREFILTER_CSV, default=None,
+                    help="skip images rejected by prefilter_images.py")
+    frame_ring.add_arguments(ap)
+    worker_service.add_arguments(ap)
+    add_arguments(ap)
+    args = ap.parse_args()
+    frame_ring.check_arguments(ap, args)
+    client = None
+    if args.service is not None:
+        try:
+            client = ServiceClient(args.service)
+        except ConnectionError as e:
+            ap.error(str(e))
 
-    if csv_rows:
-        pd.DataFrame(csv_rows).to_csv(OUT_DIR / "body_landmarks_torso_normalized.csv", index=False)
-    print(f"\nDone! Kept: {kept} | Deleted: {deleted}")
+    print("Extracting landmarks → TORSO-HEIGHT NORMALIZED (Gold Standard)")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    csv_rows = []
+    kept = deleted = 0
+    errors = set()
+
+    if args.files is None:
+        paths = sorted(RAW_BODY.glob("*.[pj][pn]g"))
+    else:
+        paths = sorted(p for p in args.files if p.exists())
+        for p in args.files:
+            if not p.exists():
+                (OUT_DIR / f"{p.stem}.json").unlink(missing_ok=True)
+                print(f"[   -] {p.name:50} → REMOVED")
+    if args.prefiltered is not None:
+        rejected = rejected_paths(args.prefiltered)
+        n_before = len(paths)
+        paths = [p for p in paths if p.resolve() not in rejected]
+        print(f"Prefilter: skipping {n_before - len(paths)} rejected images")
+
+    with Telemetry.from_args(args, "landmarks", total=len(paths)) as tel:
+        if client is not None:
+            rows = process_results(client.map("landmarks", paths), tel)
+        elif args.decode_workers > 0:
+            rows = process_results(imap_frames(paths, detect_frame, args.decode_workers, args.infer_workers), tel)
+        else:
+            rows = (process_image(idx, path, tel) for idx, path in enumerate(paths, 1))
+        for path, row in zip(paths, rows):
+            tel.advance()
+            if row is ERROR:
+                errors.add(path.name)
+                continue
+            if row is None:
+                deleted += 1
+                continue
+            csv_rows.append(row)
+            kept += 1
+
+        with tel.time("write"):
+            if args.files is not None:
+                merge_rows(csv_rows, {p.name for p in args.files} - errors)   # failed images keep their row
+            elif csv_rows:
+                pd.DataFrame(csv_rows).to_csv(OUT_CSV, index=False)
+    if client is not None:
+        client.close()
+    print(f"\nDone! Kept: {kept} | Deleted: {deleted}" + (f" | Errors: {len(errors)}" if errors else ""))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
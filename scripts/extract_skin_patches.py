@@ -12,17 +12,60 @@ Outputs:
 Uses:
  - OpenCV Haar cascades (lightweight, device-friendly)
  - fallback cropping when detection fails
+ - detection_cache.py: the detected box of every body image, keyed by file
+   content hash and detector parameters, written on every run
+
+Options:
+    --emit-paths   print each saved patch path on stdout (progress goes to stderr),
+                   so new patches can be piped straight into
+                   auto_label_skin_tone.py --predict --stdin
+    --pyramid      also write every patch at 128/64/32 into uint8 arrays under
+                   processed/skin-patch-arrays/ in the same pass (see skin_dataset.py)
+    --no-jpeg      with --pyramid: skip the JPEG files entirely
+    --prefiltered [CSV]  skip raw images prefilter_images.py rejected
+                   (default CSV: processed/prefilter.csv)
+    --decode-workers N  decode in N processes that hand frames to the Haar
+                   workers through a shared-memory ring (frame_ring.py);
+                   --infer-workers M runs M detection processes
+    --service [ADDR]  send the images to a running worker_service.py, which
+                   keeps the cascades loaded between runs
+    --crop-only    reuse the face/upper-body boxes cached by earlier runs
+                   (detection_cache.py) and only decode, crop and resize;
+                   images without a cached box are detected once and cached
+    --face-pad F, --upper-torso F, --center-scale F
+                   patch geometry (defaults 0.2 / 0.4 / 0.4); combine with
+                   --crop-only to try new values without re-running the cascades
+    --verbose      one line per image (default: a rate-limited progress line)
+    --metrics F    append JSON-lines timings/counters to F (see instrumentation.py)
+    --profile P    cprofile | sample
+    --files PATH   only (re)extract these raw images and update the existing
+                   patches/metadata; a listed path that no longer exists has
+                   its patch removed. @list.txt reads paths from a file
+                   (used by pipeline.py). Not combinable with --pyramid.
 
 Requirements:
     pip install opencv-python
 """
 
+import argparse
+import contextlib
 import cv2
 import os
 import json
+import sys
 from pathlib import Path
 from datetime import datetime
 
+import frame_ring
+from detection_cache import Detection, DetectionCache
+from frame_ring import imap_frames
+from instrumentation import Telemetry, add_arguments
+from inventory import sha256_file
+from prefilter_images import OUT_CSV as PREFILTER_CSV, rejected_paths
+from skin_dataset import PYRAMID_DIR, PYRAMID_SIZES, PyramidWriter
+import worker_service
+from worker_service import ServiceClient
+
 # -----------------------------
 # Folder Paths
 # -----------------------------
@@ -34,33 +77,81 @@ RAW_BODY = ROOT / "raw" / "body"
 OUT_DIR = ROOT / "processed" / "skin-patches"
 META_FILE = ROOT / "scripts" / "skin_patch_metadata.json"
 
-OUT_DIR.mkdir(parents=True, exist_ok=True)
-
 # -----------------------------
 # Haar Cascade Files (OpenCV)
 # -----------------------------
-# OpenCV ships these classifiers
-face_cascade = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-)
-upperbody_cascade = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_upperbody.xml"
-)
+# OpenCV ships these classifiers; loaded on first use, once per process
+_cascades = None
+
+
+def get_cascades():
+    """(face_cascade, upperbody_cascade)."""
+    global _cascades
+    if _cascades is None:
+        _cascades = (
+            cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml"),
+            cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_upperbody.xml"),
+        )
+    return _cascades
+
+
+# detectMultiScale (scaleFactor, minNeighbors); part of the detection cache key
+FACE_DETECT = (1.2, 4)
+UPPERBODY_DETECT = (1.1, 3)
+DETECTOR_KEY = (f"haar face={FACE_DETECT[0]}/{FACE_DETECT[1]} "
+                f"upperbody={UPPERBODY_DETECT[0]}/{UPPERBODY_DETECT[1]} opencv={cv2.__version__}")
+
+# -----------------------------
+# Patch geometry (applied to cached boxes; changing it needs no re-detection)
+# -----------------------------
+FACE_PAD = 0.2        # face box grown by this share of its height (cheek & forehead)
+UPPER_TORSO = 0.4     # top share of the upper-body box kept (upper torso / arms)
+CENTER_SCALE = 0.4    # center crop side as a share of the image side
+GEOMETRY = {"face_pad": FACE_PAD, "upper_torso": UPPER_TORSO, "center_scale": CENTER_SCALE}
 
 # -----------------------------
 # Helper Functions
 # -----------------------------
 
-def save_patch(patch, filename, meta, metadata_dict):
+def save_patch(patch, filename, meta, metadata_dict, telemetry=None):
     """Save skin patch and store metadata."""
+    tel = telemetry or Telemetry("skin_patches", progress=False)
     out_path = OUT_DIR / filename
-    cv2.imwrite(str(out_path), patch)
+    with tel.time("encode"):
+        ok, buf = cv2.imencode(out_path.suffix, patch)
+    if not ok:
+        raise RuntimeError(f"could not encode patch {filename}")
+    with tel.time("write"):
+        out_path.write_bytes(buf.tobytes())
     metadata_dict[filename] = meta
+    return out_path
+
+
+class PatchSink:
+    """Where finished patches go: JPEG files, an optional array pyramid, an optional path stream."""
+
+    def __init__(self, write_jpeg=True, pyramid=None, on_saved=None, telemetry=None):
+        self.write_jpeg = write_jpeg
+        self.pyramid = pyramid
+        self.on_saved = on_saved
+        self.telemetry = telemetry or Telemetry("skin_patches", progress=False)
+
+    def save(self, patch, filename, meta, metadata_dict):
+        self.telemetry.count("patches")
+        if self.pyramid is not None:
+            with self.telemetry.time("pyramid"):
+                self.pyramid.add(filename, patch)
+        if self.write_jpeg:
+            out_path = save_patch(patch, filename, meta, metadata_dict, self.telemetry)
+            if self.on_saved is not None:
+                self.on_saved(out_path)
+        else:
+            metadata_dict[filename] = meta
 
 
 def detect_face(img_gray):
     """Return first face bbox (x, y, w, h) or None."""
-    faces = face_cascade.detectMultiScale(img_gray, 1.2, 4)
+    faces = get_cascades()[0].detectMultiScale(img_gray, *FACE_DETECT)
     if len(faces) > 0:
         return faces[0]
     return None
@@ -68,13 +159,13 @@ def detect_face(img_gray):
 
 def detect_upperbody(img_gray):
     """Return upper body bbox. Not perfect but usually finds torso/arms."""
-    bodies = upperbody_cascade.detectMultiScale(img_gray, 1.1, 3)
+    bodies = get_cascades()[1].detectMultiScale(img_gray, *UPPERBODY_DETECT)
     if len(bodies) > 0:
         return bodies[0]
     return None
 
 
-def manual_center_crop(img, scale=0.4):
+def manual_center_crop(img, scale=CENTER_SCALE):
     """Fallback crop from center region."""
     h, w = img.shape[:2]
     crop_w, crop_h = int(w * scale), int(h * scale)
@@ -85,27 +176,41 @@ def manual_center_crop(img, scale=0.4):
     return img[start_y:start_y + crop_h, start_x:start_x + crop_w]
 
 
-def extract_patch_from_body(img):
-    """Try detecting face then upper body; fallback to center crop."""
+def detect_region(img):
+    """Try detecting face then upper body. Returns a Detection; method "center" when neither is found."""
     img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    # Try face crop
     face = detect_face(img_gray)
     if face is not None:
-        x, y, w, h = face
-        # Expand slightly outward to include cheek & forehead skin
-        pad = int(h * 0.2)
-        return img[max(0, y-pad):y+h+pad, max(0, x-pad):x+w+pad]
+        return Detection("face", tuple(int(v) for v in face))
 
-    # Try upper body region (arms included)
+    # Upper body region (arms included)
     body = detect_upperbody(img_gray)
     if body is not None:
-        x, y, w, h = body
-        arm_area = img[y:y + int(h * 0.4), x:x + w]  # Upper torso / arms
-        return arm_area
+        return Detection("upperbody", tuple(int(v) for v in body))
+
+    return Detection("center", None)
+
+
+def crop_region(img, detection, geometry=GEOMETRY):
+    """Crop a detected region: padded face, upper torso of the upper body, or center crop."""
+    if detection.method == "face":
+        x, y, w, h = detection.box
+        # Expand slightly outward to include cheek & forehead skin
+        pad = int(h * geometry["face_pad"])
+        return img[max(0, y-pad):y+h+pad, max(0, x-pad):x+w+pad]
+
+    if detection.method == "upperbody":
+        x, y, w, h = detection.box
+        return img[y:y + int(h * geometry["upper_torso"]), x:x + w]  # Upper torso / arms
 
     # Fallback: center crop
-    return manual_center_crop(img)
+    return manual_center_crop(img, geometry["center_scale"])
+
+
+def extract_patch_from_body(img, geometry=GEOMETRY):
+    """Try detecting face then upper body; fallback to center crop."""
+    return crop_region(img, detect_region(img), geometry)
 
 
 def normalize_patch(patch, size=(128, 128)):
@@ -116,24 +221,30 @@ def normalize_patch(patch, size=(128, 128)):
 # -----------------------------
 # Main Processing
 # -----------------------------
-def process_raw_skin(metadata):
-    """Directly crop center of close-up skin images."""
+def process_raw_skin(metadata, sink=None, files=None, geometry=GEOMETRY):
+    """Directly crop center of close-up skin images (all of raw/skin/, or just files)."""
     print("\n=== Extracting from raw/skin/ ===")
-    
-    for file in RAW_SKIN.iterdir():
+    sink = sink or PatchSink()
+    tel = sink.telemetry
+
+    for file in (RAW_SKIN.iterdir() if files is None else files):
         if not file.is_file() or not file.suffix.lower() in [".jpg", ".png", ".jpeg"]:
             continue
 
-        img = cv2.imread(str(file))
+        with tel.time("decode"):
+            img = cv2.imread(str(file))
+        tel.advance()
         if img is None:
-            print(f"[WARN] Failed to read {file}")
+            tel.count("unreadable")
+            tel.warn(f"[WARN] Failed to read {file}")
             continue
 
-        patch = manual_center_crop(img)
-        patch = normalize_patch(patch)
+        with tel.time("crop"):
+            patch = manual_center_crop(img, geometry["center_scale"])
+            patch = normalize_patch(patch)
 
         out_name = f"skin_{file.stem}.jpg"
-        save_patch(
+        sink.save(
             patch,
             out_name,
             {
@@ -143,53 +254,255 @@ def process_raw_skin(metadata):
             },
             metadata
         )
-        print(f"[OK] Saved patch from {file.name}")
+        tel.log(f"[OK] Saved patch from {file.name}")
 
 
-def process_raw_body(metadata):
-    """Extract skin regions from full-body images."""
+def process_raw_body(metadata, sink=None, files=None, cache=None, geometry=GEOMETRY, crop_only=False):
+    """
+    Extract skin regions from full-body images (all of raw/body/, or just
+    files). Detections are written to cache; with crop_only they are read
+    from it and the cascades only run for images it does not have yet.
+    """
     print("\n=== Extracting from raw/body/ ===")
+    sink = sink or PatchSink()
+    tel = sink.telemetry
 
-    for file in RAW_BODY.iterdir():
+    for file in (RAW_BODY.iterdir() if files is None else files):
         if not file.is_file() or not file.suffix.lower() in [".jpg", ".png", ".jpeg"]:
             continue
 
-        img = cv2.imread(str(file))
+        with tel.time("decode"):
+            img = cv2.imread(str(file))
+        tel.advance()
         if img is None:
-            print(f"[WARN] Could not read {file}")
+            tel.count("unreadable")
+            tel.warn(f"[WARN] Could not read {file}")
             continue
 
-        patch = extract_patch_from_body(img)
-        patch = normalize_patch(patch)
+        detection = digest = None
+        if cache is not None:
+            with tel.time("hash"):
+                digest = sha256_file(file)
+            if crop_only:
+                detection = cache.get(digest)
+                tel.count("cache_miss" if detection is None else "cache_hit")
+        if detection is None:
+            with tel.time("inference"):
+                detection = detect_region(img)
+            if cache is not None:
+                cache.put(digest, detection)
+        with tel.time("crop"):
+            patch = normalize_patch(crop_region(img, detection, geometry))
 
         out_name = f"body_skin_{file.stem}.jpg"
-        save_patch(
+        sink.save(
             patch,
             out_name,
             {
                 "source": str(file),
                 "method": "face/upperbody/fallback",
+                "detection": detection.method,
                 "timestamp": datetime.now().isoformat()
             },
             metadata
         )
-        print(f"[OK] Extracted patch from {file.name}")
+        tel.log(f"[OK] Extracted patch from {file.name}")
+
+
+def patch_from_frame(img, path):
+    """
+    (patch, detection, sha256) for one decoded image: center crop for
+    raw/skin (detection and hash None), face/upper body for raw/body.
+    """
+    if from_raw_skin(path):
+        return normalize_patch(manual_center_crop(img)), None, None
+    detection = detect_region(img)
+    return normalize_patch(crop_region(img, detection)), detection, sha256_file(path)
+
+
+def process_pipelined(metadata, sink, skin_files=None, body_files=None,
+                      decode_workers=frame_ring.DECODE_WORKERS, infer_workers=frame_ring.INFER_WORKERS,
+                      client=None, cache=None):
+    """
+    process_raw_skin + process_raw_body with decoding and Haar detection in
+    separate processes: a frame_ring.py pipeline, or a running
+    worker_service.py when client is given.
+    """
+    print("\n=== Extracting from raw/skin/ and raw/body/ (pipelined) ===")
+    tel = sink.telemetry
+    files = [f for f in (list_images(RAW_SKIN) if skin_files is None else skin_files) +
+             (list_images(RAW_BODY) if body_files is None else body_files)
+             if f.is_file() and f.suffix.lower() in [".jpg", ".png", ".jpeg"]]
+
+    if client is not None:
+        results = client.map("skin_patch", files)
+    else:
+        results = imap_frames(files, patch_from_frame, decode_workers, infer_workers)
+    for r in results:
+        tel.timers["decode"] += r.decode_s
+        tel.timers["inference"] += r.infer_s
+        tel.advance()
+        if r.status == "unreadable":
+            tel.count("unreadable")
+            tel.warn(f"[WARN] Could not read {r.path}")
+            continue
+        if r.status == "error":
+            tel.count("error")
+            tel.warn(f"[ERR] {r.path}\n{r.value}")
+            continue
 
+        patch, detection, digest = r.value
+        meta = {"source": str(r.path), "method": "manual_center_crop"}
+        if detection is not None:
+            meta.update(method="face/upperbody/fallback", detection=detection.method)
+            if cache is not None:
+                cache.put(digest, detection)
+        meta["timestamp"] = datetime.now().isoformat()
+        sink.save(patch, patch_name(r.path), meta, metadata)
+        tel.log(f"[OK] Saved patch from {r.path.name}")
+
+
+def count_candidates():
+    """Number of image files extraction will visit (upper bound for the pyramid arrays)."""
+    return sum(
+        1
+        for folder in (RAW_SKIN, RAW_BODY) if folder.exists()
+        for f in folder.iterdir()
+        if f.is_file() and f.suffix.lower() in [".jpg", ".png", ".jpeg"]
+    )
 
-def main():
-    print("=== Skin Patch Extraction Started ===\n")
 
-    metadata = {}
+def from_raw_skin(file):
+    return Path(file).resolve().parent == RAW_SKIN.resolve()
 
-    process_raw_skin(metadata)
-    process_raw_body(metadata)
 
-    # Save metadata JSON
-    with open(META_FILE, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+def patch_name(file):
+    """Patch filename for a raw image, as written by process_raw_skin/process_raw_body."""
+    prefix = "skin_" if from_raw_skin(file) else "body_skin_"
+    return f"{prefix}{Path(file).stem}.jpg"
 
-    print("\n=== Extraction Complete ===")
-    print(f"Metadata saved to {META_FILE}")
+
+def list_images(folder):
+    if not folder.exists():
+        return []
+    return [f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in [".jpg", ".png", ".jpeg"]]
+
+
+def screened(files, rejected, tel):
+    """files minus those prefilter_images.py rejected (counted as "prefiltered")."""
+    keep = [f for f in files if f.resolve() not in rejected]
+    tel.count("prefiltered", len(files) - len(keep))
+    return keep
+
+
+def load_metadata():
+    if META_FILE.exists():
+        with open(META_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def emit_path(path):
+    """Write a saved patch path to the real stdout for a downstream consumer."""
+    sys.__stdout__.write(f"{path}\n")
+    sys.__stdout__.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract skin patches from raw/skin and raw/body.",
+                                 fromfile_prefix_chars="@")
+    ap.add_argument("--emit-paths", action="store_true",
+                    help="print saved patch paths on stdout, logs on stderr")
+    ap.add_argument("--pyramid", action="store_true",
+                    help=f"also write {'/'.join(map(str, PYRAMID_SIZES))} uint8 arrays to {PYRAMID_DIR.relative_to(ROOT)}/")
+    ap.add_argument("--no-jpeg", action="store_true", help="with --pyramid: do not write JPEG patches")
+    ap.add_argument("--files", nargs="+", type=Path, default=None,
+                    help="only these raw images (missing paths have their patch removed)")
+    ap.add_argument("--prefiltered", nargs="?", type=Path, const=PREFILTER_CSV, default=None,
+                    help="skip raw images rejected by prefilter_images.py")
+    ap.add_argument("--crop-only", action="store_true",
+                    help="crop from cached detections; run the cascades only for uncached images")
+    for name, value in GEOMETRY.items():
+        ap.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    frame_ring.add_arguments(ap)
+    worker_service.add_arguments(ap)
+    add_arguments(ap)
+    args = ap.parse_args()
+    frame_ring.check_arguments(ap, args)
+    if args.no_jpeg and not args.pyramid:
+        ap.error("--no-jpeg requires --pyramid")
+    if args.files is not None and args.pyramid:
+        ap.error("--files cannot update the pyramid arrays; rebuild them with a full --pyramid run")
+    geometry = {name: getattr(args, name) for name in GEOMETRY}
+    pipelined = args.service is not None or args.decode_workers > 0
+    if pipelined and (args.crop_only or geometry != GEOMETRY):
+        ap.error("--crop-only and patch geometry options run in-process; "
+                 "drop --service/--decode-workers")
+    client = None
+    if args.service is not None:
+        try:
+            client = ServiceClient(args.service)
+        except ConnectionError as e:
+            ap.error(str(e))
+
+    n_candidates = count_candidates() if args.files is None else len(args.files)
+    pyramid = PyramidWriter(n_candidates) if args.pyramid else None
+    tel = Telemetry.from_args(args, "skin_patches", total=n_candidates)
+    sink = PatchSink(
+        write_jpeg=not args.no_jpeg,
+        pyramid=pyramid,
+        on_saved=emit_path if args.emit_paths else None,
+        telemetry=tel,
+    )
+    log_target = sys.stderr if args.emit_paths else sys.stdout
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    with contextlib.redirect_stdout(log_target), tel:
+        print("=== Skin Patch Extraction Started ===\n")
+
+        if args.files is None:
+            metadata = {}
+            skin_files = body_files = None
+            if args.prefiltered is not None:
+                rejected = rejected_paths(args.prefiltered)
+                skin_files, body_files = (screened(list_images(folder), rejected, tel)
+                                          for folder in (RAW_SKIN, RAW_BODY))
+        else:
+            metadata = load_metadata()
+            for f in args.files:
+                if not f.exists():
+                    name = patch_name(f)
+                    (OUT_DIR / name).unlink(missing_ok=True)
+                    metadata.pop(name, None)
+                    tel.count("removed")
+                    tel.log(f"[OK] Removed patch of deleted {f.name}")
+            present = [f for f in args.files if f.exists()]
+            if args.prefiltered is not None:
+                present = screened(present, rejected_paths(args.prefiltered), tel)
+            skin_files = [f for f in present if from_raw_skin(f)]
+            body_files = [f for f in present if not from_raw_skin(f)]
+
+        with DetectionCache(DETECTOR_KEY) as cache:
+            if pipelined:
+                process_pipelined(metadata, sink, skin_files, body_files,
+                                  args.decode_workers, args.infer_workers, client, cache)
+            else:
+                process_raw_skin(metadata, sink, skin_files, geometry)
+                process_raw_body(metadata, sink, body_files, cache, geometry, args.crop_only)
+
+        if pyramid is not None:
+            n = pyramid.close()
+            print(f"\nPatch pyramid ({n} patches) saved to {PYRAMID_DIR}")
+
+        # Save metadata JSON
+        with open(META_FILE, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+        if client is not None:
+            client.close()
+
+        print("\n=== Extraction Complete ===")
+        print(f"Metadata saved to {META_FILE}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+frame_ring.py
+
+Decode/inference pipeline over a shared-memory ring of frame slots, so JPEG
+decoding and model inference run on different cores and frames never get
+pickled between processes.
+
+    decode workers ──(slot index)──▶ inference workers ──(small result)──▶ caller
+          ▲                                  │
+          └──────────── free slots ◀─────────┘
+
+ - FrameRing: one multiprocessing.shared_memory block cut into fixed-size
+   slots; a slot is viewed as an ndarray in place (no copy).
+ - imap_frames(): decode workers cv2.imread() into a free slot and pass
+   (slot, shape) on; inference workers run infer(frame, path) on the slot
+   view and hand the slot back. A decoder blocks until a slot is free, so at
+   most `slots` frames are in memory at once (backpressure). Frames larger
+   than a slot skip the ring and are decoded by the inference worker.
+   Results come back in input order, like Pool.imap.
+
+infer must be a module-level function (workers import it by reference),
+should load its model lazily, once per worker process, and must not return
+a view of the frame: the slot is reused as soon as infer returns.
+
+Usage:
+    from frame_ring import imap_frames
+    for r in imap_frames(paths, detect_frame, decode_workers=3, infer_workers=1):
+        r.idx, r.path, r.status, r.value     # status: ok | unreadable | error
+"""
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+INFER_WORKERS = 1
+SLOTS_PER_WORKER = 2                   # ring slots per inference worker (+ one per decoder)
+SLOT_BYTES = 4000 * 3000 * 3           # 12 MP BGR; larger frames bypass the ring
+OVERSIZE = -1
+
+FrameResult = namedtuple("FrameResult", ["idx", "path", "status", "value", "decode_s", "infer_s"])
+
+
+class FrameRing:
+    """Fixed-size frame slots in one shared-memory block."""
+
+    def __init__(self, slots, slot_bytes=SLOT_BYTES, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, shape, dtype=np.uint8):
+        """ndarray over one slot, no copy."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def fits(self, arr):
+        return arr.nbytes <= self.slot_bytes
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# -----------------------------
+# Workers
+# -----------------------------
+def _decode_worker(ring_args, tasks, free, ready):
+    cv2.setNumThreads(1)
+    ring = FrameRing(*ring_args)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            idx, path = task
+            t = time.perf_counter()
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            decode_s = time.perf_counter() - t
+            if img is None:
+                ready.put((idx, path, None, None, decode_s))
+            elif not ring.fits(img):
+                ready.put((idx, path, OVERSIZE, None, decode_s))
+            else:
+                slot = free.get()                      # blocks while every slot is in use
+                ring.view(slot, img.shape)[...] = img
+                ready.put((idx, path, slot, img.shape, decode_s))
+    finally:
+        ring.shm.close()
+
+
+def _infer_worker(ring_args, infer, ready, free, results):
+    ring = FrameRing(*ring_args)
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            idx, path, slot, shape, decode_s = item
+            if slot is None:
+                results.put(FrameResult(idx, path, "unreadable", None, decode_s, 0.0))
+                continue
+            t = time.perf_counter()
+            try:
+                if slot == OVERSIZE:
+                    frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+                else:
+                    frame = ring.view(slot, shape)
+                value, status = infer(frame, path), "ok"
+            except Exception:
+                value, status = traceback.format_exc(), "error"
+            finally:
+                frame = None
+                if slot != OVERSIZE:
+                    free.put(slot)
+            results.put(FrameResult(idx, path, status, value, decode_s, time.perf_counter() - t))
+    finally:
+        ring.shm.close()
+
+
+# -----------------------------
+# Driver
+# -----------------------------
+def imap_frames(paths, infer, decode_workers=DECODE_WORKERS, infer_workers=INFER_WORKERS,
+                slots=None, slot_bytes=SLOT_BYTES):
+    """Yield a FrameResult per path, in input order, with decode and infer(frame, path) overlapped."""
+    if decode_workers < 1 or infer_workers < 1:
+        raise ValueError("imap_frames needs at least one decode and one inference worker")
+    paths = list(paths)
+    if not paths:
+        return
+    slots = slots or infer_workers * SLOTS_PER_WORKER + decode_workers
+    ring = FrameRing(slots, slot_bytes)
+    ring_args = (slots, slot_bytes, ring.name)
+
+    ctx = mp.get_context()
+    tasks = ctx.Queue(maxsize=slots * 4)
+    free, ready, results = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    for s in range(slots):
+        free.put(s)
+
+    procs = [ctx.Process(target=_decode_worker, args=(ring_args, tasks, free, ready), daemon=True)
+             for _ in range(decode_workers)]
+    procs += [ctx.Process(target=_infer_worker, args=(ring_args, infer, ready, free, results), daemon=True)
+              for _ in range(infer_workers)]
+    for p in procs:
+        p.start()
+
+    stop = threading.Event()
+
+    def feed():
+        for item in enumerate(paths):
+            while not stop.is_set():
+                try:
+                    tasks.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+        for _ in range(decode_workers):
+            tasks.put(None)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    pending, next_idx = {}, 0
+    try:
+        while next_idx < len(paths):
+            try:
+                r = results.get(timeout=1.0)
+            except queue.Empty:
+                # decoders exit 0 once they read their sentinel; anything else is a crash
+                crashed = [p for p in procs if p.exitcode not in (None, 0)]
+                crashed += [p for p in procs[decode_workers:] if p.exitcode == 0]
+                if crashed:
+                    raise RuntimeError(f"{len(crashed)} worker(s) exited early "
+                                       f"(exit codes {[p.exitcode for p in crashed]})")
+                continue
+            pending[r.idx] = r
+            while next_idx in pending:
+                yield pending.pop(next_idx)
+                next_idx += 1
+    finally:
+        stop.set()
+        if next_idx == len(paths):
+            for _ in range(infer_workers):
+                ready.put(None)
+            for p in procs:
+                p.join(timeout=5)
+        for p in procs:                                # early exit or a stuck worker
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        ring.close()
+
+
+def add_arguments(ap):
+    """Add --decode-workers/--infer-workers to a script's argument parser."""
+    g = ap.add_argument_group("decode/inference pipeline (frame_ring.py)")
+    g.add_argument("--decode-workers", type=int, default=0,
+                   help=f"decode in N processes through a shared-memory ring (0 = serial; try {DECODE_WORKERS})")
+    g.add_argument("--infer-workers", type=int, default=INFER_WORKERS,
+                   help="inference processes, each with its own model (with --decode-workers)")
+    return g
+
+
+def check_arguments(ap, args):
+    """Reject worker counts imap_frames cannot run with (call after parse_args)."""
+    if args.decode_workers < 0:
+        ap.error("--decode-workers must be >= 0")
+    if args.infer_workers < 1:
+        ap.error("--infer-workers must be >= 1")
@@ -2,104 +2,277 @@
 """
 generate_synthetic_body_data.py
 Generates 1000+ realistic, balanced, torso-normalized body shape rows
+
+Rows are generated in fixed-size chunks. Each chunk gets its own
+np.random.Generator from a SeedSequence child (seed, chunk index), and every
+class inside a chunk is drawn with single array calls, so the output depends
+only on --seed/--per-class/--chunk-rows — never on --workers.
+
+Filenames are unique by construction: every row gets a distinct number from a
+seeded bijective scramble of its global row index, formatted into one of the
+filename templates.
+
+Output:
+ - csv (default): one CSV, rows shuffled within each chunk
+ - npy:           columnar chunks, <out>/chunk-00000/<column>.npy ...
+
+Examples:
+    python scripts/generate_synthetic_body_data.py
+    python scripts/generate_synthetic_body_data.py --per-class 2000000 --format npy --workers 8
 """
-import pandas as pd
+import argparse
+import json
+import math
 import numpy as np
+import pandas as pd
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-np.random.seed(42)
-
-def generate_filenames(n):
-    templates = [
-        "img_{:06d}.jpg", "photo_{}.jpeg", "{}.jpg",
-        "stand_{:05d}.jpg", "model_{}.jpg", "person_{:04d}.jpg",
-        "fullbody_{}.jpg", "pose_{:03d}.jpeg", "{:012d}.jpg",
-        "user_upload_{}.jpg", "pic_{:07d}.jpg", "body_{:05d}.png"
-    ]
-    import random
-    import string
-    files = set()
-    while len(files) < n:
-        tmpl = random.choice(templates)
-        if "{}" in tmpl:
-            name = tmpl.format(np.random.randint(1, 999999))
-        elif "{:0" in tmpl:
-            name = tmpl.format(np.random.randint(1, 999999))
-        else:
-            name = ''.join(random.choices(string.hexdigits.lower(), k=16)) + ".jpg"
-        files.add(name)
-    return sorted(list(files))
-
-def generate_class(shape, n=200):
-    data = []
-    filenames = generate_filenames(n)
-    
-    for i, fname in enumerate(filenames):
-        if shape == "Hourglass":
-            SHR = np.random.normal(1.00, 0.08)   # 0.85 – 1.15
-            WHR = np.random.normal(0.72, 0.05)   # 0.62 – 0.82
-        elif shape == "Rectangle":
-            SHR = np.random.normal(1.02, 0.10)
-            WHR = np.random.normal(0.88, 0.06)   # 0.78 – 0.98
-        elif shape == "Pear":
-            SHR = np.random.normal(0.82, 0.07)   # 0.68 – 0.95
-            WHR = np.random.normal(0.85, 0.07)
-        elif shape == "Apple":
-            SHR = np.random.normal(1.05, 0.12)
-            WHR = np.random.normal(0.95, 0.08)   # waist dominant
-        elif shape == "Inverted Triangle":
-            SHR = np.random.normal(1.35, 0.15)   # 1.15 – 1.80
-            WHR = np.random.normal(1.10, 0.12)   # wider waist too
-        
-        # Clip to realistic bounds
-        SHR = np.clip(SHR, 0.65, 2.4)
-        WHR = np.clip(WHR, 0.60, 1.8)
-        
-        # Add natural measurement noise
-        SHR += np.random.normal(0, 0.03)
-        WHR += np.random.normal(0, 0.04)
-        
-        # Compute absolute widths (torso-height normalized)
-        hip_width = np.random.normal(0.62, 0.08)
-        shoulder_width = hip_width * SHR
-        waist_width = hip_width * WHR
-        
-        # Reason string
-        if shape == "Hourglass":
-            reason = f"Balanced shoulders/hips, defined waist (W/H={WHR:.2f})"
-        elif shape == "Rectangle":
-            reason = f"Straight silhouette (W/H={WHR:.2f})"
-        elif shape == "Pear":
-            reason = f"Hips significantly wider (S/H={SHR:.2f})"
-        elif shape == "Apple":
-            reason = f"Waist dominant (W/H={WHR:.2f})"
-        else:
-            reason = f"Shoulders much wider (S/H={SHR:.2f})"
-            
-        data.append({
-            "filename": fname,
-            "body_shape": shape,
-            "shoulder_width": round(shoulder_width, 4),
-            "hip_width": round(hip_width, 4),
-            "waist_width": round(waist_width, 4),
-            "SHR": round(SHR, 4),
-            "WHR": round(WHR, 4),
-            "shape_reason": f"SHR={SHR:.3f}, WHR={WHR:.3f} | {reason}"
-        })
-    return data
-
-# Generate balanced dataset
-all_data = []
-for shape in ["Hourglass", "Rectangle", "Pear", "Apple", "Inverted Triangle"]:
-    all_data += generate_class(shape, n=220)  # 220 × 5 = 1100
-
-df = pd.DataFrame(all_data)
-df = df.sample(frac=1, random_state=42).reset_index(drop=True)  # shuffle
-
-OUT = Path("labels") / "body_shapes_synthetic_balanced_1100.csv"
-OUT.parent.mkdir(exist_ok=True)
-df.to_csv(OUT, index=False)
-
-# Print distribution
-print(df["body_shape"].value_counts().sort_index())
-print(f"\nSaved {len(df)} realistic synthetic samples → {OUT}")
\ No newline at end of file
+ROOT = Path(__file__).resolve().parent.parent
+OUT = ROOT / "labels" / "body_shapes_synthetic_balanced_1100.csv"
+
+SEED = 42
+PER_CLASS = 220  # 220 × 5 = 1100
+CHUNK_ROWS = 1_000_000
+
+SHAPES = ["Hourglass", "Rectangle", "Pear", "Apple", "Inverted Triangle"]
+
+# shape -> (SHR mean, SHR std, WHR mean, WHR std)
+SHAPE_PARAMS = {
+    "Hourglass":         (1.00, 0.08, 0.72, 0.05),   # SHR 0.85 – 1.15, WHR 0.62 – 0.82
+    "Rectangle":         (1.02, 0.10, 0.88, 0.06),   # WHR 0.78 – 0.98
+    "Pear":              (0.82, 0.07, 0.85, 0.07),   # SHR 0.68 – 0.95
+    "Apple":             (1.05, 0.12, 0.95, 0.08),   # waist dominant
+    "Inverted Triangle": (1.35, 0.15, 1.10, 0.12),   # SHR 1.15 – 1.80, wider waist too
+}
+
+# shape -> (reason prefix, ratio shown, reason suffix)
+SHAPE_REASONS = {
+    "Hourglass":         ("Balanced shoulders/hips, defined waist (W/H=", "WHR", ")"),
+    "Rectangle":         ("Straight silhouette (W/H=", "WHR", ")"),
+    "Pear":              ("Hips significantly wider (S/H=", "SHR", ")"),
+    "Apple":             ("Waist dominant (W/H=", "WHR", ")"),
+    "Inverted Triangle": ("Shoulders much wider (S/H=", "SHR", ")"),
+}
+
+# (prefix, zero-pad width or 0, suffix)
+FILENAME_TEMPLATES = [
+    ("img_", 6, ".jpg"), ("photo_", 0, ".jpeg"), ("", 0, ".jpg"),
+    ("stand_", 5, ".jpg"), ("model_", 0, ".jpg"), ("person_", 4, ".jpg"),
+    ("fullbody_", 0, ".jpg"), ("pose_", 3, ".jpeg"), ("", 12, ".jpg"),
+    ("user_upload_", 0, ".jpg"), ("pic_", 7, ".jpg"), ("body_", 5, ".png"),
+]
+
+COLUMNS = ["filename", "body_shape", "shoulder_width", "hip_width", "waist_width", "SHR", "WHR", "shape_reason"]
+
+
+def ascii_digits(q, width):
+    """Zero-padded ASCII digits of non-negative ints as an S<width> array (pure array math)."""
+    out = np.empty((len(q), width), dtype=np.uint8)
+    x = np.asarray(q, dtype=np.int64).copy()
+    for i in range(width - 1, -1, -1):
+        out[:, i] = 48 + x % 10
+        x //= 10
+    return out.view(f"S{width}").ravel()
+
+
+def fmt_int(q, width=0):
+    """ASCII ints, zero-padded to width (or plain when width is 0)."""
+    q = np.asarray(q, dtype=np.int64)
+    ndigits = len(str(int(q.max()))) if len(q) else 1
+    d = np.char.lstrip(ascii_digits(q, ndigits), b"0")
+    if width:
+        return np.char.zfill(d, width)
+    d[d == b""] = b"0"
+    return d
+
+
+def fmt_fixed(x, decimals):
+    """ASCII floats with a fixed number of decimals, like f"{x:.{decimals}f}" but vectorized."""
+    scale = 10 ** decimals
+    q = np.rint(np.asarray(x, dtype=np.float64) * scale).astype(np.int64)
+    sign = np.where(q < 0, b"-", b"")
+    q = np.abs(q)
+    body = np.char.add(np.char.add(fmt_int(q // scale), b"."), ascii_digits(q % scale, decimals))
+    return np.char.add(sign, body)
+
+
+def concat_into(n, sel_parts):
+    """Scatter per-selection byte-string pieces into one S array sized to the longest piece."""
+    width = max((p.dtype.itemsize for _, p in sel_parts), default=1)
+    out = np.empty(n, dtype=f"S{width}")
+    for sel, part in sel_parts:
+        out[sel] = part
+    return out
+
+
+def name_scramble(total, seed):
+    """(A, B, M) for n -> (n*A + B) % M + 1, a bijection on [0, M) with M >= 10**6."""
+    digits = max(6, len(str(total)) + 1)
+    m = 10 ** digits
+    rng = np.random.default_rng(np.random.SeedSequence([seed, 0x6E616D65]))
+    a = int(rng.integers(m // 10, m))
+    while math.gcd(a, m) != 1:
+        a += 1
+    b = int(rng.integers(0, m))
+    return a, b, m
+
+
+def make_filenames(global_idx, template_idx, scramble):
+    """Unique filenames: distinct scrambled numbers rendered through the templates."""
+    a, b, m = scramble
+    if m * m < 2**63:
+        num = (global_idx * a + b) % m + 1
+    else:
+        # (g*a + b) % m would overflow int64; fall back to Python ints
+        num = ((global_idx.astype(object) * a + b) % m + 1).astype(np.int64)
+    parts = []
+    for t, (prefix, width, suffix) in enumerate(FILENAME_TEMPLATES):
+        sel = template_idx == t
+        if sel.any():
+            digits = fmt_int(num[sel], width)
+            parts.append((sel, np.char.add(np.char.add(prefix.encode(), digits), suffix.encode())))
+    return concat_into(len(num), parts).astype(str)
+
+
+def generate_chunk(chunk_idx, start, stop, seed, scramble):
+    """All columns for global rows [start, stop) as a dict of arrays."""
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(chunk_idx,))))
+    g = np.arange(start, stop, dtype=np.int64)
+    g = g[rng.permutation(len(g))]            # shuffle within the chunk
+    cls = g % len(SHAPES)                     # exact balance over the whole run
+    n = len(g)
+
+    SHR = np.empty(n)
+    WHR = np.empty(n)
+    for c, shape in enumerate(SHAPES):
+        sel = cls == c
+        m = int(sel.sum())
+        s_mu, s_sd, w_mu, w_sd = SHAPE_PARAMS[shape]
+        SHR[sel] = rng.normal(s_mu, s_sd, m)
+        WHR[sel] = rng.normal(w_mu, w_sd, m)
+
+    # Clip to realistic bounds
+    SHR = np.clip(SHR, 0.65, 2.4)
+    WHR = np.clip(WHR, 0.60, 1.8)
+
+    # Add natural measurement noise
+    SHR += rng.normal(0, 0.03, n)
+    WHR += rng.normal(0, 0.04, n)
+
+    # Compute absolute widths (torso-height normalized)
+    hip_width = rng.normal(0.62, 0.08, n)
+    shoulder_width = hip_width * SHR
+    waist_width = hip_width * WHR
+
+    template_idx = rng.integers(0, len(FILENAME_TEMPLATES), n)
+
+    # Reason string
+    shr3, whr3 = fmt_fixed(SHR, 3), fmt_fixed(WHR, 3)
+    shr2, whr2 = fmt_fixed(SHR, 2), fmt_fixed(WHR, 2)
+    parts = []
+    for c, shape in enumerate(SHAPES):
+        sel = cls == c
+        prefix, ratio, suffix = SHAPE_REASONS[shape]
+        shown = shr2[sel] if ratio == "SHR" else whr2[sel]
+        parts.append((sel, np.char.add(np.char.add(prefix.encode(), shown), suffix.encode())))
+    reason = concat_into(n, parts)
+    shape_reason = np.char.add(
+        np.char.add(np.char.add(b"SHR=", shr3), np.char.add(b", WHR=", whr3)),
+        np.char.add(b" | ", reason),
+    ).astype(str)
+
+    return {
+        "filename": make_filenames(g, template_idx, scramble),
+        "body_shape": np.asarray(SHAPES)[cls],
+        "shoulder_width": np.round(shoulder_width, 4),
+        "hip_width": np.round(hip_width, 4),
+        "waist_width": np.round(waist_width, 4),
+        "SHR": np.round(SHR, 4),
+        "WHR": np.round(WHR, 4),
+        "shape_reason": shape_reason,
+    }
+
+
+def write_chunk(job):
+    """Generate one chunk and write it to its part file/dir. Runs in a worker process."""
+    chunk_idx, start, stop, seed, scramble, fmt, part_path = job
+    cols = generate_chunk(chunk_idx, start, stop, seed, scramble)
+    part_path = Path(part_path)
+    if fmt == "npy":
+        part_path.mkdir(parents=True, exist_ok=True)
+        for k in COLUMNS:
+            np.save(part_path / f"{k}.npy", cols[k])
+    else:
+        pd.DataFrame(cols, columns=COLUMNS).to_csv(part_path, index=False)
+    return stop - start
+
+
+def generate(per_class=PER_CLASS, seed=SEED, out=OUT, fmt="csv", workers=1, chunk_rows=CHUNK_ROWS):
+    """Generate per_class rows per shape and write them chunk by chunk. Returns the row count."""
+    if per_class < 1 or chunk_rows < 1:
+        raise ValueError("per_class and chunk_rows must be >= 1")
+    out = Path(out)
+    total = per_class * len(SHAPES)
+    scramble = name_scramble(total, seed)
+    bounds = [(i, s, min(s + chunk_rows, total)) for i, s in enumerate(range(0, total, chunk_rows))]
+
+    if fmt == "npy":
+        if out.exists():
+            shutil.rmtree(out)
+        out.mkdir(parents=True)
+        part_paths = [out / f"chunk-{i:05d}" for i, _, _ in bounds]
+    else:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        part_dir = out.with_name(out.name + ".parts")
+        part_dir.mkdir(exist_ok=True)
+        part_paths = [part_dir / f"part-{i:05d}.csv" for i, _, _ in bounds]
+
+    jobs = [(i, s, e, seed, scramble, fmt, str(p)) for (i, s, e), p in zip(bounds, part_paths)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(write_chunk, jobs))
+    else:
+        for job in jobs:
+            write_chunk(job)
+
+    if fmt == "npy":
+        meta = {"columns": COLUMNS, "rows": total, "chunks": len(bounds), "seed": seed, "per_class": per_class}
+        (out / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    else:
+        # stitch the parts in chunk order, keeping only the first header
+        with open(out, "wb") as dst:
+            for i, p in enumerate(part_paths):
+                with open(p, "rb") as src:
+                    if i > 0:
+                        src.readline()
+                    shutil.copyfileobj(src, dst)
+        shutil.rmtree(part_paths[0].parent)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate balanced synthetic body-shape rows.")
+    ap.add_argument("--per-class", type=int, default=PER_CLASS)
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--out", type=Path, default=OUT, help="CSV file, or directory for --format npy")
+    ap.add_argument("--format", choices=["csv", "npy"], default="csv")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help="rows per chunk (part of the seed layout; changing it changes the data)")
+    args = ap.parse_args()
+    if args.per_class < 1 or args.chunk_rows < 1:
+        ap.error("--per-class and --chunk-rows must be >= 1")
+
+    total = generate(args.per_class, args.seed, args.out, args.format, args.workers, args.chunk_rows)
+
+    if args.format == "csv" and total <= CHUNK_ROWS:
+        # Print distribution
+        df = pd.read_csv(args.out, usecols=["body_shape"])
+        print(df["body_shape"].value_counts().sort_index())
+    print(f"\nSaved {total} realistic synthetic samples → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
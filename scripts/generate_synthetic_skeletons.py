@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+generate_synthetic_skeletons.py
+Generates balanced, full (33, 4) torso-normalized synthetic skeletons per body shape
+
+generate_synthetic_body_data.py only emits widths and ratios; these rows are
+whole skeletons in the extract_landmarks.py format, so they go through
+auto_label_body_shape.py (and any landmark model) exactly like real data.
+
+How a skeleton is built (all rows of a class at once):
+ 1. Pose model: mean + principal components (95% of the variance) of the real
+    torso-normalized xyz landmarks. A sample is mean + N(0, sd) * components;
+    visibility is copied from a random real skeleton.
+ 2. Per class, SHR/WHR are drawn from generate_synthetic_body_data.SHAPE_PARAMS
+    and the hip width from the real hip-width distribution.
+ 3. Shoulders (11/12) and hips (23/24) are rebuilt around the sampled
+    mid-shoulder / mid-hip points with those widths (left side = larger x),
+    and arm/leg chains move with their shoulder/hip joint.
+ 4. The result is re-normalized with landmark_store.normalize_tensor.
+ 5. Each candidate is labeled with auto_label_body_shape.classify; only those
+    that land in their target class are kept, and the class is resampled
+    until it is full. A class that cannot be produced raises ValueError
+    instead of being written under the wrong name.
+
+WHR in landmark space: the waist is interpolated between the shoulder and hip
+lines (see auto_label_body_shape.body_ratios), so with parallel lines it is
+always (1 + SHR) / 2. The only way to narrow it is an in-plane angle between
+the shoulder and hip lines; that angle is solved per row towards the target
+WHR but capped at the TWIST_PERCENTILE-th percentile of the real skeletons'
+angle, so poses stay in distribution. Hourglass (WHR <= 0.78 at SHR ~ 1)
+would need ~77 degrees and is therefore not in DEFAULT_SHAPES; asking for it
+with --shapes fails. Targets and achieved ratios are both written to the
+targets CSV.
+
+Output:
+ - processed/landmarks-synthetic/body_landmarks_synthetic.csv  (same layout as the real CSV)
+ - processed/landmarks-synthetic/<stem>.json                    (per-image JSON, skip with --no-json)
+ - processed/landmarks-synthetic/synthetic_targets.csv          (class, target vs achieved SHR/WHR)
+
+Examples:
+    python scripts/generate_synthetic_skeletons.py
+    python scripts/generate_synthetic_skeletons.py --per-class 20000 --no-json
+    python scripts/auto_label_body_shape.py --landmarks processed/landmarks-synthetic/body_landmarks_synthetic.csv \
+        --out labels/body_shapes_synthetic_skeletons.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from auto_label_body_shape import WAIST_FRACTIONS, body_ratios, classify
+from generate_synthetic_body_data import SHAPE_PARAMS, SHAPES
+from landmark_store import (
+    LANDMARK_CSV, LH, LS, N_LANDMARKS, RH, RS,
+    landmarks_frame, load_landmarks, normalize_tensor, write_landmark_json,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+OUT_DIR = ROOT / "processed" / "landmarks-synthetic"
+OUT_CSV = OUT_DIR / "body_landmarks_synthetic.csv"
+TARGETS_CSV = OUT_DIR / "synthetic_targets.csv"
+
+SEED = 42
+PER_CLASS = 220
+CHUNK_ROWS = 100_000
+
+VARIANCE_KEPT = 0.95
+TWIST_PERCENTILE = 95     # twist cap: this percentile of the real shoulder/hip line angle
+MIN_HIP_WIDTH = 0.2
+
+# landmarks that follow each torso joint (MediaPipe Pose indices)
+LEFT_ARM = [13, 15, 17, 19, 21]
+RIGHT_ARM = [14, 16, 18, 20, 22]
+LEFT_LEG = [25, 27, 29, 31]
+RIGHT_LEG = [26, 28, 30, 32]
+
+TARGET_COLUMNS = ["filename", "body_shape", "target_SHR", "target_WHR", "SHR", "WHR", "twist_deg"]
+
+# classes whose classify() region is reachable with an in-distribution twist (see above)
+DEFAULT_SHAPES = [s for s in SHAPES if s != "Hourglass"]
+
+# rejection sampling: give up on a class after PROBE_ROWS candidates with no hit,
+# or MAX_TRIES_PER_ROW candidates per requested row
+PROBE_ROWS = 20_000
+MAX_TRIES_PER_ROW = 200
+MAX_DRAW = 50_000         # candidates per draw (bounds memory)
+
+
+class PoseModel:
+    """Linear (PCA) model of real torso-normalized xyz landmarks."""
+
+    def __init__(self, lm, variance_kept=VARIANCE_KEPT):
+        lm = np.asarray(lm, dtype=np.float64)
+        X = lm[..., :3].reshape(len(lm), -1)
+        self.mean = X.mean(axis=0)
+        _, s, vt = np.linalg.svd(X - self.mean, full_matrices=False)
+        var = s ** 2
+        k = int(np.searchsorted(np.cumsum(var) / var.sum(), variance_kept)) + 1
+        self.components = vt[:k]
+        self.sd = s[:k] / np.sqrt(max(len(X) - 1, 1))
+        self.visibility = lm[..., 3]
+        hip = body_ratios(lm)["hip_width"]
+        self.hip_mean, self.hip_sd = float(hip.mean()), float(hip.std())
+        s = lm[:, LS, :2] - lm[:, RS, :2]
+        h = lm[:, LH, :2] - lm[:, RH, :2]
+        angle = np.abs(np.degrees(np.arctan2(s[:, 1], s[:, 0]) - np.arctan2(h[:, 1], h[:, 0]))) % 360
+        self.max_twist_deg = float(np.percentile(np.minimum(angle, 360 - angle), TWIST_PERCENTILE))
+
+    def sample(self, n, rng):
+        """(n, 33, 4) poses: PCA sample for xyz, bootstrapped real visibility."""
+        z = rng.standard_normal((n, len(self.sd))) * self.sd
+        xyz = (self.mean + z @ self.components).reshape(n, N_LANDMARKS, 3)
+        vis = self.visibility[rng.integers(0, len(self.visibility), n)]
+        return np.concatenate([xyz, vis[..., None]], axis=2)
+
+
+def waist_width(S, H, cos_twist):
+    """Mean interpolated waist width (as in body_ratios) for widths S, H at a given line angle."""
+    t = np.asarray(WAIST_FRACTIONS)[:, None]
+    sq = (1 - t) ** 2 * S ** 2 + t ** 2 * H ** 2 + 2 * t * (1 - t) * S * H * cos_twist
+    return np.sqrt(np.maximum(sq, 0)).mean(axis=0)
+
+
+def solve_twist(S, H, W, max_twist_deg, iters=40):
+    """Per-row cos(angle) between shoulder and hip lines giving waist width W, capped at max_twist_deg."""
+    lo = np.full_like(S, np.cos(np.radians(max_twist_deg)))
+    hi = np.ones_like(S)
+    for _ in range(iters):
+        mid = (lo + hi) / 2
+        too_wide = waist_width(S, H, mid) > W   # width grows with cos
+        hi = np.where(too_wide, mid, hi)
+        lo = np.where(too_wide, lo, mid)
+    return (lo + hi) / 2
+
+
+def shape_skeletons(base, S, H, cos_twist, rng):
+    """Rebuild shoulders/hips of (n,33,4) base poses with widths S, H and the given line angle."""
+    out = base.copy()
+    mid_s = (base[:, LS, :2] + base[:, RS, :2]) / 2
+    mid_h = (base[:, LH, :2] + base[:, RH, :2]) / 2
+    hip_dir = base[:, LH, :2] - base[:, RH, :2]
+    phi = np.arctan2(hip_dir[:, 1], hip_dir[:, 0])
+    phi = np.where(hip_dir[:, 0] > 0, phi, 0.0)   # keep left hip on the +x side
+    twist = np.arccos(np.clip(cos_twist, -1, 1)) * rng.choice([-1.0, 1.0], len(S))
+
+    h_half = (H / 2)[:, None] * np.stack([np.cos(phi), np.sin(phi)], axis=1)
+    s_half = (S / 2)[:, None] * np.stack([np.cos(phi + twist), np.sin(phi + twist)], axis=1)
+    new = {LS: mid_s + s_half, RS: mid_s - s_half, LH: mid_h + h_half, RH: mid_h - h_half}
+
+    for joint, chain in ((LS, LEFT_ARM), (RS, RIGHT_ARM), (LH, LEFT_LEG), (RH, RIGHT_LEG)):
+        delta = new[joint] - base[:, joint, :2]
+        out[:, chain, :2] += delta[:, None, :]
+        out[:, joint, :2] = new[joint]
+    return out, np.degrees(twist)
+
+
+def draw_candidates(model, shape, m, rng):
+    """m candidate skeletons aimed at one class: (target SHR, target WHR, normalized lm, twist_deg)."""
+    s_mu, s_sd, w_mu, w_sd = SHAPE_PARAMS[shape]
+    SHR = np.clip(rng.normal(s_mu, s_sd, m), 0.65, 2.4)
+    WHR = np.clip(rng.normal(w_mu, w_sd, m), 0.60, 1.8)
+
+    H = np.maximum(rng.normal(model.hip_mean, model.hip_sd, m), MIN_HIP_WIDTH)
+    S = H * SHR
+    cos_twist = solve_twist(S, H, H * WHR, model.max_twist_deg)
+
+    raw, twist_deg = shape_skeletons(model.sample(m, rng), S, H, cos_twist, rng)
+    lm, _ = normalize_tensor(raw)
+    return SHR, WHR, lm, twist_deg
+
+
+def sample_class(model, shape, n, rng):
+    """n skeletons that classify() as shape: (target SHR, target WHR, lm, twist_deg); ValueError if unreachable."""
+    parts, got, tried = [], 0, 0
+    while got < n:
+        if (got == 0 and tried >= PROBE_ROWS) or tried >= MAX_TRIES_PER_ROW * n:
+            raise ValueError(f"cannot produce {shape} skeletons: {got} of {tried} candidates classify as "
+                             f"{shape} (twist capped at {model.max_twist_deg:.1f} degrees)")
+        rate = got / tried if got else 0.05
+        m = int(min(MAX_DRAW, max(64, np.ceil((n - got) / rate * 1.2))))
+        SHR, WHR, lm, twist_deg = draw_candidates(model, shape, m, rng)
+        r = body_ratios(lm)
+        keep = np.array([np.isfinite(a) and np.isfinite(b) and classify(a, b) == shape
+                         for a, b in zip(r["SHR"], r["WHR"])], dtype=bool)
+        parts.append((SHR[keep], WHR[keep], lm[keep], twist_deg[keep]))
+        got += int(keep.sum())
+        tried += m
+    return tuple(np.concatenate(col)[:n] for col in zip(*parts))
+
+
+def generate_chunk(model, chunk_idx, start, stop, seed, shapes=DEFAULT_SHAPES):
+    """Skeletons for global rows [start, stop): (filenames, (n,33,4) normalized, targets DataFrame)."""
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(chunk_idx,))))
+    g = np.arange(start, stop, dtype=np.int64)
+    g = g[rng.permutation(len(g))]
+    cls = g % len(shapes)
+    n = len(g)
+
+    SHR = np.empty(n)
+    WHR = np.empty(n)
+    twist_deg = np.empty(n)
+    lm = np.empty((n, N_LANDMARKS, 4))
+    for c, shape in enumerate(shapes):
+        sel = cls == c
+        if sel.any():
+            SHR[sel], WHR[sel], lm[sel], twist_deg[sel] = sample_class(model, shape, int(sel.sum()), rng)
+
+    shape_names = np.asarray(shapes)[cls]
+    slugs = np.char.replace(np.char.lower(shape_names), " ", "_")
+    filenames = np.char.add(np.char.add(np.char.add("synth_", slugs), "_"),
+                            np.char.zfill(g.astype(str), 7))
+    filenames = np.char.add(filenames, ".jpg")
+
+    got = body_ratios(lm)
+    targets = pd.DataFrame({
+        "filename": filenames,
+        "body_shape": shape_names,
+        "target_SHR": np.round(SHR, 4),
+        "target_WHR": np.round(WHR, 4),
+        "SHR": np.round(got["SHR"], 4),
+        "WHR": np.round(got["WHR"], 4),
+        "twist_deg": np.round(twist_deg, 2),
+    }, columns=TARGET_COLUMNS)
+    return filenames, lm, targets
+
+
+def generate(per_class=PER_CLASS, seed=SEED, out_dir=OUT_DIR, landmarks=LANDMARK_CSV,
+             write_json=True, chunk_rows=CHUNK_ROWS, shapes=DEFAULT_SHAPES):
+    """
+    Fit the pose model on the real store and write per_class skeletons per
+    shape. Returns the row count; ValueError if a shape cannot be produced.
+    """
+    _, real = load_landmarks(landmarks)
+    if len(real) < 2:
+        raise ValueError(f"need real skeletons in {landmarks} to fit the pose model")
+    model = PoseModel(real)
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_csv = out_dir / OUT_CSV.name
+    targets_csv = out_dir / TARGETS_CSV.name
+
+    total = per_class * len(shapes)
+    for i, start in enumerate(range(0, total, chunk_rows)):
+        stop = min(start + chunk_rows, total)
+        filenames, lm, targets = generate_chunk(model, i, start, stop, seed, shapes)
+        mode, header = ("w", True) if i == 0 else ("a", False)
+        landmarks_frame(filenames, lm).to_csv(out_csv, index=False, mode=mode, header=header)
+        targets.to_csv(targets_csv, index=False, mode=mode, header=header)
+        if write_json:
+            for name, sk in zip(filenames, lm):
+                write_landmark_json(out_dir / f"{Path(name).stem}.json", sk)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate balanced synthetic torso-normalized skeletons.")
+    ap.add_argument("--per-class", type=int, default=PER_CLASS)
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    ap.add_argument("--landmarks", type=Path, default=LANDMARK_CSV, help="real landmark CSV to fit the pose model on")
+    ap.add_argument("--no-json", action="store_true", help="skip the per-image JSON files")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help="rows per chunk (part of the seed layout; changing it changes the data)")
+    ap.add_argument("--shapes", nargs="+", choices=SHAPES, default=DEFAULT_SHAPES,
+                    help="classes to generate (Hourglass is unreachable, see the module docstring)")
+    args = ap.parse_args()
+
+    try:
+        total = generate(args.per_class, args.seed, args.out_dir, args.landmarks, not args.no_json,
+                         args.chunk_rows, args.shapes)
+    except ValueError as e:
+        raise SystemExit(f"[ERR] {e}")
+
+    targets = pd.read_csv(args.out_dir / TARGETS_CSV.name)
+    err = (targets["WHR"] - targets["target_WHR"]).abs()
+    print(targets.groupby("body_shape")[["target_SHR", "SHR", "target_WHR", "WHR"]].mean().round(3))
+    print(f"\nWHR within 0.01 of target: {(err <= 0.01).mean() * 100:.1f}% "
+          "(every row classifies as its body_shape)")
+    print(f"Saved {total} synthetic skeletons → {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+image_header.py
+
+Image format and dimensions from the file header only — no decode, and
+usually a few hundred bytes of I/O (JPEG reads until its SOF marker).
+
+    from image_header import read_header
+    info = read_header("raw/body/x.jpg")   # ImageHeader(format="jpeg", width=1080, height=1620) or None
+
+Supports JPEG, PNG, GIF, WebP (VP8/VP8L/VP8X) and BMP. Returns None for
+unknown or truncated files, so it doubles as a cheap "is this an image" check.
+"""
+import struct
+from collections import namedtuple
+
+ImageHeader = namedtuple("ImageHeader", ["format", "width", "height"])
+
+# SOFn markers that carry frame dimensions (C4 = DHT, C8 = JPG, CC = DAC are not frames)
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg(f):
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        while b and b != b"\xff":        # resync to the next marker
+            b = f.read(1)
+        while b == b"\xff":              # skip fill bytes
+            b = f.read(1)
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:   # no length field
+            continue
+        if marker == 0xD9:               # EOI before any frame
+            return None
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack(">H", seg)[0]
+        if marker in JPEG_SOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            _, h, w = struct.unpack(">BHH", data)
+            return ImageHeader("jpeg", w, h)
+        f.seek(length - 2, 1)
+
+
+def _webp(head):
+    chunk = head[12:16]
+    if chunk == b"VP8X" and len(head) >= 30:
+        w = 1 + int.from_bytes(head[24:27], "little")
+        h = 1 + int.from_bytes(head[27:30], "little")
+        return ImageHeader("webp", w, h)
+    if chunk == b"VP8L" and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], "little")
+        return ImageHeader("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8 " and len(head) >= 30:
+        w, h = struct.unpack("<HH", head[26:30])
+        return ImageHeader("webp", w & 0x3FFF, h & 0x3FFF)
+    return None
+
+
+def read_header(path):
+    """ImageHeader(format, width, height) from the file header, or None if unrecognized."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(32)
+            if head[:3] == b"\xff\xd8\xff":
+                return _jpeg(f)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                w, h = struct.unpack(">II", head[16:24])
+                return ImageHeader("png", w, h)
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                w, h = struct.unpack("<HH", head[6:10])
+                return ImageHeader("gif", w, h)
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return _webp(head)
+            if head[:2] == b"BM" and len(head) >= 26:
+                w, h = struct.unpack("<ii", head[18:26])
+                return ImageHeader("bmp", w, abs(h))
+    except (OSError, struct.error):
+        return None
+    return None
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+instrumentation.py
+
+Shared per-stage telemetry for the pipeline scripts, replacing one print per image:
+ - timers:    with tel.time("decode"): ...   (decode / inference / encode / write ...)
+ - counters:  tel.count("no_person")
+ - progress:  tel.advance() once per item; a rate-limited progress line on
+              stderr (in place on a TTY, every LOG_INTERVAL s otherwise)
+ - metrics:   JSON-lines records (progress + a final summary with items/s,
+              timers, counters and peak RSS) appended to --metrics
+ - profiling: --profile cprofile (pstats file) or --profile sample (a
+              dependency-free stack sampler writing collapsed stacks, the
+              input format of flamegraph.pl / speedscope)
+
+Per-item lines are still available with --verbose (tel.log), warnings
+always print (tel.warn).
+
+Usage:
+    from instrumentation import Telemetry, add_arguments
+    add_arguments(ap)
+    args = ap.parse_args()
+    with Telemetry.from_args(args, "landmarks", total=len(paths)) as tel:
+        for path in paths:
+            with tel.time("decode"):
+                img = cv2.imread(str(path))
+            ...
+            tel.advance()
+
+Environment defaults (flags override): STYLEMATE_METRICS, STYLEMATE_PROFILE.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+PROFILE_DIR = ROOT / ".pipeline" / "profiles"
+
+PROGRESS_INTERVAL = 0.5    # s between in-place TTY updates
+LOG_INTERVAL = 10.0        # s between progress lines when stderr is not a TTY
+METRICS_INTERVAL = 10.0    # s between "progress" records in the metrics file
+SAMPLE_INTERVAL = 0.005    # s between stack samples for --profile sample
+PROFILERS = ("cprofile", "sample")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread; writes collapsed stacks."""
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class Telemetry:
+    """Timers, counters, progress and metrics for one stage run."""
+
+    def __init__(self, stage, total=None, metrics=None, profile=None, verbose=False, progress=True,
+                 stream=None):
+        if profile not in (None, *PROFILERS):
+            raise ValueError(f"profile must be one of {PROFILERS}")
+        self.stage = stage
+        self.total = total
+        self.metrics = Path(metrics) if metrics else None
+        self.profile = profile
+        self.verbose = verbose
+        self.progress = progress
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+
+        self.items = 0
+        self.timers = defaultdict(float)
+        self.counters = Counter()
+        self.start = time.perf_counter()
+        self._last_progress = self._last_metrics = self.start
+        self._profiler = None
+        self.profile_path = None
+
+    @classmethod
+    def from_args(cls, args, stage, total=None, **kw):
+        return cls(stage, total=total, metrics=getattr(args, "metrics", None),
+                   profile=getattr(args, "profile", None), verbose=getattr(args, "verbose", False), **kw)
+
+    # -- context manager: profiler + final summary --------------------
+    def __enter__(self):
+        if self.profile:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            ext = "prof" if self.profile == "cprofile" else "collapsed"
+            self.profile_path = PROFILE_DIR / f"{self.stage}-{stamp}.{ext}"
+            if self.profile == "cprofile":
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            else:
+                self._profiler = StackSampler()
+                self._profiler.start()
+        self.start = self._last_progress = self._last_metrics = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is not None:
+            if self.profile == "cprofile":
+                self._profiler.disable()
+                self._profiler.dump_stats(self.profile_path)
+            else:
+                self._profiler.stop(self.profile_path)
+            self._profiler = None
+        summary = self.summary()
+        if exc_type is not None:
+            summary["error"] = f"{exc_type.__name__}: {exc}"
+        self._emit("summary", summary)
+        if self.progress:
+            self._end_progress_line()
+            print(self.format_summary(summary), file=self.stream)
+        return False
+
+    # -- recording -----------------------------------------------------
+    @contextlib.contextmanager
+    def time(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - t
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def advance(self, n=1):
+        """Mark n items done; refreshes progress/metrics at most once per interval."""
+        self.items += n
+        now = time.perf_counter()
+        if self.progress and now - self._last_progress >= (PROGRESS_INTERVAL if self.tty else LOG_INTERVAL):
+            self._last_progress = now
+            self._show_progress(now)
+        if self.metrics and now - self._last_metrics >= METRICS_INTERVAL:
+            self._last_metrics = now
+            self._emit("progress", self.summary())
+
+    def log(self, msg):
+        """Per-item detail, only with --verbose."""
+        if self.verbose:
+            self._end_progress_line()
+            print(msg, file=self.stream)
+
+    def warn(self, msg):
+        self._end_progress_line()
+        print(msg, file=self.stream)
+
+    # -- output ----------------------------------------------------------
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return {
+            "stage": self.stage,
+            "items": self.items,
+            "total": self.total,
+            "elapsed_s": round(elapsed, 3),
+            "items_per_s": round(self.items / elapsed, 3) if elapsed > 0 else None,
+            "timers_s": {k: round(v, 4) for k, v in sorted(self.timers.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "peak_rss_mb": peak_rss_mb(),
+            "profile": str(self.profile_path) if self.profile_path else None,
+        }
+
+    def format_summary(self, s):
+        timers = ", ".join(f"{k} {v:.1f}s" for k, v in s["timers_s"].items())
+        counters = ", ".join(f"{k}={v}" for k, v in s["counters"].items())
+        rate = f"{s['items_per_s']:.1f}/s" if s["items_per_s"] is not None else "-"
+        parts = [f"[{self.stage}] {s['items']} items in {s['elapsed_s']:.1f}s ({rate})"]
+        if timers:
+            parts.append(timers)
+        if counters:
+            parts.append(counters)
+        if s["peak_rss_mb"] is not None:
+            parts.append(f"peak RSS {s['peak_rss_mb']:.0f} MB")
+        if s["profile"]:
+            parts.append(f"profile → {s['profile']}")
+        return " | ".join(parts)
+
+    def _show_progress(self, now):
+        elapsed = now - self.start
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        done = f"{self.items}/{self.total}" if self.total else str(self.items)
+        eta = ""
+        if self.total and rate > 0:
+            eta = f" ETA {max(self.total - self.items, 0) / rate:.0f}s"
+        line = f"[{self.stage}] {done} {rate:.1f}/s{eta}"
+        if self.tty:
+            self.stream.write("\r" + line.ljust(60))
+            self._open_line = True
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def _end_progress_line(self):
+        if getattr(self, "_open_line", False):
+            self.stream.write("\n")
+            self._open_line = False
+
+    def _emit(self, event, record):
+        if not self.metrics:
+            return
+        self.metrics.parent.mkdir(parents=True, exist_ok=True)
+        record = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "event": event, **record}
+        with open(self.metrics, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def add_arguments(ap):
+    """Add --metrics/--profile/--verbose to a script's argument parser."""
+    g = ap.add_argument_group("instrumentation")
+    g.add_argument("--metrics", type=Path, default=os.environ.get("STYLEMATE_METRICS") or None,
+                   help="append JSON-lines metrics to this file (env STYLEMATE_METRICS)")
+    g.add_argument("--profile", choices=PROFILERS, default=os.environ.get("STYLEMATE_PROFILE") or None,
+                   help=f"profile the stage into {PROFILE_DIR.relative_to(ROOT)}/ (env STYLEMATE_PROFILE)")
+    g.add_argument("--verbose", action="store_true", help="print one line per item")
+    return g
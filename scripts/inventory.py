@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+inventory.py
+
+Persistent SQLite index of every raw and processed asset (.pipeline/inventory.sqlite):
+ - assets:      path, kind, size, mtime, inode, format, width, height, sha256
+                kinds: raw_body, raw_skin, skin_patch, landmark_json
+ - labels:      filename → label from the label CSVs (body_shape, skin_tone,
+                skin_tone_suggested)
+ - raw_status:  view with per-stage status of every raw image
+                (has_landmarks, has_patch, has_body_label, has_skin_label)
+
+Refreshing is incremental:
+ - quick (default for queries): only directories whose mtime changed are
+   re-listed, which catches added/removed/renamed files; label CSVs are
+   reloaded only when their size/mtime changed
+ - full (scan --full): re-stat every file to also catch in-place edits
+Only new or changed files (size, mtime_ns, inode) are opened: dimensions
+come from the header (image_header.py, no decode) and the SHA-256 is hashed
+on a thread pool. Queries then read the index and never walk the tree.
+
+Usage:
+    python scripts/inventory.py scan [--full] [--no-hash]
+    python scripts/inventory.py stats
+    python scripts/inventory.py missing landmarks     # raw images without landmarks
+    python scripts/inventory.py duplicates            # identical content under several paths
+"""
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+from image_header import read_header
+
+ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT / ".pipeline" / "inventory.sqlite"
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# kind -> (directory relative to ROOT, file suffixes)
+COLLECTIONS = {
+    "raw_body": ("raw/body", IMAGE_EXTS),
+    "raw_skin": ("raw/skin", IMAGE_EXTS),
+    "skin_patch": ("processed/skin-patches", IMAGE_EXTS),
+    "landmark_json": ("processed/landmarks", (".json",)),
+}
+
+# label kind -> (CSV relative to ROOT, label column)
+LABEL_SOURCES = {
+    "body_shape": ("labels/body_shapes_final.csv", "body_shape"),
+    "skin_tone": ("labels/skin-tone-labels.csv", "skin_tone"),
+    "skin_tone_suggested": ("labels/skin-tone-auto_suggest.csv", "suggested_label"),
+}
+
+# raw_status column -> what is missing for `missing`
+STAGES = {
+    "landmarks": "has_landmarks",
+    "patch": "has_patch",
+    "body_label": "has_body_label",
+    "skin_label": "has_skin_label",
+}
+
+HASH_WORKERS = min(8, os.cpu_count() or 4)
+WRITE_BATCH = 5000
+HASH_CHUNK = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path     TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    stem     TEXT NOT NULL,
+    size     INTEGER,
+    mtime_ns INTEGER,
+    inode    INTEGER,
+    format   TEXT,
+    width    INTEGER,
+    height   INTEGER,
+    sha256   TEXT
+);
+CREATE INDEX IF NOT EXISTS assets_kind_stem ON assets(kind, stem);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets(sha256);
+CREATE TABLE IF NOT EXISTS labels (
+    kind     TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    label    TEXT,
+    PRIMARY KEY (kind, filename)
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source   TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    size     INTEGER,
+    scanned  TEXT
+);
+CREATE VIEW IF NOT EXISTS raw_status AS
+SELECT r.path, r.kind, r.name, r.width, r.height, r.size,
+    EXISTS (SELECT 1 FROM assets l WHERE l.kind = 'landmark_json' AND l.stem = r.stem) AS has_landmarks,
+    EXISTS (SELECT 1 FROM assets p WHERE p.kind = 'skin_patch'
+            AND p.stem = (CASE r.kind WHEN 'raw_skin' THEN 'skin_' ELSE 'body_skin_' END) || r.stem) AS has_patch,
+    EXISTS (SELECT 1 FROM labels b WHERE b.kind = 'body_shape' AND b.filename = r.name) AS has_body_label,
+    EXISTS (SELECT 1 FROM labels s WHERE s.kind IN ('skin_tone', 'skin_tone_suggested')
+            AND s.filename = (CASE r.kind WHEN 'raw_skin' THEN 'skin_' ELSE 'body_skin_' END) || r.stem || '.jpg')
+        AS has_skin_label
+FROM assets r WHERE r.kind IN ('raw_body', 'raw_skin');
+"""
+
+
+def connect(db_path=DB_PATH):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(SCHEMA)
+    return con
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def describe(job, hash_files=True):
+    """Row for one new/changed file: header dimensions + content hash."""
+    kind, rel, abs_path, st = job
+    name = os.path.basename(rel)
+    header = read_header(abs_path) if kind != "landmark_json" else None
+    return (
+        rel, kind, name, os.path.splitext(name)[0], st.st_size, st.st_mtime_ns, st.st_ino,
+        header.format if header else None,
+        header.width if header else None,
+        header.height if header else None,
+        sha256_file(abs_path) if hash_files else None,
+    )
+
+
+def _source_changed(con, source, st):
+    row = con.execute("SELECT mtime_ns, size FROM sources WHERE source = ?", (source,)).fetchone()
+    return row is None or row != (st.st_mtime_ns, st.st_size)
+
+
+def _mark_source(con, source, st):
+    con.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (source, st.st_mtime_ns, st.st_size, time.strftime("%Y-%m-%dT%H:%M:%S")))
+
+
+def scan_collection(con, kind, full=False, hash_files=True, workers=HASH_WORKERS):
+    """Bring one collection up to date. Returns (added_or_changed, removed), or None if skipped."""
+    rel_dir, exts = COLLECTIONS[kind]
+    d = ROOT / rel_dir
+    source = f"dir:{rel_dir}"
+    if not d.is_dir():
+        n = con.execute("DELETE FROM assets WHERE kind = ?", (kind,)).rowcount
+        con.execute("DELETE FROM sources WHERE source = ?", (source,))
+        return (0, n) if n else None
+    dir_st = d.stat()
+    # rows added with hash_files=False are backfilled by the next hashing scan
+    unhashed = hash_files and con.execute(
+        "SELECT 1 FROM assets WHERE kind = ? AND sha256 IS NULL LIMIT 1", (kind,)).fetchone() is not None
+    if not full and not unhashed and not _source_changed(con, source, dir_st):
+        return None
+
+    known, missing_hash = {}, set()
+    for path, size, mtime, inode, sha in con.execute(
+            "SELECT path, size, mtime_ns, inode, sha256 FROM assets WHERE kind = ?", (kind,)):
+        known[path] = (size, mtime, inode)
+        if sha is None:
+            missing_hash.add(path)
+    seen, todo = set(), []
+    with os.scandir(d) as it:
+        for e in it:
+            if not e.name.lower().endswith(exts) or not e.is_file():
+                continue
+            st = e.stat()
+            rel = f"{rel_dir}/{e.name}"
+            seen.add(rel)
+            if known.get(rel) != (st.st_size, st.st_mtime_ns, st.st_ino) or (hash_files and rel in missing_hash):
+                todo.append((kind, rel, e.path, st))
+
+    removed = [(p,) for p in known.keys() - seen]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        rows = ex.map(lambda job: describe(job, hash_files), todo)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= WRITE_BATCH:
+                con.executemany("INSERT OR REPLACE INTO assets VALUES (?,?,?,?,?,?,?,?,?,?,?)", batch)
+                batch = []
+        con.executemany("INSERT OR REPLACE INTO assets VALUES (?,?,?,?,?,?,?,?,?,?,?)", batch)
+    con.executemany("DELETE FROM assets WHERE path = ?", removed)
+    _mark_source(con, source, dir_st)
+    return len(todo), len(removed)
+
+
+def load_labels(con, kind):
+    """Reload one label CSV if it changed. Returns the row count loaded, or None if unchanged."""
+    rel, col = LABEL_SOURCES[kind]
+    path = ROOT / rel
+    source = f"csv:{rel}"
+    if not path.exists():
+        n = con.execute("DELETE FROM labels WHERE kind = ?", (kind,)).rowcount
+        con.execute("DELETE FROM sources WHERE source = ?", (source,))
+        return n or None
+    st = path.stat()
+    if not _source_changed(con, source, st):
+        return None
+    con.execute("DELETE FROM labels WHERE kind = ?", (kind,))
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if "filename" in (reader.fieldnames or ()) and col in reader.fieldnames:
+            con.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?, ?)",
+                            ((kind, row["filename"], row[col]) for row in reader))
+    _mark_source(con, source, st)
+    return con.execute("SELECT COUNT(*) FROM labels WHERE kind = ?", (kind,)).fetchone()[0]
+
+
+def refresh(con, full=False, hash_files=True, workers=HASH_WORKERS):
+    """Incrementally update all collections and label tables. Returns {source: change} for what changed."""
+    changes = {}
+    with con:
+        for kind in COLLECTIONS:
+            r = scan_collection(con, kind, full, hash_files, workers)
+            if r is not None and any(r):
+                changes[kind] = {"updated": r[0], "removed": r[1]}
+        for kind in LABEL_SOURCES:
+            n = load_labels(con, kind)
+            if n is not None:
+                changes[kind] = {"labels": n}
+    return changes
+
+
+def counts(con):
+    """{kind: (files, bytes)} straight from the index."""
+    return {k: (n, b or 0) for k, n, b in con.execute(
+        "SELECT kind, COUNT(*), SUM(size) FROM assets GROUP BY kind")}
+
+
+def status_summary(con):
+    """{raw kind: {images, has_landmarks, has_patch, has_body_label, has_skin_label}}."""
+    cols = ", ".join(f"SUM({c})" for c in STAGES.values())
+    out = {}
+    for kind, n, *vals in con.execute(f"SELECT kind, COUNT(*), {cols} FROM raw_status GROUP BY kind"):
+        out[kind] = {"images": n, **{c: v or 0 for c, v in zip(STAGES.values(), vals)}}
+    return out
+
+
+def missing(con, stage, kind=None):
+    col = STAGES[stage]
+    sql = f"SELECT path FROM raw_status WHERE {col} = 0"
+    args = ()
+    if kind:
+        sql += " AND kind = ?"
+        args = (kind,)
+    return [p for (p,) in con.execute(sql + " ORDER BY path", args)]
+
+
+def duplicates(con):
+    """[(sha256, [paths])] for content stored more than once within the same kind."""
+    rows = con.execute("""
+        SELECT sha256, kind, GROUP_CONCAT(path, '\n') FROM assets
+        WHERE sha256 IS NOT NULL GROUP BY sha256, kind HAVING COUNT(*) > 1""")
+    return [(sha, paths.split("\n")) for sha, _, paths in rows]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Corpus inventory index.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    scan = sub.add_parser("scan", help="refresh the index")
+    scan.add_argument("--full", action="store_true", help="re-stat every file (catches in-place edits)")
+    scan.add_argument("--no-hash", action="store_true", help="skip content hashes for new files (the next scan without it fills them in)")
+    scan.add_argument("--workers", type=int, default=HASH_WORKERS)
+    sub.add_parser("stats", help="counts, bytes and per-stage status")
+    miss = sub.add_parser("missing", help="raw images not yet through a stage")
+    miss.add_argument("stage", choices=list(STAGES))
+    miss.add_argument("--kind", choices=["raw_body", "raw_skin"], default=None)
+    sub.add_parser("duplicates", help="identical files under several paths")
+    args = ap.parse_args()
+
+    with closing(connect(args.db)) as con:
+        start = time.perf_counter()
+        if args.cmd == "scan":
+            changes = refresh(con, args.full, not args.no_hash, args.workers)
+            for source, change in changes.items():
+                print(f"{source:20} {change}")
+            print(f"Inventory refreshed in {time.perf_counter() - start:.2f}s → {args.db}")
+            return
+
+        refresh(con)
+        if args.cmd == "stats":
+            for kind, (n, b) in sorted(counts(con).items()):
+                print(f"{kind:16} {n:8} files {b / 1e6:10.1f} MB")
+            for kind, s in sorted(status_summary(con).items()):
+                done = ", ".join(f"{stage} {s[col]}/{s['images']}" for stage, col in STAGES.items())
+                print(f"{kind:16} {done}")
+        elif args.cmd == "missing":
+            for p in missing(con, args.stage, args.kind):
+                print(p)
+        elif args.cmd == "duplicates":
+            for sha, paths in duplicates(con):
+                print(f"{sha[:12]}  " + "  ".join(paths))
+
+
+if __name__ == "__main__":
+    main()
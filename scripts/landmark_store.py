@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+landmark_store.py
+
+Array view of the torso-normalized landmark store written by extract_landmarks.py.
+
+The store is a set of per-image JSON files (33 x {x, y, z, visibility}) plus the
+flat CSV body_landmarks_torso_normalized.csv (filename, x_i, y_i, z_i, v_i).
+Here both map to one (N, 33, 4) float array in [x, y, z, visibility] order so
+code can work on every skeleton at once.
+
+ - load_landmarks():       CSV (fast) or JSON directory -> (filenames, (N,33,4))
+ - normalize_tensor():     vectorized normalize_landmarks() for raw (N,33,4) poses
+ - landmarks_frame():      (N,33,4) -> DataFrame in the flat CSV layout
+ - write_landmark_json():  one skeleton -> JSON in the per-image format
+
+Requires: pip install numpy pandas
+"""
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LANDMARK_DIR = ROOT / "processed" / "landmarks"
+LANDMARK_CSV = LANDMARK_DIR / "body_landmarks_torso_normalized.csv"
+
+N_LANDMARKS = 33
+LS, RS = 11, 12
+LH, RH = 23, 24
+
+# same thresholds as extract_landmarks.normalize_landmarks
+MIN_TORSO_HEIGHT = 0.05
+FALLBACK_TORSO_HEIGHT = 0.35
+
+COORDS = ("x", "y", "z", "v")
+
+
+def landmark_columns():
+    """Flat CSV column names in (landmark, coord) order."""
+    return [f"{c}_{i}" for i in range(N_LANDMARKS) for c in COORDS]
+
+
+def frame_to_tensor(df):
+    """Flat landmark DataFrame -> (N, 33, 4) float32."""
+    return df[landmark_columns()].to_numpy(dtype=np.float32).reshape(len(df), N_LANDMARKS, 4)
+
+
+def load_landmarks(csv_path=LANDMARK_CSV, json_dir=None):
+    """
+    Return (filenames, (N, 33, 4) float32) for the landmark store.
+
+    Reads the flat CSV when it exists; otherwise (or when json_dir is given)
+    parses the per-image JSON files, named after the image stem.
+    """
+    if json_dir is None and Path(csv_path).exists():
+        df = pd.read_csv(csv_path)
+        return df["filename"].astype(str).to_numpy(), frame_to_tensor(df)
+
+    json_dir = Path(json_dir or LANDMARK_DIR)
+    names, rows = [], []
+    for p in sorted(json_dir.glob("*.json")):
+        pts = json.loads(p.read_text(encoding="utf-8"))
+        if len(pts) != N_LANDMARKS:
+            continue
+        rows.append([[pt["x"], pt["y"], pt["z"], pt["visibility"]] for pt in pts])
+        names.append(f"{p.stem}.jpg")
+    arr = np.asarray(rows, dtype=np.float32).reshape(-1, N_LANDMARKS, 4)
+    return np.asarray(names, dtype=str), arr
+
+
+def normalize_tensor(raw):
+    """
+    Vectorized extract_landmarks.normalize_landmarks over (N, 33, 4) image-space poses.
+
+    Returns (normalized (N,33,4), torso_height (N,)); visibility is passed through.
+    """
+    raw = np.asarray(raw, dtype=np.float64)
+    mid_shoulder = (raw[:, LS, :2] + raw[:, RS, :2]) / 2
+    mid_hip = (raw[:, LH, :2] + raw[:, RH, :2]) / 2
+    torso_height = np.abs(mid_shoulder[:, 1] - mid_hip[:, 1])
+    torso_height = np.where(torso_height < MIN_TORSO_HEIGHT, FALLBACK_TORSO_HEIGHT, torso_height)
+    center = (mid_shoulder + mid_hip) / 2
+
+    out = raw.copy()
+    out[..., :2] = (raw[..., :2] - center[:, None, :]) / torso_height[:, None, None]
+    out[..., 2] = raw[..., 2] / torso_height[:, None]
+    out[..., :3] = np.round(out[..., :3], 6)
+    out[..., 3] = np.round(out[..., 3], 4)
+    return out, torso_height
+
+
+def landmarks_frame(filenames, lm):
+    """(N, 33, 4) -> DataFrame in the body_landmarks_torso_normalized.csv layout."""
+    df = pd.DataFrame(np.asarray(lm).reshape(len(lm), -1), columns=landmark_columns())
+    df.insert(0, "filename", filenames)
+    return df
+
+
+def write_landmark_json(path, lm):
+    """Write one (33, 4) skeleton in the per-image JSON format of extract_landmarks.py."""
+    pts = [
+        {"x": round(float(p[0]), 6), "y": round(float(p[1]), 6),
+         "z": round(float(p[2]), 6), "visibility": round(float(p[3]), 4)}
+        for p in lm
+    ]
+    Path(path).write_text(json.dumps(pts, indent=2))
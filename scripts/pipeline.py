@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+pipeline.py
+One entry point for the dataset scripts, run as an incremental DAG
+
+Each stage declares the script it runs, its arguments, the paths it reads and
+the paths it writes or modifies in place; a stage depends on every stage
+whose outputs or modified paths it reads:
+
+    landmarks ─► body_labels ─┐
+       │  synthetic_body ─────┴─► combine
+       └► skin_patches ─► skin_labels
+                       └► skin_dataset
+
+landmarks modifies raw/body (extract_landmarks.py deletes unreadable images
+and images without a person), so skin_patches waits for it and only sees the
+images that survive.
+
+A stage is skipped when its fingerprint — SHA-256 of its script + helper
+modules, its arguments and the content of every input — matches the last
+successful run and its outputs are unchanged. Because inputs are hashed by
+content (not mtime), a rebuild upstream that produces identical output does
+not ripple further down. File hashes are cached by (size, mtime) in
+.pipeline/state.json, so unchanged files are only stat'ed.
+
+Stages whose inputs are per-image directories (raw/body, raw/skin,
+processed/skin-patches) track a digest per file. If only a few files were
+added/changed/removed since the last run, the stage runs incrementally:
+extract_landmarks.py / extract_skin_patches.py get --files with just those
+images, auto_label_skin_tone.py gets --predict for new patches. One new photo
+therefore costs one pose/patch extraction plus the cheap downstream steps.
+
+Independent stages run concurrently (--jobs), each logging to
+.pipeline/logs/<stage>.log. Input digests are taken before a stage starts;
+for a stage that modifies its own inputs they are taken again after it
+finishes, so its own deletions do not make the next run see a change.
+
+Examples:
+    python scripts/pipeline.py                   # everything that is out of date
+    python scripts/pipeline.py combine           # a target and what it depends on
+    python scripts/pipeline.py --dry-run
+    python scripts/pipeline.py --force skin_labels
+    python scripts/pipeline.py --list
+"""
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+STATE_DIR = ROOT / ".pipeline"
+STATE_FILE = STATE_DIR / "state.json"
+LOG_DIR = STATE_DIR / "logs"
+
+STATE_VERSION = 1
+JOBS = 2
+
+# run incrementally only when at most this share of a stage's tracked files changed
+INCREMENTAL_MAX_FRACTION = 0.5
+
+HASH_CHUNK = 1 << 20
+
+
+def files_args(changed, removed, list_file):
+    """Incremental args for scripts that accept --files (@list_file holds the paths)."""
+    return ["--files", f"@{list_file}"]
+
+
+def predict_args(changed, removed, list_file):
+    """auto_label_skin_tone.py --predict only labels new patches; anything else needs a refit."""
+    added_only = not removed and all(not p.existed for p in changed)
+    return ["--predict"] if added_only else None
+
+
+class Stage:
+    """One script invocation in the DAG: paths are relative to the repo root."""
+
+    def __init__(self, name, script, inputs=(), outputs=(), args=(), code=(), per_file=(), incremental=None,
+                 modifies=()):
+        self.name = name
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.modifies = list(modifies)        # inputs the stage changes in place (not fingerprinted as outputs)
+        self.args = list(args)
+        self.code = [script, *code]
+        self.per_file = list(per_file)
+        self.incremental = incremental
+        self.deps = []
+
+
+STAGES = [
+    Stage("landmarks", "extract_landmarks.py",
+          inputs=["raw/body"],
+          outputs=["processed/landmarks/body_landmarks_torso_normalized.csv"],
+          modifies=["raw/body"],
+          code=["instrumentation.py", "frame_ring.py"],
+          per_file=["raw/body"], incremental=files_args),
+    Stage("body_labels", "auto_label_body_shape.py",
+          inputs=["processed/landmarks/body_landmarks_torso_normalized.csv"],
+          outputs=["labels/body_shapes_final.csv"],
+          code=["landmark_store.py", "instrumentation.py"]),
+    Stage("synthetic_body", "generate_synthetic_body_data.py",
+          outputs=["labels/body_shapes_synthetic_balanced_1100.csv"]),
+    Stage("combine", "combine_real_and_synthetic.py",
+          inputs=["labels/body_shapes_final.csv", "labels/body_shapes_synthetic_balanced_1100.csv"],
+          outputs=["labels/FINAL_TRAINING_DATASET_v1.csv"],
+          code=["shards.py"]),
+    Stage("skin_patches", "extract_skin_patches.py",
+          inputs=["raw/skin", "raw/body"],
+          outputs=["processed/skin-patches", "scripts/skin_patch_metadata.json"],
+          code=["skin_dataset.py", "instrumentation.py", "frame_ring.py", "detection_cache.py"],
+          per_file=["raw/skin", "raw/body"], incremental=files_args),
+    Stage("skin_labels", "auto_label_skin_tone.py",
+          inputs=["processed/skin-patches"],
+          outputs=["labels/skin-tone-auto_suggest.csv", "labels/skin-tone-clusters.json"],
+          code=["skin_features.py"],
+          per_file=["processed/skin-patches"], incremental=predict_args),
+    Stage("skin_dataset", "build_skin_npz.py",
+          inputs=["processed/skin-patches", "labels/skin-tone-labels.csv"],
+          outputs=["datasets/skin_patches.npz"],
+          code=["skin_dataset.py", "shards.py"]),
+]
+
+
+def _overlaps(a, b):
+    a, b = Path(a).parts, Path(b).parts
+    n = min(len(a), len(b))
+    return a[:n] == b[:n]
+
+
+def link_stages(stages):
+    """
+    Fill stage.deps (reader depends on writer or modifier of any overlapping
+    path) and return stages in topological order.
+    """
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        s.deps = [w.name for w in stages
+                  if w is not s and any(_overlaps(i, o) for i in s.inputs for o in w.outputs + w.modifies)]
+    order, seen = [], set()
+
+    def visit(s, stack=()):
+        if s.name in stack:
+            raise ValueError(f"dependency cycle: {' -> '.join(stack + (s.name,))}")
+        if s.name in seen:
+            return
+        for d in s.deps:
+            visit(by_name[d], stack + (s.name,))
+        seen.add(s.name)
+        order.append(s)
+
+    for s in stages:
+        visit(s)
+    return order
+
+
+class ChangedFile:
+    def __init__(self, rel, existed):
+        self.rel = rel
+        self.existed = existed
+
+
+class Hasher:
+    """Content hashes with a (size, mtime_ns) cache shared across threads."""
+
+    def __init__(self, cache=None):
+        self.cache = cache or {}
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        st = path.stat()
+        rel = path.relative_to(ROOT).as_posix()
+        with self.lock:
+            hit = self.cache.get(rel)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        with self.lock:
+            self.cache[rel] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def tree(self, rel):
+        """(digest, {file: digest}) for a file or directory; digest is None if the path is missing."""
+        path = ROOT / rel
+        if path.is_file():
+            return self.file(path), {}
+        if not path.is_dir():
+            return None, {}
+        files = {p.relative_to(ROOT).as_posix(): self.file(p)
+                 for p in sorted(path.rglob("*")) if p.is_file() and not p.name.startswith(".")}
+        digest = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+        return digest, files
+
+
+def load_state():
+    if STATE_FILE.exists():
+        state = json.loads(STATE_FILE.read_text(encoding="utf-8"))
+        if state.get("version") == STATE_VERSION:
+            return state
+    return {"version": STATE_VERSION, "hashes": {}, "stages": {}}
+
+
+class Pipeline:
+    def __init__(self, stages=STAGES, jobs=JOBS, force=(), dry_run=False):
+        self.stages = link_stages(stages)
+        self.by_name = {s.name: s for s in self.stages}
+        self.jobs = jobs
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = load_state()
+        self.hasher = Hasher(self.state["hashes"])
+        self.lock = threading.Lock()
+
+    def select(self, targets):
+        """Targets plus everything upstream of them, in topological order."""
+        if not targets:
+            return list(self.stages)
+        unknown = set(targets) - set(self.by_name)
+        if unknown:
+            raise ValueError(f"unknown stage(s): {', '.join(sorted(unknown))}")
+        need, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in need:
+                need.add(name)
+                todo.extend(self.by_name[name].deps)
+        return [s for s in self.stages if s.name in need]
+
+    def code_fingerprint(self, stage):
+        parts = {c: self.hasher.file(SCRIPTS / c) for c in stage.code}
+        return hashlib.sha256(json.dumps([parts, stage.args], sort_keys=True).encode()).hexdigest()
+
+    def input_record(self, stage):
+        """{fingerprint, code, inputs, files} for the stage's current code and inputs."""
+        inputs, files = {}, {}
+        for rel in stage.inputs:
+            inputs[rel], tracked = self.hasher.tree(rel)
+            if rel in stage.per_file:
+                files[rel] = tracked
+        code = self.code_fingerprint(stage)
+        fingerprint = hashlib.sha256(json.dumps([code, inputs], sort_keys=True).encode()).hexdigest()
+        return {"fingerprint": fingerprint, "code": code, "inputs": inputs, "files": files}
+
+    def plan(self, stage):
+        """Decide how to run a stage: ("skip" | "full" | "incremental", extra args, record)."""
+        record = self.input_record(stage)
+        code, inputs, files, fingerprint = record["code"], record["inputs"], record["files"], record["fingerprint"]
+
+        prev = self.state["stages"].get(stage.name)
+        outputs = {rel: self.hasher.tree(rel)[0] for rel in stage.outputs}
+        outputs_ok = all(d is not None for d in outputs.values())
+        if stage.name in self.force or prev is None or not outputs_ok:
+            return "full", [], record
+        if prev["fingerprint"] == fingerprint and prev.get("outputs") == outputs:
+            return "skip", [], record
+
+        if stage.incremental is None or prev["code"] != code or prev.get("outputs") != outputs:
+            return "full", [], record
+        if any(prev["inputs"].get(rel) != d for rel, d in inputs.items() if rel not in stage.per_file):
+            return "full", [], record
+
+        changed, removed, total = [], [], 0
+        for rel, now in files.items():
+            before = prev["files"].get(rel, {})
+            total += len(now)
+            changed += [ChangedFile(f, f in before) for f, d in now.items() if before.get(f) != d]
+            removed += [ChangedFile(f, True) for f in before if f not in now]
+        n = len(changed) + len(removed)
+        if n == 0 or n > INCREMENTAL_MAX_FRACTION * max(total, 1):
+            return "full", [], record
+
+        list_file = STATE_DIR / f"{stage.name}.files"
+        extra = stage.incremental(changed, removed, list_file)
+        if extra is None:
+            return "full", [], record
+        if not self.dry_run:
+            STATE_DIR.mkdir(parents=True, exist_ok=True)
+            list_file.write_text("".join(f"{ROOT / c.rel}\n" for c in changed + removed), encoding="utf-8")
+        return f"incremental ({n} files)", extra, record
+
+    def run_stage(self, stage):
+        mode, extra, record = self.plan(stage)
+        if mode == "skip" or self.dry_run:
+            print(f"[{stage.name}] {'up to date' if mode == 'skip' else 'would run: ' + mode}")
+            return True, mode != "skip"
+
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        log = LOG_DIR / f"{stage.name}.log"
+        cmd = [sys.executable, str(SCRIPTS / stage.script), *stage.args, *extra]
+        print(f"[{stage.name}] running {mode}: {' '.join(cmd[1:])}  (log: {log.relative_to(ROOT)})")
+        start = time.perf_counter()
+        with open(log, "w", encoding="utf-8") as f:
+            rc = subprocess.call(cmd, cwd=ROOT, stdout=f, stderr=subprocess.STDOUT)
+        seconds = time.perf_counter() - start
+        if rc != 0:
+            print(f"[{stage.name}] FAILED (exit {rc}) after {seconds:.1f}s — see {log.relative_to(ROOT)}")
+            return False, True
+
+        if stage.modifies:
+            record.update(self.input_record(stage))
+        record["outputs"] = {rel: self.hasher.tree(rel)[0] for rel in stage.outputs}
+        record["mode"] = mode.split()[0]
+        record["seconds"] = round(seconds, 2)
+        record["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self.lock:
+            self.state["stages"][stage.name] = record
+            self.save()
+        print(f"[{stage.name}] done in {seconds:.1f}s")
+        return True, True
+
+    def save(self):
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = STATE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=1), encoding="utf-8")
+        tmp.replace(STATE_FILE)
+
+    def run(self, targets=()):
+        """Run the selected stages, independent ones concurrently. Returns the names of failed stages."""
+        pending = self.select(targets)
+        done, failed, ran = set(), set(), set()
+        with ThreadPoolExecutor(max_workers=self.jobs) as ex:
+            running = {}
+            while pending or running:
+                for s in list(pending):
+                    if any(d in failed for d in s.deps):
+                        pending.remove(s)
+                        failed.add(s.name)
+                        print(f"[{s.name}] skipped: upstream failed")
+                    elif all(d in done for d in s.deps if d in self.by_name):
+                        if self.dry_run and any(d in ran for d in s.deps):
+                            # outputs of the upstream stage are not known without running it
+                            pending.remove(s)
+                            done.add(s.name)
+                            ran.add(s.name)
+                            print(f"[{s.name}] would run if upstream output changes")
+                            continue
+                        pending.remove(s)
+                        running[ex.submit(self.run_stage, s)] = s
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    s = running.pop(fut)
+                    ok, did_run = fut.result()
+                    (done if ok else failed).add(s.name)
+                    if did_run:
+                        ran.add(s.name)
+        if not self.dry_run:
+            self.save()
+        return failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the dataset pipeline incrementally.")
+    ap.add_argument("targets", nargs="*", help="stages to bring up to date (default: all)")
+    ap.add_argument("--jobs", type=int, default=JOBS, help="stages to run concurrently")
+    ap.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="rerun these stages in full")
+    ap.add_argument("--dry-run", action="store_true", help="show what would run")
+    ap.add_argument("--list", action="store_true", help="list stages and their dependencies")
+    args = ap.parse_args()
+
+    pipeline = Pipeline(jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    if args.list:
+        for s in pipeline.stages:
+            deps = ", ".join(s.deps) or "-"
+            print(f"{s.name:16} {s.script:34} after: {deps}")
+        return
+
+    try:
+        failed = pipeline.run(args.targets)
+    except ValueError as e:
+        ap.error(str(e))
+    if failed:
+        print(f"\nFailed: {', '.join(sorted(failed))}")
+        sys.exit(1)
+    print("\nPipeline up to date." if not args.dry_run else "")
+
+
+if __name__ == "__main__":
+    main()
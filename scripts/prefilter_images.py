@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+prefilter_images.py
+
+Screens raw/body and raw/skin before the expensive extractors run, so
+MediaPipe Pose and the Haar cascades only see images that can yield a
+skeleton or a skin patch.
+
+Checks, cheapest first; an image fails with every reason that applies:
+ 1. header only (image_header.py, no decode):
+      unreadable, too_small (short side), extreme_aspect (long/short side)
+ 2. reduced-resolution decode (IMREAD_REDUCED_* lets libjpeg decode at 1/2,
+    1/4 or 1/8 scale), resized to ANALYSIS_SIDE on the long side:
+      blurry      Laplacian variance of the gray image (body images only;
+                  skin close-ups are smooth by nature and only need color)
+      grayscale   mean HSV saturation
+      uniform     gray standard deviation (near-flat images)
+      dark/bright mean gray level
+      clipped     share of pixels at either end of the range
+
+Images are screened in a process pool. Results (pass/fail, reasons and the
+measured values) go to processed/prefilter.csv, which
+extract_landmarks.py and extract_skin_patches.py read with --prefiltered
+to skip rejected images.
+
+Options:
+    --files PATH ...   screen only these images and merge them into the CSV;
+                       a listed path that no longer exists is dropped from it.
+                       @list.txt reads the paths from a file.
+    --workers N        worker processes (default: CPU count)
+    --min-sharpness F, --min-saturation F, ...  override the thresholds below
+
+Examples:
+    python scripts/prefilter_images.py
+    python scripts/extract_landmarks.py --prefiltered
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from image_header import read_header
+from instrumentation import Telemetry, add_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+RAW_BODY = ROOT / "raw" / "body"
+RAW_SKIN = ROOT / "raw" / "skin"
+OUT_CSV = ROOT / "processed" / "prefilter.csv"
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# header checks (short side in px; body images need room for a whole person)
+MIN_SIDE = {"body": 256, "skin": 128}
+MAX_ASPECT = 3.0
+
+# decoded checks, measured at ANALYSIS_SIDE px on the long side
+ANALYSIS_SIDE = 512
+MIN_SHARPNESS = 30.0         # Laplacian variance, body images
+MIN_SATURATION = 12.0        # mean HSV S (0-255)
+MIN_CONTRAST = 12.0          # gray std
+MIN_BRIGHTNESS = 35.0        # mean gray
+MAX_BRIGHTNESS = 225.0
+MAX_CLIPPED = 0.4            # share of pixels <= 5 or >= 250
+
+COLUMNS = ["path", "status", "reasons", "width", "height",
+           "sharpness", "saturation", "contrast", "brightness", "clipped"]
+
+THRESHOLDS = {
+    "max_aspect": MAX_ASPECT, "min_sharpness": MIN_SHARPNESS, "min_saturation": MIN_SATURATION,
+    "min_contrast": MIN_CONTRAST, "min_brightness": MIN_BRIGHTNESS, "max_brightness": MAX_BRIGHTNESS,
+    "max_clipped": MAX_CLIPPED,
+}
+
+_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def rel_path(path):
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def image_kind(path):
+    return "skin" if Path(path).resolve().parent == RAW_SKIN.resolve() else "body"
+
+
+def decode_reduced(path, long_side):
+    """Decode at the largest 1/2^k scale that still leaves >= ANALYSIS_SIDE px on the long side."""
+    for factor, flag in _REDUCED:
+        if long_side // factor >= ANALYSIS_SIDE:
+            return cv2.imread(str(path), flag)
+    return cv2.imread(str(path), cv2.IMREAD_COLOR)
+
+
+def image_stats(img):
+    """Quality measurements of a BGR image, taken at ANALYSIS_SIDE on the long side."""
+    h, w = img.shape[:2]
+    scale = ANALYSIS_SIDE / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    sat = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[..., 1]
+    return {
+        "sharpness": float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        "saturation": float(sat.mean()),
+        "contrast": float(gray.std()),
+        "brightness": float(gray.mean()),
+        "clipped": float(np.count_nonzero((gray <= 5) | (gray >= 250)) / gray.size),
+    }
+
+
+def screen(path, thresholds=THRESHOLDS):
+    """Screen one image. Returns a COLUMNS row dict; runs inside a worker process."""
+    row = dict.fromkeys(COLUMNS)
+    row["path"] = rel_path(path)
+    reasons = []
+
+    kind = image_kind(path)
+    header = read_header(path)
+    if header is None:
+        reasons.append("unreadable")
+    else:
+        row["width"], row["height"] = header.width, header.height
+        short, long = sorted((header.width, header.height))
+        if short < MIN_SIDE[kind]:
+            reasons.append("too_small")
+        if short == 0 or long / short > thresholds["max_aspect"]:
+            reasons.append("extreme_aspect")
+
+    if not reasons:
+        img = decode_reduced(path, max(header.width, header.height))
+        if img is None:
+            reasons.append("unreadable")
+        else:
+            s = image_stats(img)
+            row.update({k: round(v, 4) for k, v in s.items()})
+            if kind == "body" and s["sharpness"] < thresholds["min_sharpness"]:
+                reasons.append("blurry")
+            if s["saturation"] < thresholds["min_saturation"]:
+                reasons.append("grayscale")
+            if s["contrast"] < thresholds["min_contrast"]:
+                reasons.append("uniform")
+            if s["brightness"] < thresholds["min_brightness"]:
+                reasons.append("dark")
+            if s["brightness"] > thresholds["max_brightness"]:
+                reasons.append("bright")
+            if s["clipped"] > thresholds["max_clipped"]:
+                reasons.append("clipped")
+
+    row["status"] = "fail" if reasons else "pass"
+    row["reasons"] = ";".join(reasons)
+    return row
+
+
+def _init_worker():
+    cv2.setNumThreads(1)     # one image per process; avoid oversubscription
+
+
+def list_images(folders=(RAW_BODY, RAW_SKIN)):
+    return sorted(
+        f for folder in folders if folder.exists()
+        for f in folder.iterdir()
+        if f.is_file() and f.suffix.lower() in IMAGE_EXTS
+    )
+
+
+def rejected_paths(csv_path=OUT_CSV):
+    """Resolved paths of every image the prefilter failed (empty if it has not run)."""
+    if not Path(csv_path).exists():
+        return frozenset()
+    df = pd.read_csv(csv_path, usecols=["path", "status"])
+    return frozenset((ROOT / p).resolve() for p in df.loc[df["status"] == "fail", "path"])
+
+
+def write_rows(rows, out=OUT_CSV, touched=None):
+    """Write screen() rows to out; with touched (rel paths), replace only those rows of an existing CSV."""
+    df = pd.DataFrame(rows, columns=COLUMNS).astype({"width": "Int64", "height": "Int64"})
+    if touched is not None and out.exists():
+        old = pd.read_csv(out)
+        df = pd.concat([old[~old["path"].isin(touched)], df], ignore_index=True)
+        df = df.sort_values("path", kind="stable")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Screen raw images before landmark/patch extraction.",
+                                 fromfile_prefix_chars="@")
+    ap.add_argument("--files", nargs="+", type=Path, default=None,
+                    help="only these images (missing paths are dropped from the CSV)")
+    ap.add_argument("--out", type=Path, default=OUT_CSV)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    for name, value in THRESHOLDS.items():
+        ap.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    add_arguments(ap)
+    args = ap.parse_args()
+    thresholds = {name: getattr(args, name) for name in THRESHOLDS}
+
+    paths = list_images() if args.files is None else sorted(p for p in args.files if p.exists())
+    rows = []
+    with Telemetry.from_args(args, "prefilter", total=len(paths)) as tel:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as ex:
+            for row in ex.map(screen, paths, [thresholds] * len(paths), chunksize=32):
+                rows.append(row)
+                tel.count(row["status"])
+                for reason in filter(None, row["reasons"].split(";")):
+                    tel.count(reason)
+                tel.log(f"{row['path']:60} → {row['status'].upper()} {row['reasons']}")
+                tel.advance()
+
+        with tel.time("write"):
+            touched = None if args.files is None else {rel_path(p) for p in args.files}
+            df = write_rows(rows, args.out, touched)
+
+    n_fail = int((df["status"] == "fail").sum())
+    print(f"Prefilter: {len(df) - n_fail} pass, {n_fail} fail → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,9 +23,6 @@ SKIN_DIR = RAW_DIR / "skin"
 PROGRESS_FILE = ROOT / "scripts" / "pexels_progress.json"
 METADATA_FILE = ROOT / "scripts" / "pexels_metadata.json"
 
-for d in (BODY_DIR, SKIN_DIR, PROGRESS_FILE.parent):
-    d.mkdir(parents=True, exist_ok=True)
-
 DEFAULT_PER_PAGE = 20
 SLEEP_BETWEEN_PAGES = 2
 MAX_RETRIES = 3
@@ -132,6 +129,12 @@ def safe_get(url: str, params: Dict[str, Any]):
     raise last_error
 
 
+def best_src(photo: Dict[str, Any]):
+    """Largest available image URL of a search result, or None."""
+    src = photo.get("src", {})
+    return src.get("original") or src.get("large") or src.get("medium")
+
+
 def download(url: str, dest: Path):
     """Download file with retries."""
     for attempt in range(1, MAX_RETRIES+1):
@@ -194,8 +197,7 @@ def scrape_query(query: str, out_dir: Path, max_pages=5, per_page=DEFAULT_PER_PA
                 print(f"[SKIP] Already exists: {fname}")
                 continue
 
-            src = photo.get("src", {})
-            img_url = src.get("original") or src.get("large") or src.get("medium")
+            img_url = best_src(photo)
 
             if not img_url:
                 print(f"[WARN] No valid URL for {photo_id}")
@@ -247,6 +249,9 @@ def main():
         print("[ERROR] Missing API key.")
         return
 
+    for d in (BODY_DIR, SKIN_DIR, PROGRESS_FILE.parent):
+        d.mkdir(parents=True, exist_ok=True)
+
     print("\n=== Pexels Scraper Started ===")
     scrape_body()
     #scrape_skin()
@@ -4,16 +4,12 @@ scrape_pinterest.py
 """
 import json
 from pathlib import Path
-from pinterest_dl import PinterestDL
 
 # ────────────────────────────── Config ──────────────────────────────
 ROOT = Path(__file__).resolve().parent.parent
 BODY_DIR = ROOT / "raw" / "body"
 PROGRESS_FILE = ROOT / "scripts" / "pinterest_progress_v2.json"
 
-BODY_DIR.mkdir(parents=True, exist_ok=True)
-PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)  # creates scripts/ if missing
-
 # Targeted queries (all with "standing straight" + "front view")
 QUERIES = [
     "hourglass figure woman full body standing straight front view",
@@ -37,6 +33,9 @@ NUM_IMAGES_PER_QUERY = 30
 TIMEOUT = 8
 VERBOSE = False
 
+def progress_key(query: str) -> str:
+    return query.replace(" ", "_")[:60]  # short unique key
+
 # ──────────────────────── Helper: rename with prefix ────────────────────────
 def add_prefix_to_new_files(directory: Path, prefix: str = "pin_stand_"):
     renamed = 0
@@ -50,6 +49,11 @@ def add_prefix_to_new_files(directory: Path, prefix: str = "pin_stand_"):
 
 # ─────────────────────────────── Main ───────────────────────────────
 def main():
+    from pinterest_dl import PinterestDL
+
+    BODY_DIR.mkdir(parents=True, exist_ok=True)
+    PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)  # creates scripts/ if missing
+
     print("=== Pinterest Scraper — STANDING STRAIGHT + FRONT VIEW ===")
     print(f"Images → {BODY_DIR}")
     print(f"Progress → {PROGRESS_FILE}\n")
@@ -64,7 +68,7 @@ def main():
 
     total_downloaded = 0
     for query in QUERIES:
-        key = query.replace(" ", "_")[:60]  # short unique key
+        key = progress_key(query)
         if progress.get(key, {}).get("done"):
             print(f"[SKIP] {query}")
             continue
@@ -17,10 +17,6 @@ BODY_DIR = ROOT / "raw/body"
 SKIN_DIR = ROOT / "raw/skin"
 PROGRESS_FILE = ROOT / "scripts" / "unsplash_progress.json"
 
-BODY_DIR.mkdir(parents=True, exist_ok=True)
-SKIN_DIR.mkdir(parents=True, exist_ok=True)
-PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)
-
 MAX_PAGES = 3
 SLEEP_TIME = 3
 
@@ -139,6 +135,18 @@ def search_unsplash(query, page):
 # Download
 # ---------------------------------------------------
 
+def resolve_download_url(img):
+    """File URL of a search result via its download_location (the tracked download Unsplash requires)."""
+    log = requests.get(
+        img["links"]["download_location"],
+        params={"client_id": UNSPLASH_ACCESS_KEY},
+        timeout=10
+    )
+    if log.status_code != 200:
+        return None
+    return log.json().get("url")
+
+
 def download_image(url, filepath):
     try:
         r = requests.get(url, timeout=20)
@@ -184,18 +192,11 @@ def fetch_images(query, output_dir):
                 continue
 
             try:
-                download_loc = img["links"]["download_location"]
-                log = requests.get(
-                    download_loc,
-                    params={"client_id": UNSPLASH_ACCESS_KEY},
-                    timeout=10
-                )
-                if log.status_code != 200:
+                file_url = resolve_download_url(img)
+                if file_url is None:
                     print("Failed log:", img_id)
                     continue
 
-                file_url = log.json().get("url")
-
                 print(f"Downloading {img_id}.jpg...")
                 download_image(file_url, filepath)
 
@@ -217,6 +218,10 @@ def fetch_images(query, output_dir):
 # ---------------------------------------------------
 
 if __name__ == "__main__":
+    BODY_DIR.mkdir(parents=True, exist_ok=True)
+    SKIN_DIR.mkdir(parents=True, exist_ok=True)
+    PROGRESS_FILE.parent.mkdir(parents=True, exist_ok=True)
+
     print("\n=== Unsplash Scraper Started ===")
 
     if not check_api_key():
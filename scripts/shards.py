@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+shards.py
+
+Sharded, indexed training-data format + prefetching batch loader.
+
+Layout of a shard directory:
+ - index.json                     fields (dtype, per-row shape), shard list, total rows
+ - shard-00000.<field>.npy        one .npy per field per shard (fixed shard_size rows)
+ - shard-00001.<field>.npy ...
+
+Every field is a plain .npy array (no pickle), so shards open with mmap and a
+reader only ever touches the shards it needs.
+
+Writers:
+ - build_skin_npz.py --format shards          images (uint8), labels, ids
+ - combine_real_and_synthetic.py --shards     features (float32), labels, ids
+
+Reader:
+    from shards import ShardDataset, iter_batches
+    ds = ShardDataset("datasets/skin_shards")
+    for batch in iter_batches(ds, batch_size=64, shuffle=True, seed=0):
+        batch["images"], batch["labels"], batch["ids"]
+
+Requires: pip install numpy pandas
+"""
+import bisect
+import json
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+FORMAT_VERSION = "stylemate-shards/1"
+INDEX_FILE = "index.json"
+SHARD_SIZE = 4096
+OPEN_SHARDS = 64          # memmapped shards a ShardDataset keeps open (LRU)
+
+
+def shard_prefix(i):
+    return f"shard-{i:05d}"
+
+
+def _as_column(values):
+    """Column values as an ndarray; strings become fixed-width unicode."""
+    if isinstance(values, np.ndarray):
+        return values
+    values = list(values)
+    if values and isinstance(values[0], str):
+        return np.asarray(values, dtype=str)
+    return np.asarray(values)
+
+
+class ShardWriter:
+    """Buffers at most one shard of records, then writes it as per-field .npy files."""
+
+    def __init__(self, out_dir, shard_size=SHARD_SIZE, meta=None):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.meta = meta or {}
+        self.fields = None
+        self.field_info = {}
+        self.buffer = None
+        self.buffered = 0
+        self.shards = []
+        self.total = 0
+
+    def add(self, record):
+        """Add one record: dict of field name -> scalar/str/array."""
+        self.add_batch({k: [v] for k, v in record.items()})
+
+    def add_batch(self, columns):
+        """Add many records at once: dict of field name -> sequence/array of equal length."""
+        columns = {k: _as_column(v) for k, v in columns.items()}
+        if self.fields is None:
+            self.fields = list(columns)
+            self.buffer = {k: [] for k in self.fields}
+        n = len(columns[self.fields[0]])
+        start = 0
+        while start < n:
+            take = min(n - start, self.shard_size - self.buffered)
+            for k in self.fields:
+                self.buffer[k].append(columns[k][start:start + take])
+            self.buffered += take
+            start += take
+            if self.buffered >= self.shard_size:
+                self._flush()
+
+    def _flush(self):
+        if self.buffered == 0:
+            return
+        prefix = shard_prefix(len(self.shards))
+        for k in self.fields:
+            arr = np.concatenate(self.buffer[k])
+            np.save(self.out_dir / f"{prefix}.{k}.npy", arr)
+            self.field_info[k] = {"dtype": arr.dtype.str, "shape": list(arr.shape[1:])}
+            self.buffer[k] = []
+        self.shards.append({"prefix": prefix, "offset": self.total, "count": self.buffered})
+        self.total += self.buffered
+        self.buffered = 0
+
+    def close(self):
+        """Flush the last (partial) shard and write index.json. Returns the index dict."""
+        self._flush()
+        index = {
+            "format": FORMAT_VERSION,
+            "shard_size": self.shard_size,
+            "total": self.total,
+            "fields": self.field_info,
+            "shards": self.shards,
+            "meta": self.meta,
+        }
+        (self.out_dir / INDEX_FILE).write_text(json.dumps(index, indent=2), encoding="utf-8")
+        return index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class ShardDataset:
+    """
+    Random-access view over a shard directory. Shards are opened lazily with
+    mmap and the OPEN_SHARDS most recently used stay open.
+    """
+
+    def __init__(self, shard_dir):
+        self.dir = Path(shard_dir)
+        self.index = json.loads((self.dir / INDEX_FILE).read_text(encoding="utf-8"))
+        if self.index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{self.dir} is not a {FORMAT_VERSION} shard directory")
+        self.shards = self.index["shards"]
+        self.fields = list(self.index["fields"])
+        self._offsets = [s["offset"] for s in self.shards]
+        self._open = OrderedDict()        # shard index -> {field: memmap}
+        self._lock = threading.Lock()     # iter_batches reads shards from a thread pool
+
+    def __len__(self):
+        return self.index["total"]
+
+    def shard(self, i, fields=None):
+        """dict field -> read-only memmap for shard i."""
+        fields = fields or self.fields
+        with self._lock:
+            maps = self._open.pop(i, None) or {}
+            self._open[i] = maps
+            if len(self._open) > OPEN_SHARDS:
+                self._open.popitem(last=False)
+            prefix = self.shards[i]["prefix"]
+            for k in fields:
+                if k not in maps:
+                    maps[k] = np.load(self.dir / f"{prefix}.{k}.npy", mmap_mode="r")
+            return {k: maps[k] for k in fields}
+
+    def __getitem__(self, idx):
+        """One record by global row index."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        s = bisect.bisect_right(self._offsets, idx) - 1
+        row = idx - self._offsets[s]
+        return {k: v[row] for k, v in self.shard(s).items()}
+
+
+def _load_group(ds, shard_ids, rng_seed, shuffle, fields):
+    """Read a group of shards into memory (rows permuted when shuffling)."""
+    parts = [ds.shard(i, fields) for i in shard_ids]
+    data = {k: np.concatenate([p[k] for p in parts]) for k in (fields or ds.fields)}
+    if shuffle:
+        order = np.random.default_rng(rng_seed).permutation(len(next(iter(data.values()))))
+        data = {k: v[order] for k, v in data.items()}
+    return data
+
+
+def iter_batches(ds, batch_size=64, shuffle=True, seed=0, workers=2, prefetch=2,
+                 shards_per_group=2, drop_last=False, fields=None):
+    """
+    Yield dict batches from a ShardDataset.
+
+    Shards are visited in a seeded random order and read in groups of
+    shards_per_group (rows are shuffled across the group). Up to
+    workers * prefetch groups are read ahead on a thread pool, which bounds
+    memory at roughly that many groups; output is deterministic for a seed.
+    """
+    if isinstance(ds, (str, Path)):
+        ds = ShardDataset(ds)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(ds.shards)) if shuffle else np.arange(len(ds.shards))
+    groups = [order[i:i + shards_per_group] for i in range(0, len(order), shards_per_group)]
+    group_seeds = rng.integers(0, 2**32, size=len(groups))
+
+    carry = None
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        pending = deque()
+        gi = 0
+        while gi < len(groups) or pending:
+            while gi < len(groups) and len(pending) < max(1, workers) * prefetch:
+                pending.append(ex.submit(_load_group, ds, groups[gi], group_seeds[gi], shuffle, fields))
+                gi += 1
+            data = pending.popleft().result()
+            if carry is not None:
+                data = {k: np.concatenate([carry[k], data[k]]) for k in data}
+                carry = None
+            n = len(next(iter(data.values())))
+            full = n - n % batch_size
+            for start in range(0, full, batch_size):
+                yield {k: v[start:start + batch_size] for k, v in data.items()}
+            if full < n:
+                carry = {k: v[full:] for k, v in data.items()}
+
+    if carry is not None and not drop_last:
+        yield carry
+
+
+def write_csv_shards(csv_path, out_dir, feature_cols, label_col, id_col,
+                     shard_size=SHARD_SIZE, chunksize=100_000):
+    """Stream a CSV into shards with float32 features, labels and ids."""
+    import pandas as pd
+
+    meta = {"source": str(csv_path), "feature_columns": list(feature_cols)}
+    with ShardWriter(out_dir, shard_size=shard_size, meta=meta) as writer:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            writer.add_batch({
+                "features": chunk[list(feature_cols)].to_numpy(dtype=np.float32),
+                "labels": chunk[label_col].astype(str).tolist(),
+                "ids": chunk[id_col].astype(str).tolist(),
+            })
+    return writer.total
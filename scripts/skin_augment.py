@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+skin_augment.py
+
+Vectorized color/lighting augmentation for (N, H, W, 3) uint8 RGB skin patches.
+
+Every transform is drawn per sample but applied to the whole batch at once:
+ - gamma on L (exposure curve)
+ - brightness offset on L
+ - white-balance shift on a/b
+ - JPEG-style noise: 8x8 block averaging blended in + sensor noise
+
+LAB conversion goes through skin_features.convert_batch (one cvtColor call
+per batch). Defaults are deliberately small so a patch stays inside its
+skin-tone class; they are meant for oversampling rare tones at read time
+(skin_dataset.iter_balanced_batches), not for inventing new tones.
+
+Usage:
+    rng = np.random.default_rng(0)
+    out = augment_batch(batch_rgb, rng)
+"""
+import cv2
+import numpy as np
+
+from skin_features import convert_batch
+
+# per-sample jitter scales (OpenCV 8-bit LAB units)
+BRIGHTNESS_STD = 4.0
+WHITE_BALANCE_STD = 3.0
+GAMMA_RANGE = (0.85, 1.18)
+
+# max blend weight of the 8x8 block average, and sensor noise std at full strength
+JPEG_NOISE = 0.25
+NOISE_STD = 3.0
+BLOCK = 8
+
+
+def _lab_jitter(batch, rng, brightness_std, white_balance_std, gamma_range):
+    n = len(batch)
+    lab = convert_batch(batch, cv2.COLOR_RGB2LAB).astype(np.float32)
+
+    log_lo, log_hi = np.log(gamma_range[0]), np.log(gamma_range[1])
+    gamma = np.exp(rng.uniform(log_lo, log_hi, size=n)).astype(np.float32)
+    shift = np.stack([
+        rng.normal(0.0, brightness_std, size=n),
+        rng.normal(0.0, white_balance_std, size=n),
+        rng.normal(0.0, white_balance_std, size=n),
+    ], axis=1).astype(np.float32)
+
+    L = lab[..., 0]
+    lab[..., 0] = 255.0 * np.power(L / 255.0, gamma[:, None, None])
+    lab += shift[:, None, None, :]
+    np.clip(lab, 0, 255, out=lab)
+    return convert_batch(lab.round().astype(np.uint8), cv2.COLOR_LAB2RGB)
+
+
+def _jpeg_noise(batch, rng, strength, noise_std):
+    n, h, w, c = batch.shape
+    s = rng.uniform(0.0, strength, size=n).astype(np.float32)[:, None, None, None]
+    x = batch.astype(np.float32)
+    if h % BLOCK == 0 and w % BLOCK == 0:
+        blocks = x.reshape(n, h // BLOCK, BLOCK, w // BLOCK, BLOCK, c).mean(axis=(2, 4), keepdims=True)
+        blocky = np.broadcast_to(blocks, (n, h // BLOCK, BLOCK, w // BLOCK, BLOCK, c)).reshape(n, h, w, c)
+        x = (1.0 - s) * x + s * blocky
+    x += rng.normal(0.0, 1.0, size=x.shape).astype(np.float32) * (noise_std * s / max(strength, 1e-6))
+    return np.clip(x, 0, 255).round().astype(np.uint8)
+
+
+def augment_batch(batch, rng=None, brightness_std=BRIGHTNESS_STD, white_balance_std=WHITE_BALANCE_STD,
+                  gamma_range=GAMMA_RANGE, jpeg_noise=JPEG_NOISE, noise_std=NOISE_STD):
+    """Return an augmented copy of an (N, H, W, 3) uint8 RGB batch."""
+    batch = np.ascontiguousarray(batch, dtype=np.uint8)
+    if len(batch) == 0:
+        return batch.copy()
+    rng = rng if rng is not None else np.random.default_rng()
+    out = _lab_jitter(batch, rng, brightness_std, white_balance_std, gamma_range)
+    if jpeg_noise > 0:
+        out = _jpeg_noise(out, rng, jpeg_noise, noise_std)
+    return out
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+skin_dataset.py
+
+uint8 memory-mapped skin-patch dataset.
+
+Layout (written by build_skin_npz.py --format memmap):
+ - datasets/skin_patches_u8.npy          (N,64,64,3) uint8 RGB
+ - datasets/skin_patches_labels.npy      (N,) unicode labels ("" = unlabeled)
+ - datasets/skin_patches_filenames.npy   (N,) unicode patch filenames
+
+Pixels stay uint8 on disk (4x smaller than float32) and are normalized to
+float32 0..1 only when read. The loader opens the pixel file with mmap, so
+indexing touches just the requested rows.
+
+Patch pyramid (written by extract_skin_patches.py --pyramid):
+ - processed/skin-patch-arrays/patches_128.npy   (N,128,128,3) uint8 RGB
+ - processed/skin-patch-arrays/patches_64.npy    (N,64,64,3)
+ - processed/skin-patch-arrays/patches_32.npy    (N,32,32,3)
+ - processed/skin-patch-arrays/filenames.npy     patch filenames (same names as the JPEGs)
+Each level is resized from the one above it in a single pass over the crops,
+so build_skin_npz.py --from-pyramid never re-decodes JPEGs.
+
+Usage:
+    from skin_dataset import load_skin_patches
+    ds = load_skin_patches()
+    x = ds[10:42]          # float32 (32,64,64,3), normalized on read
+    raw = ds.raw[10:42]    # uint8 view, zero-copy
+    y = ds.labels[10:42]
+
+    # class-balanced batches, rare tones oversampled + augmented on the fly
+    for x, y in iter_balanced_batches(ds, batch_size=64, seed=0):
+        ...
+"""
+import cv2
+import numpy as np
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DATASET_DIR = ROOT / "datasets"
+MEMMAP_PREFIX = DATASET_DIR / "skin_patches"
+
+PYRAMID_DIR = ROOT / "processed" / "skin-patch-arrays"
+PYRAMID_SIZES = (128, 64, 32)
+
+
+def memmap_paths(prefix=MEMMAP_PREFIX):
+    """(pixels, labels, filenames) paths for a memmap dataset prefix."""
+    prefix = Path(prefix)
+    return (
+        prefix.with_name(prefix.name + "_u8.npy"),
+        prefix.with_name(prefix.name + "_labels.npy"),
+        prefix.with_name(prefix.name + "_filenames.npy"),
+    )
+
+
+def create_pixel_memmap(path, n, size=(64, 64)):
+    """Preallocate an (n, H, W, 3) uint8 .npy file and return it as a writable memmap."""
+    w, h = size
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(n, h, w, 3))
+
+
+def truncate_npy(path, n_rows):
+    """
+    Shrink the first axis of a .npy file to n_rows in place.
+
+    The header is rewritten with the same length (padding absorbs the shorter
+    shape) and the file is truncated, so no pixel data is copied.
+    """
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+        if n_rows == shape[0]:
+            return
+        if n_rows > shape[0]:
+            raise ValueError(f"cannot grow {path} from {shape[0]} to {n_rows} rows")
+
+        new_shape = (n_rows,) + tuple(shape[1:])
+        header = repr({
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": fortran_order,
+            "shape": new_shape,
+        })
+        # magic (6) + version (2) + header length field (2 for v1, 4 for v2)
+        header_start = 10 if version == (1, 0) else 12
+        room = data_offset - header_start
+        f.seek(header_start)
+        f.write((header.ljust(room - 1) + "\n").encode("latin1"))
+
+        row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+        f.truncate(data_offset + n_rows * row_bytes)
+
+
+def write_sidecars(prefix, labels, filenames):
+    """Write label/filename arrays next to the pixel file (fixed-width unicode, no pickle)."""
+    _, labels_path, names_path = memmap_paths(prefix)
+    np.save(labels_path, np.asarray(labels, dtype=str))
+    np.save(names_path, np.asarray(filenames, dtype=str))
+
+
+class SkinPatchDataset:
+    """Memory-mapped view of a uint8 skin-patch dataset; rows normalize to float32 on read."""
+
+    def __init__(self, prefix=MEMMAP_PREFIX):
+        pixels_path, labels_path, names_path = memmap_paths(prefix)
+        self.raw = np.load(pixels_path, mmap_mode="r")
+        self.labels = np.load(labels_path)
+        self.filenames = np.load(names_path)
+        if not (len(self.raw) == len(self.labels) == len(self.filenames)):
+            raise ValueError(f"row count mismatch between {pixels_path.name} and its sidecars")
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, idx):
+        return self.raw[idx].astype(np.float32) / 255.0
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @classmethod
+    def from_npz(cls, path):
+        """Wrap a legacy float32 skin_patches.npz (decompressed into RAM, stored back as uint8)."""
+        with np.load(path, allow_pickle=True) as z:
+            ds = cls.__new__(cls)
+            ds.raw = np.clip(np.rint(z["X"] * 255.0), 0, 255).astype(np.uint8)
+            ds.labels = np.asarray(z["y"], dtype=str)
+            ds.filenames = np.asarray(z["filenames"], dtype=str)
+        return ds
+
+
+def load_skin_patches(prefix=MEMMAP_PREFIX):
+    """Open a memmap dataset (build_skin_npz.py --format memmap) or a legacy .npz file."""
+    if str(prefix).endswith(".npz"):
+        return SkinPatchDataset.from_npz(prefix)
+    return SkinPatchDataset(prefix)
+
+
+def iter_balanced_batches(ds, batch_size=64, seed=0, n_batches=None, augment=True):
+    """
+    Yield (float32 images, labels) batches with every labeled class drawn equally often.
+
+    Rows are sampled with replacement, weighted by 1 / class count, so rare
+    tones are oversampled at read time instead of copied on disk. With
+    augment=True the rows of oversampled classes (every class smaller than
+    the largest one) get color/lighting jitter from skin_augment.py so the
+    repeats are not pixel-identical. Unlabeled rows ("") are skipped.
+    Defaults to one epoch's worth of labeled rows.
+    """
+    from skin_augment import augment_batch
+
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(ds.labels)
+    labeled = np.flatnonzero(labels != "")
+    if len(labeled) == 0:
+        raise ValueError("dataset has no labeled rows to balance")
+    classes, inverse, counts = np.unique(labels[labeled], return_inverse=True, return_counts=True)
+    weights = 1.0 / counts[inverse]
+    weights /= weights.sum()
+    oversampled = counts < counts.max()
+
+    if n_batches is None:
+        n_batches = int(np.ceil(len(labeled) / batch_size))
+    for _ in range(n_batches):
+        pick = rng.choice(len(labeled), size=batch_size, p=weights)
+        rows = labeled[pick]
+        order = np.argsort(rows, kind="stable")  # sequential mmap reads
+        rows, pick = rows[order], pick[order]
+        batch = np.asarray(ds.raw[rows])
+        if augment:
+            jitter = oversampled[inverse[pick]]
+            if jitter.any():
+                batch[jitter] = augment_batch(batch[jitter], rng)
+        yield batch.astype(np.float32) / 255.0, labels[rows]
+
+
+def pyramid_path(size, out_dir=PYRAMID_DIR):
+    return Path(out_dir) / f"patches_{size}.npy"
+
+
+class PyramidWriter:
+    """Streams BGR patches into one preallocated uint8 RGB memmap per pyramid level."""
+
+    def __init__(self, n_max, sizes=PYRAMID_SIZES, out_dir=PYRAMID_DIR):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.levels = [create_pixel_memmap(pyramid_path(s, self.out_dir), n_max, (s, s)) for s in self.sizes]
+        self.filenames = []
+
+    def add(self, filename, patch_bgr):
+        """Write every level of one patch; each level is an INTER_AREA downscale of the previous."""
+        level = cv2.cvtColor(patch_bgr, cv2.COLOR_BGR2RGB)
+        for size, arr in zip(self.sizes, self.levels):
+            if level.shape[:2] != (size, size):
+                level = cv2.resize(level, (size, size), interpolation=cv2.INTER_AREA)
+            arr[len(self.filenames)] = level
+        self.filenames.append(filename)
+
+    def close(self):
+        n = len(self.filenames)
+        for arr in self.levels:
+            arr.flush()
+        self.levels = []
+        for size in self.sizes:
+            truncate_npy(pyramid_path(size, self.out_dir), n)
+        np.save(self.out_dir / "filenames.npy", np.asarray(self.filenames, dtype=str))
+        return n
+
+
+def load_pyramid(size, out_dir=PYRAMID_DIR):
+    """(mmap uint8 RGB array, filenames) for one pyramid level."""
+    path = pyramid_path(size, out_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found. Run extract_skin_patches.py --pyramid first.")
+    pixels = np.load(path, mmap_mode="r")
+    filenames = np.load(Path(out_dir) / "filenames.npy")
+    if len(pixels) != len(filenames):
+        raise ValueError(f"row count mismatch between {path.name} and filenames.npy")
+    return pixels, filenames
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+skin_features.py
+
+Batched color features for skin patches.
+
+Instead of one cvtColor + mean per patch, patches are stacked into a single
+(N, H, W, 3) uint8 array and every step runs once per batch:
+ - load_patch_batch():  decode patches into one BGR uint8 batch
+ - convert_batch():     one cv2.cvtColor call for the whole batch
+ - skin_mask():         vectorized YCrCb skin-pixel mask (drops hair, background, clothing)
+ - masked_stats():      per-patch mean / median / trimmed mean over the masked pixels
+ - lab_features():      all of the above -> (N, 3) L,a,b feature rows
+
+LAB values use OpenCV's 8-bit scaling (L 0..255, a/b offset by 128), the same
+space the clusters in labels/skin-tone-clusters.json were fitted in.
+
+Requires: pip install numpy opencv-python
+"""
+import cv2
+import numpy as np
+
+PATCH_SIZE = (128, 128)
+
+# Chai & Ngan YCrCb skin range
+CR_RANGE = (133, 173)
+CB_RANGE = (77, 127)
+
+# fall back to every pixel when less than this fraction of a patch looks like skin
+MIN_SKIN_FRACTION = 0.05
+
+# fraction cut from each tail for the trimmed mean
+TRIM = 0.1
+
+STATS = ("mean", "median", "trimmed")
+
+
+def load_patch_batch(paths, size=PATCH_SIZE):
+    """Decode patches into one (N, H, W, 3) uint8 BGR array. Returns (batch, kept_paths)."""
+    w, h = size
+    batch = np.empty((len(paths), h, w, 3), dtype=np.uint8)
+    kept = []
+    for p in paths:
+        img = cv2.imread(str(p), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"[WARN] cannot read {p}")
+            continue
+        if img.shape[:2] != (h, w):
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        batch[len(kept)] = img
+        kept.append(p)
+    return batch[:len(kept)], kept
+
+
+def convert_batch(batch, code):
+    """Apply one cv2.cvtColor to a whole (N, H, W, 3) batch by viewing it as a tall image."""
+    n, h, w, c = batch.shape
+    if n == 0:
+        return batch.copy()
+    flat = np.ascontiguousarray(batch).reshape(n * h, w, c)
+    return cv2.cvtColor(flat, code).reshape(n, h, w, -1)
+
+
+def skin_mask(batch_bgr):
+    """(N, H, W) bool mask of skin-colored pixels; patches with too little skin keep every pixel."""
+    if len(batch_bgr) == 0:
+        return np.zeros(batch_bgr.shape[:3], dtype=bool)
+    ycrcb = convert_batch(batch_bgr, cv2.COLOR_BGR2YCrCb)
+    cr = ycrcb[..., 1]
+    cb = ycrcb[..., 2]
+    mask = (
+        (cr >= CR_RANGE[0]) & (cr <= CR_RANGE[1])
+        & (cb >= CB_RANGE[0]) & (cb <= CB_RANGE[1])
+    )
+    frac = mask.reshape(len(mask), -1).mean(axis=1)
+    mask[frac < MIN_SKIN_FRACTION] = True
+    return mask
+
+
+def masked_histograms(values, mask):
+    """(N, C, 256) per-patch, per-channel histograms of uint8 values under mask."""
+    n, c = len(values), values.shape[-1]
+    vals = values.reshape(n, -1, c)
+    m = mask.reshape(n, -1)
+    offsets = (np.arange(n, dtype=np.int64) * 256)[:, None]
+    hist = np.empty((n, c, 256), dtype=np.int64)
+    for ch in range(c):
+        idx = (offsets + vals[..., ch])[m]
+        hist[:, ch] = np.bincount(idx, minlength=n * 256).reshape(n, 256)
+    return hist
+
+
+def masked_stats(values, mask, stat="median", trim=TRIM):
+    """
+    Per-patch statistic of uint8 channel values restricted to mask.
+
+    values: (N, H, W, C) uint8, mask: (N, H, W) bool -> (N, C) float64
+
+    Everything is read off one 256-bin histogram per patch and channel, so
+    median and trimmed mean are exact without sorting any pixels.
+    """
+    if stat not in STATS:
+        raise ValueError(f"unknown stat {stat!r}, expected one of {STATS}")
+    n, c = len(values), values.shape[-1]
+    if n == 0:
+        return np.empty((0, c), dtype=np.float64)
+    hist = masked_histograms(values, mask)
+    bins = np.arange(256, dtype=np.float64)
+    count = hist[:, :1, :].sum(axis=-1)  # (N, 1); >= 1 for every patch, see skin_mask()
+
+    if stat == "mean":
+        return (hist * bins).sum(axis=-1) / count
+
+    cdf = np.cumsum(hist, axis=-1)
+
+    if stat == "median":
+        # value at 0-based rank r = number of bins whose cdf is <= r
+        lo = (cdf <= ((count - 1) // 2)[..., None]).sum(axis=-1)
+        hi = (cdf <= (count // 2)[..., None]).sum(axis=-1)
+        return (lo + hi) / 2.0
+
+    # trimmed mean: keep ranks [cut, count - cut); each bin covers ranks [cdf - hist, cdf)
+    cut = np.floor(count * trim).astype(np.int64)
+    lo = cut[..., None]
+    hi = (count - cut)[..., None]
+    kept = np.clip(np.minimum(cdf, hi) - np.maximum(cdf - hist, lo), 0, None)
+    return (kept * bins).sum(axis=-1) / (hi - lo)[..., 0]
+
+
+def lab_features(batch_bgr, stat="median", use_skin_mask=True):
+    """(N, 3) L,a,b features for a BGR uint8 batch."""
+    lab = convert_batch(batch_bgr, cv2.COLOR_BGR2LAB)
+    if use_skin_mask:
+        mask = skin_mask(batch_bgr)
+    else:
+        mask = np.ones(batch_bgr.shape[:3], dtype=bool)
+    return masked_stats(lab, mask, stat=stat)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+skin_knn.py
+
+Propagates the hand-verified skin-tone labels (labels/skin-tone-labels.csv)
+to unlabeled patches in processed/skin-patches/ by k nearest neighbors in LAB
+feature space, as a local alternative to the global KMeans suggestions of
+auto_label_skin_tone.py.
+
+ - features:  skin_features.lab_features (same settings as the clusters),
+              cached per patch in .pipeline/skin-features.npz and recomputed
+              only for new or modified patches
+ - index:     KnnIndex, a sklearn KDTree over the labeled patches plus a small
+              brute-force buffer for insertions; the tree is rebuilt once the
+              buffer outgrows REBUILD_FRACTION of it. The index is saved to
+              .pipeline/skin-knn.npz: patches labeled since the last run are
+              inserted, and the index is refit only when labels changed or
+              were removed
+ - vote:      distance-weighted over the k neighbors; confidence is the winning
+              label's share of the weight, dist_mean the mean neighbor distance
+              (large = far from anything reviewed)
+
+Writes labels/skin-tone-knn_suggest.csv (filename, L, a, b, suggested_label,
+confidence, dist_mean) for every unlabeled patch and prints the leave-one-out
+agreement on the labeled set.
+
+Options:
+    --k N                neighbors per vote (default 7)
+    --min-confidence F   report how many suggestions reach F (default 0.8)
+    --stat, --no-skin-mask   feature settings, as in auto_label_skin_tone.py
+    --rebuild            ignore the saved index and feature cache
+
+Examples:
+    python scripts/skin_knn.py
+    python scripts/skin_knn.py --k 11 --min-confidence 0.9
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from auto_label_skin_tone import FEATURE_BATCH, FEATURE_STAT, iter_patch_paths
+from skin_features import STATS, lab_features, load_patch_batch
+
+ROOT = Path(__file__).resolve().parent.parent
+LABEL_FILE = ROOT / "labels" / "skin-tone-labels.csv"
+OUT_CSV = ROOT / "labels" / "skin-tone-knn_suggest.csv"
+FEATURE_CACHE = ROOT / ".pipeline" / "skin-features.npz"
+INDEX_FILE = ROOT / ".pipeline" / "skin-knn.npz"
+
+K = 7
+MIN_CONFIDENCE = 0.8
+LEAF_SIZE = 40
+REBUILD_FRACTION = 0.1       # rebuild the tree once the buffer holds this share of it
+REBUILD_MIN = 256            # ... or at least this many points
+QUERY_BATCH = 65536
+BRUTE_CELLS = 1 << 22        # query x buffer distances computed at once
+EPS = 1e-6
+
+CSV_COLUMNS = ["filename", "L", "a", "b", "suggested_label", "confidence", "dist_mean"]
+
+
+class KnnIndex:
+    """k-NN label index: KDTree over most points, brute-force buffer over recent insertions."""
+
+    def __init__(self, k=K, leaf_size=LEAF_SIZE):
+        self.k = k
+        self.leaf_size = leaf_size
+        self.classes = []
+        self.tree = None
+        self.X = np.empty((0, 3))
+        self.y = np.empty(0, dtype=np.int32)
+        self.names = np.empty(0, dtype=object)
+        self.n_tree = 0                          # rows [0, n_tree) are in the tree, the rest in the buffer
+
+    def __len__(self):
+        return len(self.X)
+
+    def _codes(self, labels):
+        codes = []
+        for label in labels:
+            if label not in self.classes:
+                self.classes.append(label)
+            codes.append(self.classes.index(label))
+        return np.asarray(codes, dtype=np.int32)
+
+    def fit(self, X, labels, names):
+        self.classes = sorted(set(labels))
+        self.X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        self.y = self._codes(labels)
+        self.names = np.asarray(names, dtype=object)
+        self.rebuild()
+        return self
+
+    def rebuild(self):
+        self.tree = KDTree(self.X, leaf_size=self.leaf_size) if len(self.X) else None
+        self.n_tree = len(self.X)
+
+    def insert(self, X, labels, names):
+        """Add labeled points; they are searched brute force until the next rebuild."""
+        self.X = np.concatenate([self.X, np.asarray(X, dtype=np.float64).reshape(-1, 3)])
+        self.y = np.concatenate([self.y, self._codes(labels)])
+        self.names = np.concatenate([self.names, np.asarray(names, dtype=object)])
+        if len(self.X) - self.n_tree > max(REBUILD_MIN, REBUILD_FRACTION * self.n_tree):
+            self.rebuild()
+
+    def query(self, X, k=None):
+        """(distances, indices), each (N, k), nearest first, over the tree and the buffer."""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 3)
+        k = min(k or self.k, len(self.X))
+        parts_d, parts_i = [], []
+        if self.tree is not None:
+            d, i = self.tree.query(X, k=min(k, self.n_tree))
+            parts_d.append(d)
+            parts_i.append(i)
+        if len(self.X) > self.n_tree:
+            buf = self.X[self.n_tree:]
+            kb = min(k, len(buf))
+            step = max(1, BRUTE_CELLS // len(buf))
+            bd, bi = [], []
+            for start in range(0, len(X), step):
+                d = np.sqrt(((X[start:start + step, None, :] - buf[None, :, :]) ** 2).sum(axis=2))
+                i = np.argpartition(d, kb - 1, axis=1)[:, :kb]
+                bd.append(np.take_along_axis(d, i, axis=1))
+                bi.append(i + self.n_tree)
+            parts_d.append(np.concatenate(bd))
+            parts_i.append(np.concatenate(bi))
+        d, i = np.concatenate(parts_d, axis=1), np.concatenate(parts_i, axis=1)
+        order = np.argsort(d, axis=1)[:, :k]
+        return np.take_along_axis(d, order, axis=1), np.take_along_axis(i, order, axis=1)
+
+    def vote(self, d, i):
+        """Distance-weighted vote over neighbor rows. Returns (labels, confidence, dist_mean)."""
+        w = 1.0 / (d + EPS)
+        scores = np.zeros((len(d), len(self.classes)))
+        rows = np.arange(len(d))
+        for j in range(d.shape[1]):              # one neighbor per row per step: no repeated index
+            scores[rows, self.y[i[:, j]]] += w[:, j]
+        best = scores.argmax(axis=1)
+        conf = scores[np.arange(len(d)), best] / scores.sum(axis=1)
+        return [self.classes[c] for c in best], conf, d.mean(axis=1)
+
+    def predict(self, X, batch_size=QUERY_BATCH):
+        """(labels, confidence, dist_mean) for every row of X."""
+        labels, conf, dist = [], [], []
+        for start in range(0, len(X), batch_size):
+            lb, c, dm = self.vote(*self.query(X[start:start + batch_size]))
+            labels += lb
+            conf.append(c)
+            dist.append(dm)
+        if not labels:
+            return [], np.empty(0), np.empty(0)
+        return labels, np.concatenate(conf), np.concatenate(dist)
+
+    def leave_one_out(self):
+        """Share of labeled points whose neighbors (excluding themselves) vote their own label."""
+        if len(self.X) <= self.k:
+            return float("nan")
+        d, i = self.query(self.X, self.k + 1)
+        labels, _, _ = self.vote(d[:, 1:], i[:, 1:])
+        return float(np.mean(np.asarray(labels, dtype=object) == np.asarray(self.classes, dtype=object)[self.y]))
+
+    # -- persistence ------------------------------------------------------
+    def save(self, path, features):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, X=self.X, y=self.y, names=self.names.astype(str), classes=np.array(self.classes),
+                 k=self.k, stat=features["stat"], skin_mask=features["skin_mask"])
+
+    @classmethod
+    def load(cls, path, features, k=K):
+        """Saved index, or None if missing or built with other feature settings."""
+        if not path.exists():
+            return None
+        z = np.load(path, allow_pickle=False)
+        if str(z["stat"]) != features["stat"] or bool(z["skin_mask"]) != features["skin_mask"]:
+            return None
+        index = cls(k)
+        index.classes = [str(c) for c in z["classes"]]
+        index.X, index.y, index.names = z["X"], z["y"].astype(np.int32), z["names"].astype(object)
+        index.rebuild()
+        return index
+
+
+# -----------------------------
+# Features and labels
+# -----------------------------
+def load_features(paths, features, cache=FEATURE_CACHE, use_cache=True, batch_size=FEATURE_BATCH):
+    """
+    DataFrame filename, L, a, b for paths; only patches new or changed since
+    the cache are decoded. Unreadable patches are cached as NaN rows (so they
+    are not retried until they change) and left out of the result.
+    """
+    stats = {p.name: p.stat() for p in paths}
+    key = pd.DataFrame({"filename": list(stats),
+                        "size": [s.st_size for s in stats.values()],
+                        "mtime_ns": [s.st_mtime_ns for s in stats.values()]})
+    cached = pd.DataFrame(columns=["filename", "size", "mtime_ns", "L", "a", "b"])
+    if use_cache and cache.exists():
+        z = np.load(cache, allow_pickle=False)
+        if str(z["stat"]) == features["stat"] and bool(z["skin_mask"]) == features["skin_mask"]:
+            cached = pd.DataFrame({"filename": z["filename"], "size": z["size"], "mtime_ns": z["mtime_ns"],
+                                   "L": z["lab"][:, 0], "a": z["lab"][:, 1], "b": z["lab"][:, 2]})
+    df = key.merge(cached, on=["filename", "size", "mtime_ns"], how="left", indicator=True).set_index("filename")
+
+    todo = df.index[df.pop("_merge") == "left_only"]
+    by_name = {p.name: p for p in paths}
+    for start in range(0, len(todo), batch_size):
+        batch, kept = load_patch_batch([by_name[n] for n in todo[start:start + batch_size]])
+        if not kept:
+            continue
+        lab = lab_features(batch, stat=features["stat"], use_skin_mask=features["skin_mask"])
+        df.loc[[p.name for p in kept], ["L", "a", "b"]] = lab
+    df = df.reset_index()
+
+    if len(todo):
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache, filename=df["filename"].to_numpy(str), size=df["size"].to_numpy(np.int64),
+                 mtime_ns=df["mtime_ns"].to_numpy(np.int64), lab=df[["L", "a", "b"]].to_numpy(np.float64),
+                 stat=features["stat"], skin_mask=features["skin_mask"])
+    df = df.dropna(subset=["L"])   # unreadable patches
+    return df[["filename", "L", "a", "b"]].reset_index(drop=True), len(todo)
+
+
+def load_labels(path=LABEL_FILE):
+    """filename -> hand-verified skin_tone."""
+    if not path.exists():
+        raise SystemExit(f"[ERR] {path} not found. Label some patches by hand first.")
+    df = pd.read_csv(path, dtype=str).dropna(subset=["filename", "skin_tone"])
+    return dict(zip(df["filename"], df["skin_tone"]))
+
+
+def sync_index(index, labeled, k):
+    """Bring a saved index up to date with labeled (DataFrame filename, L, a, b, skin_tone)."""
+    if index is not None:
+        current = dict(zip(index.names, (index.classes[c] for c in index.y)))
+        wanted = dict(zip(labeled["filename"], labeled["skin_tone"]))
+        if all(wanted.get(n) == lab for n, lab in current.items()):
+            new = labeled[~labeled["filename"].isin(current)]
+            index.k = k
+            if len(new):
+                index.insert(new[["L", "a", "b"]].to_numpy(), list(new["skin_tone"]), new["filename"])
+            return index, "inserted", len(new)
+    index = KnnIndex(k).fit(labeled[["L", "a", "b"]].to_numpy(), list(labeled["skin_tone"]), labeled["filename"])
+    return index, "fit", len(index)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Propagate hand skin-tone labels to unlabeled patches by kNN.")
+    ap.add_argument("--k", type=int, default=K)
+    ap.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    ap.add_argument("--stat", choices=STATS, default=FEATURE_STAT)
+    ap.add_argument("--no-skin-mask", action="store_true")
+    ap.add_argument("--rebuild", action="store_true", help="ignore the saved index and feature cache")
+    ap.add_argument("--out", type=Path, default=OUT_CSV)
+    args = ap.parse_args()
+    features = {"stat": args.stat, "skin_mask": not args.no_skin_mask}
+
+    t0 = time.perf_counter()
+    hand = load_labels()
+    df, n_new = load_features(list(iter_patch_paths()), features, use_cache=not args.rebuild)
+    is_labeled = df["filename"].isin(hand)
+    labeled = df[is_labeled].assign(skin_tone=lambda d: d["filename"].map(hand))
+    unlabeled = df[~is_labeled]
+    if len(labeled) == 0:
+        raise SystemExit("[ERR] none of the hand-labeled files are in processed/skin-patches/")
+    t1 = time.perf_counter()
+
+    index = None if args.rebuild else KnnIndex.load(INDEX_FILE, features, args.k)
+    index, how, n_index = sync_index(index, labeled, args.k)
+    t2 = time.perf_counter()
+
+    labels, conf, dist = index.predict(unlabeled[["L", "a", "b"]].to_numpy())
+    t3 = time.perf_counter()
+    out = unlabeled.assign(suggested_label=labels, confidence=np.round(conf, 4), dist_mean=np.round(dist, 3))
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    out[CSV_COLUMNS].to_csv(args.out, index=False)
+    index.save(INDEX_FILE, features)
+    loo = index.leave_one_out()
+
+    per_patch_us = (t3 - t2) / max(len(out), 1) * 1e6
+    print(f"Features: {len(df)} patches ({n_new} newly computed) in {t1 - t0:.1f}s")
+    print(f"Index: {len(index)} labeled patches ({how}: {n_index}), {len(index.classes)} labels, k={index.k}")
+    print(f"Propagated {len(out)} patches in {(t3 - t2) * 1e3:.1f} ms ({per_patch_us:.2f} µs/patch)")
+    print(f"Confidence >= {args.min_confidence}: {int((conf >= args.min_confidence).sum())}/{len(out)}")
+    print(f"Leave-one-out agreement on labeled patches: {loo:.1%}")
+    for label, n in pd.Series(labels, dtype=object).value_counts().items():
+        print(f"  {label:12} {n}")
+    print(f"[OK] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+stylemate_api.py
+
+Image in, body shape and skin tone out, as an importable API with no
+import-time side effects. The steps are the pipeline's own functions:
+ - landmarks:   extract_landmarks.detect_frame (MediaPipe Pose + normalize_landmarks)
+ - body shape:  auto_label_body_shape.body_ratios + classify, vectorized over the batch
+ - skin patch:  extract_skin_patches face/upper-body crop (center crop with kind="skin")
+ - skin tone:   skin_features.lab_features over the batch, then the nearest
+                centroid stored in labels/skin-tone-clusters.json (no refit)
+
+Models are created on first use and reused: Pose and the Haar cascades once
+per process, the centroids once per Analyzer. Skin-tone fields are None when
+no centroid file exists yet (run auto_label_skin_tone.py once).
+
+Usage:
+    from stylemate_api import analyze
+    results = analyze(["raw/body/a.jpg", bgr_array])   # paths or BGR uint8 arrays
+    results[0]["body_shape"], results[0]["skin_tone"]
+
+    python scripts/stylemate_api.py raw/body/a.jpg raw/body/b.jpg
+
+Each result: landmarks ((33, 4) float32 [x, y, z, visibility], torso
+normalized, or None), body_shape, SHR, WHR, skin_patch ((128, 128, 3) BGR
+uint8), skin_lab, skin_tone, error (None or "unreadable" / "no_person").
+
+Latency (p50/p99 per call, single image and batch) is measured by
+benchmark.py --only api_single api_batch.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+CENTROIDS = ROOT / "labels" / "skin-tone-clusters.json"
+MODEL_COMPLEXITY = 2
+
+
+class Analyzer:
+    """Reusable analyzer; models load lazily on the first analyze() call."""
+
+    def __init__(self, model_complexity=MODEL_COMPLEXITY, centroids=CENTROIDS):
+        self.model_complexity = model_complexity
+        self.centroids_path = Path(centroids)
+        self._centroids = None
+
+    def warm(self):
+        """Load every model now instead of on the first call."""
+        import extract_landmarks
+        import extract_skin_patches
+        extract_landmarks.get_pose(self.model_complexity)
+        extract_skin_patches.get_cascades()
+        self.centroids()
+        return self
+
+    def centroids(self):
+        """(centroids, cluster_ids, labels, features) from the centroid file, or None if it is missing."""
+        if self._centroids is None and self.centroids_path.exists():
+            from auto_label_skin_tone import load_centroids
+            self._centroids = load_centroids(self.centroids_path)
+        return self._centroids
+
+    # -- steps ------------------------------------------------------------
+    @staticmethod
+    def load(image):
+        import cv2
+        if isinstance(image, np.ndarray):
+            return image
+        return cv2.imread(str(image), cv2.IMREAD_COLOR)
+
+    def landmarks(self, img):
+        from extract_landmarks import detect_frame
+        pts = detect_frame(img, model_complexity=self.model_complexity)
+        if pts is None:
+            return None
+        return np.array([[p["x"], p["y"], p["z"], p["visibility"]] for p in pts], dtype=np.float32)
+
+    @staticmethod
+    def skin_patch(img, kind="body"):
+        from extract_skin_patches import extract_patch_from_body, manual_center_crop, normalize_patch
+        crop = manual_center_crop(img) if kind == "skin" else extract_patch_from_body(img)
+        return normalize_patch(crop)
+
+    def skin_tones(self, patches):
+        """(lab (N, 3), labels [N]) for a list of patches; labels are None without centroids."""
+        from skin_features import lab_features
+        stored = self.centroids()
+        batch = np.stack(patches)
+        if stored is None:
+            return lab_features(batch), [None] * len(patches)
+        from auto_label_skin_tone import nearest_centroid
+        centroids, _, labels, features = stored
+        lab = lab_features(batch, stat=features["stat"], use_skin_mask=features["skin_mask"])
+        return lab, [labels[i] for i in nearest_centroid(lab, centroids)]
+
+    # -- API ----------------------------------------------------------------
+    def analyze(self, images, kind="body"):
+        """Analyze a batch of images (paths or BGR arrays). Returns one dict per image, in order."""
+        from auto_label_body_shape import body_ratios, classify
+
+        if isinstance(images, (str, Path, np.ndarray)):
+            images = [images]
+        results = []
+        for image in images:
+            img = self.load(image)
+            r = {"source": None if isinstance(image, np.ndarray) else str(image),
+                 "landmarks": None, "body_shape": None, "SHR": None, "WHR": None,
+                 "skin_patch": None, "skin_lab": None, "skin_tone": None, "error": None}
+            if img is None:
+                r["error"] = "unreadable"
+            else:
+                if kind == "body":
+                    r["landmarks"] = self.landmarks(img)
+                    if r["landmarks"] is None:
+                        r["error"] = "no_person"
+                r["skin_patch"] = self.skin_patch(img, kind)
+            results.append(r)
+
+        with_lm = [r for r in results if r["landmarks"] is not None]
+        if with_lm:
+            ratios = body_ratios(np.stack([r["landmarks"] for r in with_lm]))
+            for i, r in enumerate(with_lm):
+                shr, whr = float(ratios["SHR"][i]), float(ratios["WHR"][i])
+                if np.isfinite(shr) and np.isfinite(whr):
+                    r.update(body_shape=classify(shr, whr), SHR=round(shr, 4), WHR=round(whr, 4))
+
+        with_patch = [r for r in results if r["skin_patch"] is not None]
+        if with_patch:
+            lab, tones = self.skin_tones([r["skin_patch"] for r in with_patch])
+            for r, row, tone in zip(with_patch, lab, tones):
+                r.update(skin_lab=[round(float(v), 2) for v in row], skin_tone=tone)
+        return results
+
+
+_default = None
+
+
+def analyze(images, kind="body"):
+    """analyze() on a process-wide Analyzer, so models load once and are reused across calls."""
+    global _default
+    if _default is None:
+        _default = Analyzer()
+    return _default.analyze(images, kind)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Body shape and skin tone for images.")
+    ap.add_argument("images", nargs="+", type=Path)
+    ap.add_argument("--kind", choices=["body", "skin"], default="body",
+                    help="skin: close-up images (center crop, no pose)")
+    ap.add_argument("--landmarks", action="store_true", help="include the 33 landmarks in the output")
+    ap.add_argument("--model-complexity", type=int, choices=[0, 1, 2], default=MODEL_COMPLEXITY)
+    args = ap.parse_args()
+
+    results = Analyzer(args.model_complexity).analyze(args.images, args.kind)
+    for r in results:
+        r.pop("skin_patch")
+        lm = r.pop("landmarks")
+        if args.landmarks and lm is not None:
+            r["landmarks"] = lm.round(6).tolist()
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
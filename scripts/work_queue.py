@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+work_queue.py
+
+Lease-based work queue in SQLite, so several processes or machines sharing
+the repo volume can split the per-image work of prefilter_images.py,
+extract_landmarks.py and extract_skin_patches.py.
+
+ - tasks:   one row per (job, image); images are stored relative to the repo
+            root, so machines may mount the volume at different paths
+ - claim:   a worker leases a batch of pending tasks (or tasks whose lease
+            expired) in one transaction; each claim counts as an attempt
+ - lease:   a heartbeat thread extends the worker's leases every LEASE/3 s;
+            a worker that dies simply stops renewing and its tasks are
+            claimed again once the lease expires (at most MAX_ATTEMPTS times,
+            then the task is marked failed)
+ - outputs: every task writes its own files by temp file + rename
+            (landmark JSON, skin patch), so a task that runs twice leaves
+            the same result; small per-image results (patch metadata,
+            detections, prefilter rows) are stored on the task row
+ - merge:   builds the aggregates from the finished tasks: the landmark CSV,
+            skin_patch_metadata.json plus the detection cache, prefilter.csv
+
+Jobs (same per-image code and outputs as the scripts):
+    prefilter    prefilter_images.screen
+    landmarks    extract_landmarks.detect_frame; like the script, images
+                 without a person (or unreadable) are deleted from raw/body
+    skin_patch   extract_skin_patches.patch_from_frame
+
+The database must sit on a filesystem with working POSIX locks (local disk,
+NFSv4, SMB with locking); it uses the rollback journal, not WAL, because WAL
+needs shared memory on one host.
+
+Usage:
+    python scripts/work_queue.py enqueue landmarks skin_patch     # all raw images of each job
+    python scripts/work_queue.py enqueue landmarks --files @changed.txt --force
+    python scripts/work_queue.py work --jobs landmarks            # on every box, any number of times
+    python scripts/work_queue.py status
+    python scripts/work_queue.py merge landmarks skin_patch
+    python scripts/work_queue.py run prefilter --workers 4        # enqueue + N local workers + merge
+    python scripts/work_queue.py retry                            # failed tasks back to pending
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import closing
+from pathlib import Path
+
+import cv2
+
+from instrumentation import Telemetry
+
+ROOT = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT / ".pipeline" / "work_queue.sqlite"
+RAW_BODY = ROOT / "raw" / "body"
+RAW_SKIN = ROOT / "raw" / "skin"
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+JOB_DIRS = {"prefilter": (RAW_BODY, RAW_SKIN), "landmarks": (RAW_BODY,), "skin_patch": (RAW_SKIN, RAW_BODY)}
+JOBS = tuple(JOB_DIRS)
+
+LEASE_S = 120.0
+BATCH = 8
+MAX_ATTEMPTS = 3
+POLL_S = 2.0               # idle wait while other workers still hold leases
+BUSY_TIMEOUT_S = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id            INTEGER PRIMARY KEY,
+    job           TEXT NOT NULL,
+    path          TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    worker        TEXT,
+    lease_expires REAL,
+    output        TEXT,
+    error         TEXT,
+    updated       REAL,
+    UNIQUE (job, path)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks(job, status, lease_expires);
+CREATE TABLE IF NOT EXISTS workers (
+    worker    TEXT PRIMARY KEY,
+    started   REAL,
+    heartbeat REAL,
+    done      INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def connect(db_path=DB_PATH):
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+    con.execute("PRAGMA journal_mode=DELETE")
+    con.executescript(SCHEMA)
+    return con
+
+
+def rel_path(path):
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def list_images(job):
+    return sorted(f for folder in JOB_DIRS[job] if folder.exists()
+                  for f in folder.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_EXTS)
+
+
+# -----------------------------
+# Queue
+# -----------------------------
+class WorkQueue:
+    """Queue operations on one connection (one per process or thread)."""
+
+    def __init__(self, db_path=DB_PATH, lease_s=LEASE_S, max_attempts=MAX_ATTEMPTS):
+        self.con = connect(db_path)
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+
+    def close(self):
+        self.con.close()
+
+    def enqueue(self, job, paths, force=False):
+        """Add (job, path) tasks; existing ones keep their state unless force resets them to pending."""
+        rows = [(job, rel_path(p), time.time()) for p in paths]
+        self.con.execute("BEGIN IMMEDIATE")
+        before = self.con.total_changes
+        self.con.executemany("INSERT OR IGNORE INTO tasks (job, path, updated) VALUES (?, ?, ?)", rows)
+        added = self.con.total_changes - before
+        if force:
+            self.con.executemany("""
+                UPDATE tasks SET status = 'pending', attempts = 0, worker = NULL, lease_expires = NULL,
+                                 output = NULL, error = NULL, updated = ?
+                WHERE job = ? AND path = ?""", [(t, j, p) for j, p, t in rows])
+        self.con.execute("COMMIT")
+        return added
+
+    def claim(self, worker, jobs, n=BATCH):
+        """Lease up to n runnable tasks: [(id, job, path)]. Expired leases are taken over."""
+        now = time.time()
+        marks = ",".join("?" * len(jobs))
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            # leases that ran out on their last attempt fail instead of running again
+            self.con.execute(f"""
+                UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), updated = ?
+                WHERE job IN ({marks}) AND status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                             (now, *jobs, now, self.max_attempts))
+            rows = self.con.execute(f"""
+                SELECT id, job, path FROM tasks
+                WHERE job IN ({marks}) AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                ORDER BY id LIMIT ?""", (*jobs, now, n)).fetchall()
+            self.con.executemany("""
+                UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1,
+                                 updated = ? WHERE id = ?""",
+                                 [(worker, now + self.lease_s, now, r[0]) for r in rows])
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        return rows
+
+    def heartbeat(self, worker):
+        """Extend every lease this worker holds."""
+        now = time.time()
+        self.con.execute("UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = 'leased'",
+                         (now + self.lease_s, worker))
+        self.con.execute("INSERT INTO workers (worker, started, heartbeat) VALUES (?, ?, ?) "
+                         "ON CONFLICT(worker) DO UPDATE SET heartbeat = excluded.heartbeat",
+                         (worker, now, now))
+
+    def complete(self, worker, task_id, output):
+        # a task whose lease was taken over may finish twice; outputs are idempotent, last one wins
+        self.con.execute("BEGIN IMMEDIATE")
+        self.con.execute("UPDATE tasks SET status = 'done', output = ?, error = NULL, worker = ?, updated = ? "
+                         "WHERE id = ?", (json.dumps(output), worker, time.time(), task_id))
+        self.con.execute("UPDATE workers SET done = done + 1 WHERE worker = ?", (worker,))
+        self.con.execute("COMMIT")
+
+    def fail(self, worker, task_id, error):
+        """Back to pending for another attempt, or failed once MAX_ATTEMPTS are used."""
+        self.con.execute("""
+            UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                             error = ?, lease_expires = NULL, updated = ?
+            WHERE id = ? AND worker = ?""", (self.max_attempts, error, time.time(), task_id, worker))
+
+    def active(self, jobs):
+        """Tasks of these jobs that are pending or leased (some worker may still finish them)."""
+        marks = ",".join("?" * len(jobs))
+        return self.con.execute(f"SELECT COUNT(*) FROM tasks WHERE job IN ({marks}) "
+                                "AND status IN ('pending', 'leased')", jobs).fetchone()[0]
+
+    def retry(self, jobs):
+        marks = ",".join("?" * len(jobs))
+        return self.con.execute(f"""
+            UPDATE tasks SET status = 'pending', attempts = 0, lease_expires = NULL, updated = ?
+            WHERE job IN ({marks}) AND status = 'failed'""", (time.time(), *jobs)).rowcount
+
+    def finished(self, job):
+        """[(path, output dict)] of the job's done tasks, in path order."""
+        return [(p, json.loads(o)) for p, o in self.con.execute(
+            "SELECT path, output FROM tasks WHERE job = ? AND status = 'done' ORDER BY path", (job,))]
+
+    def counts(self):
+        return self.con.execute("SELECT job, status, COUNT(*) FROM tasks GROUP BY job, status "
+                                "ORDER BY job, status").fetchall()
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renews a worker's leases every lease/3 seconds on its own connection.
+    A failed renewal (database locked past the busy timeout) is logged and
+    retried; once no renewal has succeeded for a whole lease, `lost` is set
+    and the worker stops, since its tasks may already run elsewhere.
+    """
+
+    def __init__(self, db_path, worker, lease_s):
+        super().__init__(daemon=True)
+        self.db_path, self.worker, self.lease_s = db_path, worker, lease_s
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        queue = WorkQueue(self.db_path, self.lease_s)
+        last_ok = time.time()
+        try:
+            while not self.stopped.wait(self.lease_s / 3):
+                try:
+                    queue.heartbeat(self.worker)
+                    last_ok = time.time()
+                except sqlite3.OperationalError as e:
+                    print(f"[WARN] heartbeat of {self.worker} failed: {e}", file=sys.stderr)
+                    if time.time() - last_ok >= self.lease_s:
+                        self.lost.set()
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+# -----------------------------
+# Jobs: one image in, files written atomically, a small JSON-able result out
+# -----------------------------
+def write_atomic(path, data):
+    """Write through a unique temp file in the same directory, then rename over path."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def run_prefilter(path):
+    from prefilter_images import screen
+    row = screen(path)
+    return {"status": row["status"], "row": row}
+
+
+def run_landmarks(path):
+    from extract_landmarks import OUT_DIR, detect_frame
+    img = cv2.imread(str(path))
+    if img is None:
+        path.unlink(missing_ok=True)
+        return {"status": "unreadable"}
+    lms = detect_frame(img)
+    if lms is None:
+        path.unlink(missing_ok=True)
+        return {"status": "no_person"}
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    write_atomic(OUT_DIR / f"{path.stem}.json", json.dumps(lms, indent=2).encode())
+    return {"status": "kept"}
+
+
+def run_skin_patch(path):
+    from datetime import datetime
+    from extract_skin_patches import OUT_DIR, from_raw_skin, patch_from_frame, patch_name
+    img = cv2.imread(str(path))
+    if img is None:
+        return {"status": "unreadable"}
+    patch, detection, digest = patch_from_frame(img, path)
+    ok, buf = cv2.imencode(".jpg", patch)
+    if not ok:
+        raise RuntimeError(f"could not encode patch {patch_name(path)}")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    write_atomic(OUT_DIR / patch_name(path), buf.tobytes())
+    meta = {"source": str(path), "method": "manual_center_crop" if from_raw_skin(path) else "face/upperbody/fallback"}
+    if detection is not None:
+        meta["detection"] = detection.method
+    meta["timestamp"] = datetime.now().isoformat()
+    return {"status": "kept", "patch": patch_name(path), "meta": meta,
+            "detection": list(detection) if detection is not None else None, "sha256": digest}
+
+
+RUNNERS = {"prefilter": run_prefilter, "landmarks": run_landmarks, "skin_patch": run_skin_patch}
+
+
+def work(jobs, db_path=DB_PATH, batch=BATCH, lease_s=LEASE_S, worker=None, verbose=False):
+    """Claim and run tasks until none of these jobs is pending or leased. Returns tasks done."""
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(db_path, lease_s)
+    queue.heartbeat(worker)
+    beat = Heartbeat(db_path, worker, lease_s)
+    beat.start()
+    done = 0
+    tel = Telemetry(f"work_queue[{worker}]", verbose=verbose)
+    try:
+        with tel:
+            while True:
+                if beat.lost.is_set():
+                    raise RuntimeError(f"{worker}: leases not renewed for {lease_s:.0f}s, stopping")
+                tasks = queue.claim(worker, jobs, batch)
+                if not tasks:
+                    if not queue.active(jobs):
+                        break
+                    time.sleep(POLL_S)           # others hold leases; take over any that expire
+                    continue
+                for task_id, job, rel in tasks:
+                    if beat.lost.is_set():
+                        break
+                    path = ROOT / rel
+                    try:
+                        with tel.time(job):
+                            output = RUNNERS[job](path) if path.exists() else {"status": "missing"}
+                        queue.complete(worker, task_id, output)
+                        tel.count(f"{job}:{output['status']}")
+                        tel.log(f"[{job}] {rel} → {output['status']}")
+                        done += 1
+                    except Exception:
+                        queue.fail(worker, task_id, traceback.format_exc())
+                        tel.count(f"{job}:error")
+                        tel.warn(f"[ERR] {job} {rel}\n{traceback.format_exc()}")
+                    tel.advance()
+    finally:
+        beat.stop()
+        queue.close()
+    return done
+
+
+def _local_worker(jobs, db_path, batch, lease_s):
+    cv2.setNumThreads(1)                      # N workers share the box
+    work(jobs, db_path, batch, lease_s)
+
+
+# -----------------------------
+# Merge: aggregates from finished tasks
+# -----------------------------
+def merge_prefilter(queue):
+    from prefilter_images import OUT_CSV, write_rows
+    done = queue.finished("prefilter")
+    rows = [o["row"] for _, o in done if "row" in o]
+    write_rows(rows, OUT_CSV, touched={p for p, _ in done})
+    return f"{len(rows)} rows → {OUT_CSV}"
+
+
+def merge_landmarks(queue):
+    import pandas as pd
+    from extract_landmarks import OUT_CSV, OUT_DIR, flatten_landmarks, merge_rows
+    done = queue.finished("landmarks")
+    rows = []
+    for rel, out in done:
+        json_path = OUT_DIR / f"{Path(rel).stem}.json"
+        if out["status"] == "kept":
+            rows.append(flatten_landmarks(json.loads(json_path.read_text()), Path(rel).name))
+        else:
+            json_path.unlink(missing_ok=True)    # image deleted or gone: drop its landmarks too
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    merge_rows(rows, {Path(rel).name for rel, _ in done})
+    n = len(pd.read_csv(OUT_CSV)) if OUT_CSV.exists() else 0
+    return f"{len(rows)} kept of {len(done)} → {OUT_CSV} ({n} rows)"
+
+
+def merge_skin_patch(queue):
+    from detection_cache import Detection, DetectionCache
+    from extract_skin_patches import DETECTOR_KEY, META_FILE, OUT_DIR, load_metadata, patch_name
+    done = queue.finished("skin_patch")
+    metadata = load_metadata()
+    kept = 0
+    with DetectionCache(DETECTOR_KEY) as cache:
+        for rel, out in done:
+            if out["status"] == "kept":
+                metadata[out["patch"]] = out["meta"]
+                if out["detection"] is not None:
+                    method, box = out["detection"]
+                    cache.put(out["sha256"], Detection(method, box))
+                kept += 1
+            elif out["status"] == "missing":     # raw image deleted since: drop its patch
+                name = patch_name(ROOT / rel)
+                (OUT_DIR / name).unlink(missing_ok=True)
+                metadata.pop(name, None)
+    META_FILE.write_text(json.dumps(metadata, indent=2), encoding="utf-8")
+    return f"{kept} patches of {len(done)} → {META_FILE}"
+
+
+MERGERS = {"prefilter": merge_prefilter, "landmarks": merge_landmarks, "skin_patch": merge_skin_patch}
+
+
+def print_status(queue):
+    counts = queue.counts()
+    if not counts:
+        print("Queue is empty")
+        return
+    by_job = {}
+    for job, status, n in counts:
+        by_job.setdefault(job, {})[status] = n
+    print(f"{'job':12} {'pending':>8} {'leased':>8} {'done':>8} {'failed':>8}")
+    for job, c in by_job.items():
+        print(f"{job:12} " + " ".join(f"{c.get(s, 0):8}" for s in ("pending", "leased", "done", "failed")))
+    now = time.time()
+    for worker, hb, n in queue.con.execute("SELECT worker, heartbeat, done FROM workers ORDER BY heartbeat DESC"):
+        print(f"  {worker:32} {n:8} done, last heartbeat {now - hb:6.0f}s ago")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Shared lease-based work queue for per-image pipeline jobs.",
+                                 fromfile_prefix_chars="@")
+    ap.add_argument("--db", type=Path, default=DB_PATH, help="queue database (on the shared volume)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    enq = sub.add_parser("enqueue", help="add per-image tasks")
+    enq.add_argument("jobs", nargs="+", choices=JOBS)
+    enq.add_argument("--files", nargs="+", type=Path, default=None, help="only these images")
+    enq.add_argument("--force", action="store_true", help="reset existing tasks to pending")
+
+    wrk = sub.add_parser("work", help="claim and run tasks until the queue is drained")
+    run = sub.add_parser("run", help="enqueue, run N local worker processes, merge")
+    run.add_argument("jobs", nargs="+", choices=JOBS)
+    run.add_argument("--workers", type=int, default=os.cpu_count())
+    for p in (wrk, run):
+        if p is wrk:
+            p.add_argument("--jobs", nargs="+", choices=JOBS, default=list(JOBS))
+            p.add_argument("--verbose", action="store_true")
+        p.add_argument("--batch", type=int, default=BATCH, help="tasks per claim")
+        p.add_argument("--lease", type=float, default=LEASE_S, help="lease length, s")
+
+    mrg = sub.add_parser("merge", help="build the aggregate outputs from finished tasks")
+    mrg.add_argument("jobs", nargs="+", choices=JOBS)
+    sub.add_parser("status", help="task counts per job and worker heartbeats")
+    rty = sub.add_parser("retry", help="put failed tasks back in the queue")
+    rty.add_argument("jobs", nargs="*", choices=JOBS, default=list(JOBS))
+    args = ap.parse_args()
+
+    if args.cmd == "work":
+        n = work(args.jobs, args.db, args.batch, args.lease, verbose=args.verbose)
+        print(f"Worker finished {n} tasks")
+        return
+
+    with closing(WorkQueue(args.db)) as queue:
+        if args.cmd in ("enqueue", "run"):
+            files = getattr(args, "files", None)
+            for job in args.jobs:
+                paths = list_images(job) if files is None else [
+                    f for f in files if any(f.resolve().parent == d.resolve() for d in JOB_DIRS[job])]
+                added = queue.enqueue(job, paths, getattr(args, "force", False))
+                print(f"{job}: {added} new tasks ({len(paths)} images)")
+        if args.cmd == "run":
+            procs = [mp.Process(target=_local_worker, args=(args.jobs, args.db, args.batch, args.lease))
+                     for _ in range(max(1, args.workers))]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+        if args.cmd in ("merge", "run"):
+            for job in args.jobs:
+                print(f"{job}: {MERGERS[job](queue)}")
+        if args.cmd == "retry":
+            print(f"{queue.retry(args.jobs)} failed tasks back to pending")
+        if args.cmd in ("status", "run"):
+            print_status(queue)
+        if args.cmd == "run" and any(p.exitcode for p in procs):
+            sys.exit("[ERR] a worker exited with an error")
+
+
+if __name__ == "__main__":
+    main()
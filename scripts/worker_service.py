@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+worker_service.py
+
+Long-lived local service that keeps MediaPipe Pose and the Haar cascades
+warm in a process pool, so small incremental batches do not pay interpreter
+start-up and model load on every extract_landmarks.py /
+extract_skin_patches.py run.
+
+ - serve:   start the pool (each worker loads the models once) and listen on
+            a Unix socket (.pipeline/worker.sock) or, with --address
+            HOST:PORT, on localhost TCP. Connections are authenticated with a
+            random key written to .pipeline/worker.key (mode 0600).
+ - clients: send a batch of image paths for one job ("landmarks" or
+            "skin_patch"); results stream back per image, in order, as the
+            pool finishes them. Several clients can share the pool.
+ - status / stop: ask a running service for its counters or to shut down.
+
+The extractors use it as an optional backend:
+    python scripts/worker_service.py serve --workers 2 &
+    python scripts/extract_landmarks.py --files @changed.txt --service
+    python scripts/extract_skin_patches.py --files @changed.txt --service
+
+Results are the same FrameResult tuples frame_ring.imap_frames() yields, so
+the scripts handle both backends with one code path. Writing JSON/CSV/patches
+stays in the calling script.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import secrets
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+import cv2
+
+from frame_ring import FrameResult
+
+ROOT = Path(__file__).resolve().parent.parent
+STATE_DIR = ROOT / ".pipeline"
+SOCKET_PATH = STATE_DIR / "worker.sock"
+KEY_FILE = STATE_DIR / "worker.key"
+TCP_ADDRESS = ("127.0.0.1", 6070)
+
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+CHUNKSIZE = 2
+JOBS = ("landmarks", "skin_patch")
+
+
+def default_address():
+    """Unix socket where supported, localhost TCP otherwise (Windows)."""
+    return str(SOCKET_PATH) if hasattr(os, "fork") else TCP_ADDRESS
+
+
+def parse_address(text):
+    """'HOST:PORT' -> (host, port); anything else is a socket path."""
+    if not text:
+        return default_address()
+    host, sep, port = str(text).rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return str(text)
+
+
+# -----------------------------
+# Pool workers
+# -----------------------------
+def _warm(jobs):
+    """Pool initializer: load the requested models once per worker process."""
+    cv2.setNumThreads(1)
+    if "landmarks" in jobs:
+        import extract_landmarks
+        extract_landmarks.get_pose()
+    if "skin_patch" in jobs:
+        import extract_skin_patches
+        extract_skin_patches.get_cascades()
+
+
+def _run_job(args):
+    """One image through one job; returns (status, value, decode_s, infer_s)."""
+    job, path = args
+    t = time.perf_counter()
+    img = cv2.imread(path)
+    decode_s = time.perf_counter() - t
+    if img is None:
+        return "unreadable", None, decode_s, 0.0
+    t = time.perf_counter()
+    try:
+        if job == "landmarks":
+            import extract_landmarks
+            value = extract_landmarks.detect_frame(img)
+        else:
+            import extract_skin_patches
+            value = extract_skin_patches.patch_from_frame(img, path)
+        return "ok", value, decode_s, time.perf_counter() - t
+    except Exception:
+        return "error", traceback.format_exc(), decode_s, time.perf_counter() - t
+
+
+# -----------------------------
+# Service
+# -----------------------------
+class WorkerService:
+    """Listener + warm pool; one thread per client connection."""
+
+    def __init__(self, address, workers=WORKERS, warm=JOBS):
+        self.address = address
+        self.workers = workers
+        self.warm = tuple(warm)
+        self.started = time.time()
+        self.counters = {"batches": 0, "images": 0, "errors": 0}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def serve(self):
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        authkey = secrets.token_bytes(32)
+        KEY_FILE.write_bytes(authkey)
+        os.chmod(KEY_FILE, 0o600)
+        if isinstance(self.address, str) and Path(self.address).exists():
+            Path(self.address).unlink()          # stale socket from a killed service
+
+        with mp.Pool(self.workers, initializer=_warm, initargs=(self.warm,)) as pool, \
+                Listener(self.address, authkey=authkey) as listener:
+            self.pool = pool
+            print(f"worker service: {self.workers} workers ({', '.join(self.warm) or 'lazy'}) "
+                  f"on {self.address}", flush=True)
+            while not self.stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError):
+                    continue                      # failed handshake (wrong key) or interrupted
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        if isinstance(self.address, str):
+            Path(self.address).unlink(missing_ok=True)
+        KEY_FILE.unlink(missing_ok=True)
+
+    def handle(self, conn):
+        with conn:
+            try:
+                while True:
+                    msg = conn.recv()
+                    op = msg.get("op")
+                    if op == "map":
+                        self.run_batch(conn, msg["job"], msg["paths"])
+                    elif op == "status":
+                        conn.send(self.status())
+                    elif op == "stop":
+                        conn.send({"stopping": True})
+                        self.stop()
+                        return
+                    else:
+                        conn.send({"error": f"unknown op {op!r}"})
+            except (EOFError, OSError):
+                return                            # client went away
+
+    def run_batch(self, conn, job, paths):
+        if job not in JOBS:
+            conn.send(("error", f"unknown job {job!r}"))
+            return
+        with self.lock:
+            self.counters["batches"] += 1
+        results = self.pool.imap(_run_job, ((job, p) for p in paths), chunksize=CHUNKSIZE)
+        for idx, (status, value, decode_s, infer_s) in enumerate(results):
+            conn.send(("result", idx, status, value, decode_s, infer_s))
+            with self.lock:
+                self.counters["images"] += 1
+                self.counters["errors"] += status == "error"
+        conn.send(("done", len(paths)))
+
+    def status(self):
+        with self.lock:
+            return {"address": str(self.address), "workers": self.workers, "warm": list(self.warm),
+                    "uptime_s": round(time.time() - self.started, 1), **self.counters}
+
+    def stop(self):
+        self.stopping.set()
+        try:                                      # wake the accept() loop
+            Client(self.address, authkey=KEY_FILE.read_bytes()).close()
+        except OSError:
+            pass
+
+
+# -----------------------------
+# Client
+# -----------------------------
+class ServiceClient:
+    """Connection to a running worker service."""
+
+    def __init__(self, address=None):
+        self.address = parse_address(address)
+        if not KEY_FILE.exists():
+            raise ConnectionError(f"no worker service running (missing {KEY_FILE})")
+        try:
+            self.conn = Client(self.address, authkey=KEY_FILE.read_bytes())
+        except OSError as e:
+            raise ConnectionError(f"worker service not reachable at {self.address}: {e}") from e
+
+    def map(self, job, paths):
+        """Yield a FrameResult per path, in order, as the service finishes them."""
+        paths = list(paths)
+        if not paths:
+            return
+        self.conn.send({"op": "map", "job": job, "paths": [str(Path(p).resolve()) for p in paths]})
+        while True:
+            msg = self.conn.recv()
+            if msg[0] == "done":
+                return
+            if msg[0] == "error":
+                raise RuntimeError(msg[1])
+            _, idx, status, value, decode_s, infer_s = msg
+            yield FrameResult(idx, paths[idx], status, value, decode_s, infer_s)
+
+    def request(self, op):
+        self.conn.send({"op": op})
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_arguments(ap):
+    """Add --service to a script's argument parser."""
+    ap.add_argument("--service", nargs="?", const="", default=None, metavar="ADDRESS",
+                    help="run inference in a running worker_service.py (default address: "
+                         f"{SOCKET_PATH.relative_to(ROOT)} or HOST:PORT)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Warm-model worker service for landmark/skin-patch extraction.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    serve = sub.add_parser("serve", help="start the service in the foreground")
+    serve.add_argument("--workers", type=int, default=WORKERS)
+    serve.add_argument("--warm", nargs="*", choices=JOBS, default=list(JOBS),
+                       help="models to load at start-up (others load on first use)")
+    for name in ("serve", "status", "stop"):
+        p = serve if name == "serve" else sub.add_parser(name, help=f"{name} a running service")
+        p.add_argument("--address", default=None, help="socket path or HOST:PORT")
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        WorkerService(parse_address(args.address), args.workers, args.warm).serve()
+        return
+    try:
+        with ServiceClient(args.address) as client:
+            print(client.request(args.cmd))
+    except ConnectionError as e:
+        sys.exit(f"[ERR] {e}")
+
+
+if __name__ == "__main__":
+    main()